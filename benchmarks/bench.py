@@ -0,0 +1,198 @@
+"""
+Micro-benchmarks of the hot paths of the GA, e.g.:
+
+    python -m benchmarks.bench --output bench.json
+    python -m benchmarks.bench --instances p01 --rounds 20 --compare bench.json
+
+By default runs on p01, the median-size and the largest instance of `data/input`. Results are written as JSON so two
+commits can be compared with `--compare`.
+"""
+from utils.distance import DistanceMatrix
+from utils import encoding as E
+from utils import split as S
+from utils import local_search as LS
+import utils.io as IO
+import utils.functional as F
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import numpy as np
+
+from typing import Callable, List
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def customer_count(instance: str) -> int:
+    """
+    Reads the number of `Customer`s from the header line of an instance
+    :param instance: Name of the instance, e.g. 'p01'
+    :return: An int number
+    """
+    with open(os.path.join(DATA, 'input', instance)) as file:
+        return int(file.readline().split()[2])
+
+
+def default_instances() -> List[str]:
+    """
+    Returns p01, the median-size and the largest instance of `data/input`
+    :return: A list of instance names
+    """
+    instances = sorted(os.listdir(os.path.join(DATA, 'input')), key=lambda name: (customer_count(name), name))
+    chosen = ['p01', instances[instances.__len__() // 2], instances[-1]]
+    return sorted(set(chosen), key=chosen.index)
+
+
+def measure(function: Callable, setup: Callable = None, rounds: int = 50) -> dict:
+    """
+    Times `rounds` calls of `function`, each one with fresh arguments returned by `setup` which is not timed
+    :param function: The function to be timed
+    :param setup: A function returning a tuple of arguments of `function`, if None, no arguments
+    :param rounds: Number of timed calls
+    :return: A dict of min, median and mean seconds per call
+    """
+    timings = []
+    for _ in range(rounds):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return {'rounds': rounds, 'min': min(timings), 'median': statistics.median(timings),
+            'mean': statistics.mean(timings)}
+
+
+def cold(chromosome):
+    """
+    Drops all cached values of a `Chromosome` so it gets evaluated from scratch
+    """
+    chromosome.fitness_cache = None
+    for d in chromosome:
+        d.route_lengths = None
+        d.route_loads = None
+    return chromosome,
+
+
+def benchmarks(instance: str, population_size: int = 10, seed: int = 0) -> dict:
+    """
+    Builds the benchmarked cases of an instance
+    :param instance: Name of the instance, e.g. 'p01'
+    :param population_size: Size of the `Population` used by population-level benchmarks
+    :param seed: The seed of the module level `random` the operators draw from
+    :return: A dict of benchmark name to a tuple of (function, setup)
+    """
+    random.seed(seed)
+    depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', instance),
+                                              os.path.join(DATA, 'result', instance + '.res'))
+    distances = DistanceMatrix(depots + customers, depots=depots.__len__())
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    population = F.generate_initial_population(sample, population_size)
+    population.fitness_values()
+    chromosome = population[0]
+    route = F.extract_random_route(chromosome.clone(), True)[0][:-1] or [customers[0]]
+
+    return {
+        'euclidean_distance': (lambda: F.euclidean_distance(customers[0], customers[-1]), None),
+        'distance_matrix': (lambda: DistanceMatrix(depots + customers, depots=depots.__len__()), None),
+        'fitness_value': (lambda ch: ch.fitness_value(), lambda: cold(chromosome.clone())),
+        'fitness_value_cached': (lambda: chromosome.fitness_value(), None),
+        'population_fitness_values': (lambda p: p.fitness_values(),
+                                      lambda: (population.__class__(0, [cold(ch)[0] for ch in population.get_all()]),)),
+        'insert_customer': (lambda ch: [F.insert_customer(c, ch) for c in route], lambda: (chromosome.clone(),)),
+        'insert_customer_granular': (lambda ch: [F.insert_customer(c, ch, granular=8) for c in route],
+                                     lambda: (chromosome.clone(),)),
+        'extract_random_route': (lambda ch: F.extract_random_route(ch, True), lambda: (chromosome.clone(),)),
+        'cross_over': (F.cross_over, lambda: (F.tournament(population, 0.8, population.len()),)),
+        'cross_over_granular': (lambda parents: F.cross_over(parents, 8),
+                                lambda: (F.tournament(population, 0.8, population.len()),)),
+        'split_encoded': (lambda e: S.split_encoded(e, distances), lambda: (E.encode(chromosome),)),
+        'educate': (lambda ch: LS.educate(ch, 100), lambda: (chromosome.clone(),)),
+        'tournament': (lambda: F.tournament(population, 0.8, population.len()), None),
+        'clone': (lambda: F.clone(chromosome), None),
+        'generate_new_population': (lambda: F.generate_new_population(population).fitness_values(), None),
+    }
+
+
+def run(instances: List[str] = None, rounds: int = 50, population_size: int = 10, names: List[str] = None) -> dict:
+    """
+    Runs all benchmarks on the given instances
+    :param instances: Names of the instances, if None, `default_instances`
+    :param rounds: Number of timed calls per benchmark
+    :param population_size: Size of the `Population` used by population-level benchmarks
+    :param names: Names of the benchmarks to run, if None, all of them
+    :return: A dict with the environment under 'meta' and a list of timings under 'results'
+    """
+    if instances is None:
+        instances = default_instances()
+    results = []
+    for instance in instances:
+        for name, (function, setup) in benchmarks(instance, population_size).items():
+            if names is None or name in names:
+                result = {'name': name, 'instance': instance, 'customers': customer_count(instance)}
+                result.update(measure(function, setup, rounds))
+                results.append(result)
+    return {'meta': meta(), 'results': results}
+
+
+def meta() -> dict:
+    """
+    Describes the environment of a run, so results of different commits and machines can be told apart
+    :return: A dict
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=DATA,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """
+    Compares the median timings of two runs
+    :param current: A dict returned by `run`
+    :param baseline: A dict returned by `run`, e.g. loaded from a previous JSON output
+    :return: A list of lines reporting the ratio current / baseline per benchmark
+    """
+    previous = dict([((r['name'], r['instance']), r['median']) for r in baseline['results']])
+    lines = []
+    for r in current['results']:
+        key = (r['name'], r['instance'])
+        if key in previous and previous[key] > 0:
+            lines.append('{:<28}{:<8}{:>12.6f}s{:>9.2f}x'.format(r['name'], r['instance'], r['median'],
+                                                                r['median'] / previous[key]))
+    return lines
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench', description='Benchmarks the GA hot paths.')
+    parser.add_argument('--instances', nargs='+', default=None, help='instance names, e.g. p01 pr10')
+    parser.add_argument('--benchmarks', nargs='+', default=None, help='benchmark names, by default all')
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--population-size', type=int, default=10)
+    parser.add_argument('--output', default=None, help='write the results to a JSON file')
+    parser.add_argument('--compare', default=None, help='a JSON file of a previous run to compare with')
+    args = parser.parse_args(argv)
+
+    current = run(args.instances, args.rounds, args.population_size, args.benchmarks)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            lines = compare(current, json.load(file))
+    else:
+        lines = ['{:<28}{:<8}{:>12.6f}s'.format(r['name'], r['instance'], r['median']) for r in current['results']]
+    print('\n'.join(lines))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,25 +1,31 @@
 from utils.chromosome import Chromosome
 from utils.depot import Depot
 from utils.customer import Customer
+from utils.distance import DistanceMatrix
+from utils.parallel import OffspringPool
 import utils.io as IO
 import utils.functional as F
 
 # Hyper-parameters
 POPULATION_SIZE = 10
 ITERATION = 100
+WORKERS = 1  # more than one produces offspring on a process pool
+SEED = None
 
-# Initialization
-depots, customers = IO.single_data_loader('data/input/p01', 'data/result/p01.res')
-sample = F.generate_chromosome_sample(depots, customers)
-population = F.generate_initial_population(sample, POPULATION_SIZE)
-for ch in population:
-    ch.fitness_value([1, 1])
-
-# Iteration
-for i in range(ITERATION):
-    new_population = F.generate_new_population(population)
-    for ch in new_population:
-        ch.fitness_value()
-    # describe population
+if __name__ == '__main__':
+    # Initialization
+    depots, customers = IO.single_data_loader('data/input/p01', 'data/result/p01.res')
+    distances = DistanceMatrix(depots + customers, depots=depots.__len__())
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    population = F.generate_initial_population(sample, POPULATION_SIZE)
+    population.fitness_values([1, 1])
+    pool = OffspringPool(depots + customers, distances, WORKERS, SEED) if WORKERS > 1 else None
 
+    # Iteration
+    for i in range(ITERATION):
+        population = F.generate_new_population(population, pool)
+        population.fitness_values()
+        # describe population
 
+    if pool is not None:
+        pool.close()
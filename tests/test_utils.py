@@ -1,10 +1,14 @@
 from typing import List
+from copy import deepcopy
 
 import pytest
 import numpy as np
 from scipy.spatial import distance
 import math
 import random
+import pickle
+import itertools
+import os
 
 from utils.population import Population
 from utils.customer import Customer
@@ -12,6 +16,22 @@ from utils.depot import Depot
 from utils.chromosome import Chromosome
 from utils import functional as F
 import utils.io as IO
+from utils.distance import DistanceMatrix
+from utils import encoding as E
+from utils.parallel import OffspringPool
+from utils.island import IslandModel, migration_targets
+from utils import runner
+from benchmarks import bench
+from utils import split as S
+from utils import local_search as LS
+from utils import kernels as K
+from utils.penalty import AdaptivePenalty
+from utils.shared import SharedProblem
+from utils import selection as SEL
+from utils.steady_state import SteadyState
+from utils.memo import FitnessMemo
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 
 
 @pytest.fixture
@@ -389,10 +409,15 @@ def test_extract_random_route(supply_chromosome):
         assert route[i].null == False
 
 
-def test_chromosome_to_file(supply_chromosome):
+def test_chromosome_to_file(supply_chromosome, tmp_path):
     for d in supply_chromosome:
         F.initial_routing(d)
-    IO.chromosome_to_file(supply_chromosome)
+    path = tmp_path / 'solution.txt'  # does not exist yet
+    IO.chromosome_to_file(supply_chromosome, str(path))
+    lines = path.read_text().splitlines()
+    assert lines[0].startswith(str(supply_chromosome.id))
+    assert lines.__len__() == 1 + sum([1 + d.len() for d in supply_chromosome])
+    assert not os.path.exists('chromosome.txt')
 
 
 def test_extract_route_from_depot(supply_depot):
@@ -506,3 +531,883 @@ def test_generate_initial_population(supply_chromosome):
         assert ch != supply_chromosome
     for i in range(population.len()):
         assert population[i].id == supply_chromosome.id and population[i].fitness == supply_chromosome.fitness
+
+
+def test_distance_matrix(supply_depot_batch, supply_customer_batch, tmp_path):
+    depots: List[Depot] = supply_depot_batch()
+    customers: List[Customer] = supply_customer_batch()
+    distances = DistanceMatrix(depots + customers)
+    assert distances.len() == depots.__len__() + customers.__len__()
+    assert depots[0].node_index == 0 and customers[0].node_index == depots.__len__()
+    for c in customers:
+        for d in depots:
+            assert distances.distance(c, d) == F.euclidean_distance(c, d)
+            assert F.distance(c, d, distances) == F.distance(c, d)
+
+    compact = DistanceMatrix(depots + customers, dtype=np.float32, path=str(tmp_path / 'matrix.npy'))
+    assert compact.matrix.dtype == np.float32
+    assert np.allclose(compact[:, :], distances[:, :], atol=1e-3)
+
+
+def test_fitness_value_distance_matrix(supply_depot_batch):
+    depots: List[Depot] = supply_depot_batch()
+    customers = []
+    for d in depots:
+        for c in d:
+            customers.append(c)
+        d.clear()
+    distances = DistanceMatrix(depots + customers)
+    chromosome = F.generate_chromosome_sample(depots, customers, distances=distances)
+    for d in chromosome:
+        if d.len() > 0:
+            F.initial_routing(d)
+    with_matrix = chromosome.fitness_value([1, 1])
+    chromosome.distances = None
+    assert math.isclose(with_matrix, chromosome.fitness_value([1, 1]))
+
+
+@pytest.fixture
+def supply_indexed_sample(supply_depot_batch):
+    depots: List[Depot] = supply_depot_batch()
+    customers = []
+    for d in depots:
+        for c in d:
+            customers.append(c)
+        d.clear()
+    distances = DistanceMatrix(depots + customers)
+    chromosome = F.generate_chromosome_sample(depots, customers, distances=distances)
+    return chromosome, depots + customers, distances
+
+
+@pytest.fixture
+def supply_indexed_chromosome(supply_indexed_sample):
+    chromosome, nodes, distances = supply_indexed_sample
+    F.initialize_routing(chromosome)
+    return chromosome, nodes, distances
+
+
+def test_encode_decode(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    encoded = E.encode(chromosome)
+    assert encoded.len() == chromosome.len()
+    assert encoded.tour.dtype == np.int32
+    assert encoded.tour.__len__() == sum([1 for d in chromosome for c in d if not c.null])
+    assert encoded.route_count() == sum([d.route_ending_index().__len__() for d in chromosome])
+
+    cloned = encoded.copy()
+    cloned.tour[:] = -1
+    assert (encoded.tour != -1).all()
+
+    decoded = E.decode(encoded, nodes, distances)
+    for d, dd in zip(chromosome, decoded):
+        assert d.node_index == dd.node_index
+        assert [c.id for c in d if not c.null] == [c.id for c in dd if not c.null]
+        assert d.route_ending_index() == dd.route_ending_index()
+    assert math.isclose(chromosome.fitness_value([1, 1]), decoded.fitness_value([1, 1]))
+
+
+def test_encode_decode_open_routes(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    F.randomize_customers(chromosome)
+    decoded = E.decode(E.encode(chromosome), nodes, distances)
+    for d, dd in zip(chromosome, decoded):
+        assert [(c.id, c.null) for c in d] == [(c.id, c.null) for c in dd]
+        assert d.route_ending_index() == dd.route_ending_index()
+
+
+def recomputed_fitness(chromosome: Chromosome, weight=None) -> float:
+    fresh = deepcopy(chromosome)
+    fresh.fitness_cache = None
+    for d in fresh:
+        d.route_lengths = None
+        d.route_loads = None
+    return fresh.fitness_value(weight)
+
+
+def test_population_fitness_values(supply_indexed_sample):
+    chromosome, nodes, distances = supply_indexed_sample
+    population = F.generate_initial_population(chromosome, 5)  # shuffled, so depots have open routes
+    fitness = population.fitness_values([1, 1])
+    assert fitness.__len__() == population.len()
+    for ch, f in zip(population, fitness):
+        assert ch.fitness == f
+        assert math.isclose(f, recomputed_fitness(ch, [1, 1]))
+
+    # nodes out of the `DistanceMatrix` fall back to scalar evaluation
+    population[0][0].add(Customer(10101010, 50, 50, 5, False))
+    population[0][0].add(Customer(999, population[0][0].x, population[0][0].y, 0, True))
+    fitness = population.fitness_values([1, 1])
+    assert math.isclose(fitness[0], recomputed_fitness(population[0], [1, 1]))
+
+
+def test_fitness_cache(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    fitness = chromosome.fitness_value([1, 1])
+    info = Chromosome.cache_info()
+    assert chromosome.fitness_value([1, 1]) == fitness
+    assert Chromosome.cache_info()['hits'] == info['hits'] + 1
+    assert Chromosome.cache_info()['misses'] == info['misses']
+
+    # clones share the cache until they are modified
+    cloned = F.clone(chromosome)
+    assert cloned.cached_fitness([1, 1]) == fitness
+    depot = cloned[0]
+    depot.add(Customer(10101010, 50, 50, 50, False))
+    depot.add(Customer(999, depot.x, depot.y, 0, True))
+    assert cloned.cached_fitness([1, 1]) is None
+    assert chromosome.cached_fitness([1, 1]) == fitness
+    assert cloned.fitness_value([1, 1]) > fitness
+
+    # batch evaluation only re-scores dirty individuals
+    population = Population(0, [chromosome, cloned])
+    info = Chromosome.cache_info()
+    population.fitness_values([1, 1])
+    assert Chromosome.cache_info()['hits'] == info['hits'] + 2
+
+    # other weights or another `DistanceMatrix` are not answered from cache
+    chromosome.fitness_value([2, 2])
+    assert Chromosome.cache_info()['misses'] == info['misses'] + 1
+    chromosome.distances = DistanceMatrix(nodes)
+    assert chromosome.cached_fitness([2, 2]) is None
+
+
+def test_depot_incremental_route_stats(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    depot = max(chromosome, key=lambda d: d.len())
+    depot.route_stats(distances)
+    for step in range(30):
+        if random.random() < 0.5 and depot.len() > 1:
+            depot.remove_at(random.randint(0, depot.len() - 1))
+        else:
+            null = random.random() < 0.3
+            depot.insert(random.randint(0, depot.len()), Customer(step, random.randint(0, 100),
+                                                                   random.randint(0, 100), 5, null))
+        assert depot.route_ending_index() == [i for i, c in enumerate(depot) if c.null]
+        lengths, loads = depot.route_stats(distances)
+        expected = deepcopy(depot)
+        expected.route_lengths = None
+        expected_lengths, expected_loads = expected.route_stats(distances)
+        assert np.allclose(lengths, expected_lengths) and np.allclose(loads, expected_loads)
+
+    depot.add(Customer(-1, depot.x, depot.y, 0, True))
+    for index in range(depot.route_start(0), depot.route_ending_index()[0] + 1):
+        customer = Customer(-5, 50, 50, 5, False)
+        before = depot.route_stats(distances)[0][0]
+        cost = depot.insertion_cost(customer, index)
+        depot.insert(index, customer)
+        assert math.isclose(depot.route_stats(distances)[0][0], before + cost, abs_tol=1e-9)
+        depot.remove_at(index)
+
+
+def test_copy_on_write_clone(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    fitness = chromosome.fitness_value([1, 1])
+    cloned = chromosome.clone()
+    assert cloned != chromosome and cloned.len() == chromosome.len()
+    for d, cd in zip(chromosome, cloned):
+        assert d != cd and d.depot_customers is cd.depot_customers
+
+    depot = max(cloned, key=lambda d: d.len())
+    original = chromosome[cloned.index(depot)]
+    ids = [c.id for c in original]
+    depot.remove_at(0)
+    assert depot.depot_customers is not original.depot_customers
+    assert [c.id for c in original] == ids
+    assert depot[0] is original[1]
+    assert chromosome.fitness_value([1, 1]) == fitness
+
+
+def test_offspring_pool(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    population = Population(0, [F.clone(chromosome) for _ in range(6)])
+    for ch in population:
+        F.randomize_customers(ch)
+        F.initialize_routing(ch)
+    results = []
+    for _ in range(2):
+        with OffspringPool(nodes, distances, workers=2, seed=7) as pool:
+            new_population = F.generate_new_population(population, pool)
+        assert new_population.len() == population.len()
+        for ch in new_population:
+            assert math.isclose(ch.fitness, recomputed_fitness(ch))
+        results.append([E.encode(ch).tour.tolist() for ch in new_population])
+    assert results[0] == results[1]
+    with OffspringPool(nodes, distances, workers=2, seed=7) as pool:
+        evolved = pool.evolve(population, 3)
+    assert evolved.len() == population.len()
+    for ch in evolved:
+        assert math.isclose(ch.fitness, recomputed_fitness(ch))
+
+
+def test_pack_unpack(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    encoded = [E.encode(chromosome), E.encode(E.decode(E.encode(chromosome), nodes, distances))]
+    restored = E.unpack(E.pack(encoded))
+    assert restored.__len__() == 2
+    for e, r in zip(encoded, restored):
+        for field in ['tour', 'route_offsets', 'depot_offsets', 'depots', 'separators', 'closed']:
+            assert np.array_equal(getattr(e, field), getattr(r, field))
+        assert (e.id, e.capacity) == (r.id, r.capacity)
+    assert E.unpack(E.pack([])) == []
+
+
+def test_distance_matrix_pickle(supply_indexed_sample):
+    chromosome, nodes, distances = supply_indexed_sample
+    restored = pickle.loads(pickle.dumps(distances))
+    assert restored.rows == distances.rows
+    assert restored.distance(nodes[0], nodes[-1]) == distances.distance(nodes[0], nodes[-1])
+
+
+def test_generate_new_population_generations(supply_indexed_sample):
+    chromosome, nodes, distances = supply_indexed_sample
+    population = F.generate_initial_population(chromosome, 6)
+    for _ in range(30):
+        population = F.generate_new_population(population)
+        population.fitness_values()
+        assert population.len() == 6
+    for ch in population:
+        for d in ch:
+            assert d.route_ending_index() == [i for i, c in enumerate(d) if c.null]
+        assert math.isclose(ch.fitness, recomputed_fitness(ch))
+
+
+def test_island_model(supply_indexed_sample):
+    chromosome, nodes, distances = supply_indexed_sample
+    for topology in ['ring', 'random']:
+        results = []
+        for _ in range(2):
+            model = IslandModel(nodes, distances, islands=3, population_size=4, interval=2, migrants=1,
+                                topology=topology, seed=3, timeout=120)
+            population = model.run(chromosome, 4)
+            assert population.len() == 3 * 4
+            for ch in population:
+                assert ch.len() == chromosome.len()
+                assert math.isclose(ch.fitness, recomputed_fitness(ch))
+            results.append([E.encode(ch).tour.tolist() for ch in population])
+        assert results[0] == results[1]
+    targets = migration_targets(5, 'random', np.random.SeedSequence(3), 1)
+    assert sorted(targets) == list(range(5)) and all([t != i for i, t in enumerate(targets)])
+
+
+def test_island_model_failure(supply_indexed_sample):
+    chromosome, nodes, distances = supply_indexed_sample
+    model = IslandModel(nodes, distances, islands=2, population_size=0, interval=1, seed=3, timeout=60)
+    with pytest.raises(Exception, match='failed'):
+        model.run(chromosome, 2)
+
+
+def test_runner(tmp_path):
+    p01, p02 = os.path.join(DATA, 'input', 'p01'), os.path.join(DATA, 'input', 'p02')
+    assert IO.best_known_cost(os.path.join(DATA, 'result', 'p01.res')) == 576.87
+    assert runner.result_path_of(p01) == os.path.abspath(os.path.join(DATA, 'result', 'p01.res'))
+    rows = runner.batch([p01, p02], [0, 1], population_size=4, generations=2, jobs=2)
+    assert [(row['instance'], row['seed']) for row in rows] == [('p01', 0), ('p01', 1), ('p02', 0), ('p02', 1)]
+    assert all([row['generations_run'] == 2 for row in rows])
+    assert rows[0]['best_cost'] == runner.batch([p01], [0], 4, 2, 1)[0]['best_cost']
+    for row in rows:
+        assert math.isclose(row['gap'], 100 * (row['best_cost'] - row['best_known_cost']) / row['best_known_cost'])
+    output = tmp_path / 'summary.csv'
+    assert runner.main(['batch', p01, '--generations', '1', '--population-size', '4',
+                        '--jobs', '1', '--output', str(output)]) == 0
+    assert output.read_text().splitlines()[0] == ','.join(runner.FIELDS)
+
+
+def test_benchmarks():
+    results = bench.run(['p01'], rounds=1, population_size=4)
+    assert [r['name'] for r in results['results']] == list(bench.benchmarks('p01', 4).keys())
+    assert all([r['min'] >= 0 for r in results['results']])
+    assert bench.compare(results, results).__len__() == results['results'].__len__()
+    assert 'p01' in bench.default_instances()
+
+
+def test_spatial_index():
+    depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', 'p01'), os.path.join(DATA, 'result', 'p01.res'))
+    distances = DistanceMatrix(depots + customers, depots=depots.__len__(), neighbour_count=5)
+    spatial = distances.spatial
+    brute = np.argsort(distances.matrix[:, :depots.__len__()], axis=1, kind='stable')
+    rows = np.arange(depots.__len__(), distances.len())[:, None]
+    for k in [1, 2]:
+        found = spatial.k_nearest_depots(customers, k)
+        assert np.allclose(distances.matrix[rows, found], distances.matrix[rows, brute[depots.__len__():, :k]])
+    assert spatial.nearest_depot(customers).shape == (customers.__len__(),)
+    assert spatial.depot_order == brute.tolist()
+    nearest = spatial.k_nearest_customers(customers[:3], 4)
+    for c, row in zip(customers[:3], nearest):
+        expected = sorted(distances.matrix[c.node_index, depots.__len__():])[:4]
+        assert np.allclose(distances.matrix[c.node_index, row], expected)
+    assert all([c.node_index not in spatial.neighbours[c.node_index] for c in customers])
+    assert all([row.__len__() == 5 for row in spatial.neighbours])
+    assert pickle.loads(pickle.dumps(distances)).spatial.depot_order == spatial.depot_order
+
+    indexed = F.generate_chromosome_sample(deepcopy(depots), customers, distances=distances)
+    plain = F.generate_chromosome_sample(deepcopy(depots), customers)
+    assert [[c.id for c in d] for d in indexed] == [[c.id for c in d] for d in plain]
+
+    F.initialize_routing(indexed)
+    customer = indexed[0][0]
+    indexed[0].remove_at(0)
+    depot_index, _ = F.insert_customer(customer, indexed, candidates=3)
+    assert depot_index in spatial.candidate_depots(customer.node_index, 3)
+    assert indexed[depot_index].contains(customer)
+
+
+def test_granular_insert_customer():
+    depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', 'p01'), os.path.join(DATA, 'result', 'p01.res'))
+    distances = DistanceMatrix(depots + customers, depots=depots.__len__(), neighbour_count=customers.__len__())
+    chromosome = F.generate_chromosome_sample(depots, customers, distances=distances)
+    F.initialize_routing(chromosome)
+    depot = chromosome[0]
+    assert depot.positions() == dict([(c.node_index, i) for i, c in enumerate(depot) if not c.null])
+    for k in [1, 4, customers.__len__()]:
+        for customer in customers[:10]:
+            exhaustive, granular = chromosome.clone(), chromosome.clone()
+            for ch in [exhaustive, granular]:
+                for d in ch:
+                    if d.contains(customer):
+                        d.remove(customer)
+            before = granular.total_distance()
+            depot_index, index = F.insert_customer(customer, granular, granular=k)
+            F.insert_customer(customer, exhaustive)
+            assert granular[depot_index][index] is customer
+            assert granular.total_distance() >= before
+            if k == customers.__len__():  # all positions next to a customer, same as the exhaustive search
+                assert [[c.id for c in d] for d in granular] == [[c.id for c in d] for d in exhaustive]
+            for d in granular:
+                assert d.route_ending_index() == [i for i, c in enumerate(d) if c.null]
+                assert math.isclose(sum(d.route_stats(distances)[0]), sum(deepcopy(d).route_stats(None)[0]))
+
+
+def test_split(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    F.randomize_customers(chromosome)
+
+    def cost(tour, depot, breaks):
+        total, start = 0.0, 0
+        for end in breaks:
+            route = [depot] + list(tour[start: end]) + [depot]
+            total += sum([distances.matrix[route[i - 1], route[i]] for i in range(1, route.__len__())])
+            start = end
+        return total
+
+    for depot in chromosome:
+        tour = np.array([c.node_index for c in depot if not c.null][:9], dtype=np.int64)
+        for capacity in [depot.capacity, 1e9, max(distances.demands[tour]) if tour.__len__() > 0 else 1]:
+            breaks = S.split(tour, depot.node_index, distances, capacity)
+            assert breaks[-1] == tour.__len__() if tour.__len__() > 0 else breaks.__len__() == 0
+            best = min([cost(tour, depot.node_index, [e for e, b in zip(range(1, tour.__len__() + 1), mask) if b] +
+                             [tour.__len__()])
+                        for mask in itertools.product([False, True], repeat=max(tour.__len__() - 1, 0))
+                        if all([sum(distances.demands[part]) <= capacity or part.__len__() == 1
+                                for part in np.split(tour, [e for e, b in zip(range(1, tour.__len__()), mask) if b])])])
+            assert math.isclose(cost(tour, depot.node_index, breaks), best)
+
+    encoded = S.split_encoded(E.encode(chromosome), distances)
+    assert encoded.closed.all() and np.array_equal(encoded.tour, E.encode(chromosome).tour)
+    for depot in chromosome:
+        S.split_routing(depot, distances)
+        assert depot.route_ending_index() == [i for i, c in enumerate(depot) if c.null]
+        for i, load in enumerate(depot.route_stats(distances)[1]):  # a customer over capacity gets its own route
+            assert load <= depot.capacity or depot.routes_ending_indices[i] - depot.route_start(i) == 1
+    assert np.array_equal(E.encode(chromosome).route_offsets, encoded.route_offsets)
+    assert math.isclose(E.batch_fitness([encoded], distances)[0], recomputed_fitness(chromosome))
+
+
+def test_local_search(supply_indexed_chromosome):
+    chromosome, nodes, distances = supply_indexed_chromosome
+    F.randomize_customers(chromosome)
+    customers = sorted([c.id for d in chromosome for c in d if not c.null])
+
+    def overloaded(ch):
+        return sum([1 for d in ch for load in d.route_stats(distances)[1] if load > d.capacity])
+
+    for operators in [['relocate'], ['swap'], ['2-opt'], ['or-opt'], None]:
+        ch = chromosome.clone()
+        before, violations = ch.total_distance(), overloaded(ch)
+        moves = LS.educate(ch, 500, operators=operators)
+        assert ch.total_distance() <= before + 1e-9
+        assert moves == 0 or ch.total_distance() < before
+        assert overloaded(ch) <= violations
+        assert sorted([c.id for d in ch for c in d if not c.null]) == customers
+        for d in ch:
+            assert d.route_ending_index() == [i for i, c in enumerate(d) if c.null]
+        assert math.isclose(ch.fitness_value(), recomputed_fitness(ch))
+    assert LS.educate(chromosome.clone(), 0) == 0
+    with pytest.raises(Exception):
+        LS.educate(Chromosome(0, 10, -1, []))
+
+
+@pytest.mark.parametrize('instance', ['p01', 'p12', 'pr01'])
+def test_kernels_parity(instance, monkeypatch):
+    # the array path runs the kernels as plain Python functions if Numba is not installed
+    results = []
+    for backend in ['python', 'numba']:
+        monkeypatch.setattr(K, 'BACKEND', backend)
+        random.seed(3)
+        depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', instance),
+                                                  os.path.join(DATA, 'result', instance + '.res'))
+        distances = DistanceMatrix(depots + customers, depots=depots.__len__())
+        sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+        population = F.generate_initial_population(sample, 4)
+        for _ in range(5):
+            population = F.generate_new_population(population)
+        encoded = [E.encode(ch) for ch in population]
+        results.append((encoded, E.batch_fitness(encoded, distances), population.fitness_values()))
+    (first, first_batch, first_values), (second, second_batch, second_values) = results
+    assert [e.tour.tolist() for e in first] == [e.tour.tolist() for e in second]
+    assert [e.route_offsets.tolist() for e in first] == [e.route_offsets.tolist() for e in second]
+    assert np.allclose(first_batch, second_batch) and np.allclose(first_values, second_values)
+
+
+def test_compiled_kernels():
+    pytest.importorskip('numba')
+    rng = np.random.default_rng(0)
+    matrix = rng.random((20, 20))
+    tour = rng.permutation(np.arange(4, 20))
+    starts, ends, depots = np.array([0, 5, 9]), np.array([5, 9, 16]), np.array([0, 1, 1])
+    assert np.allclose(K.route_lengths(tour, starts, ends, depots, matrix),
+                       K.route_lengths.py_func(tour, starts, ends, depots, matrix))
+    nodes = np.array([5, 6, 0, 7, 8, 9, 0])
+    for max_duration in [0.0, 3.5]:
+        args = (nodes, np.array([2, 6]), np.array([1.0, 2.0]), np.array([3.0, 4.0]), np.array([0.5, 0.2]), 0, 12,
+                2.0, 0.1, 6.0, max_duration, matrix)
+        assert K.insertion_scan(*args) == K.insertion_scan.py_func(*args)
+        demands, services = rng.random(16) * 10, rng.random(16)
+        args = (tour, demands, services, 20.0, 0, max_duration, matrix)
+        assert np.array_equal(K.greedy_breaks(*args), K.greedy_breaks.py_func(*args))
+
+
+def test_duration_and_service():
+    depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', 'pr01'),
+                                              os.path.join(DATA, 'result', 'pr01.res'))
+    assert [d.max_duration for d in depots] == [500.0] * 4 and depots[0].capacity == 200.0
+    assert (customers[0].service, customers[0].cost) == (2.0, 12.0)
+    assert IO.single_data_loader(os.path.join(DATA, 'input', 'p01'),
+                                 os.path.join(DATA, 'result', 'p01.res'))[0][0].max_duration == 0
+    distances = DistanceMatrix(depots + customers, depots=depots.__len__())
+    assert distances.services[depots.__len__()] == 2.0
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    for d in sample:
+        d.max_duration = 120.0  # tight enough to cut routes before the capacity does
+        d.max_vehicles = 0  # so no insertion falls back to a penalized position
+
+    def violations(ch):
+        count = 0
+        for d in ch:
+            lengths, loads = d.route_stats(ch.distances)
+            for i in range(lengths.__len__()):
+                if lengths[i] + d.route_services[i] > d.max_duration and \
+                        d.routes_ending_indices[i] - d.route_start(i) > 1:
+                    count += 1
+        return count
+
+    chromosome = F.clone(sample)
+    F.initialize_routing(chromosome)
+    assert violations(chromosome) == 0
+    assert chromosome[0].route_ending_index().__len__() > sum([c.cost for c in chromosome[0]]) / 200.0 + 1
+    for d in chromosome:
+        assert math.isclose(sum(d.route_services), sum([c.service for c in d]))
+
+    route = F.extract_random_route(chromosome, True)[0][:-1]
+    for c in route:
+        F.insert_customer(c, chromosome)
+    assert violations(chromosome) == 0
+    LS.educate(chromosome, 1000)
+    assert violations(chromosome) == 0
+    for d in chromosome:
+        S.split_routing(d, distances)
+    assert violations(chromosome) == 0
+
+
+def test_vehicle_limits_and_penalty():
+    depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', 'p01'),
+                                              os.path.join(DATA, 'result', 'p01.res'))
+    assert [d.max_vehicles for d in depots] == [4] * 4
+    distances = DistanceMatrix(depots + customers, depots=depots.__len__())
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    chromosome = F.clone(sample)
+    F.initialize_routing(chromosome)
+    assert chromosome.violations()[:2] == (0.0, 0.0)
+
+    depot = chromosome[0]
+    lengths, loads = depot.route_stats(distances)
+    depot.max_vehicles = lengths.__len__() - 1
+    assert depot.violations(distances)[2] == 1 and not chromosome.feasible()
+    depot.max_vehicles = lengths.__len__()
+    assert depot.violations(distances)[2] == 0
+
+    # the fleet is exhausted and no route has room left, so the customer is inserted at a penalized position
+    for d in chromosome:
+        d.max_vehicles = d.routes_ending_indices.__len__()
+    customer = Customer(999, depot.x + 1, depot.y + 1, depot.capacity, False)
+    routes = [d.routes_ending_indices.__len__() for d in chromosome]
+    depot_index, index = F.insert_customer(customer, chromosome)
+    assert [d.routes_ending_indices.__len__() for d in chromosome] == routes
+    assert chromosome[depot_index][index] is customer
+    load, duration, fleet = chromosome.violations()
+    assert load > 0 and duration == 0 and fleet == 0
+
+    # violations are maintained per route and only recomputed after a modification
+    route_idx = chromosome[depot_index].route_of(index)
+    assert chromosome[depot_index].route_violation(route_idx)[0] == load == \
+        chromosome[depot_index].route_stats(distances)[1][route_idx] - depot.capacity
+    chromosome[depot_index].remove_at(index)
+    assert chromosome.violations() == (0.0, 0.0, 0)
+
+    # the penalized fitness adds the weighted violations, cached per penalty weights
+    chromosome[depot_index].insert(index, customer)
+    plain = chromosome.fitness_value()
+    penalized = chromosome.fitness_value(penalty=[10.0, 1.0, 100.0])
+    assert math.isclose(penalized, plain + 10.0 * load)
+    assert chromosome.cached_fitness([100, 0.001]) is None
+    assert chromosome.cached_fitness([100, 0.001], [10.0, 1.0, 100.0]) == penalized
+    population = Population(0, [chromosome, F.clone(sample)])
+    F.initialize_routing(population[1])
+    assert np.allclose(population.fitness_values(penalty=[10.0, 1.0, 100.0]),
+                       [penalized, population[1].fitness_value(penalty=[10.0, 1.0, 100.0])])
+
+    # weights grow while too few chromosomes are feasible and shrink when too many are
+    penalty = AdaptivePenalty(10.0, 1.0, 100.0, target=0.2)
+    assert penalty.feasible_shares(population) == [0.5, 1.0, 1.0]
+    assert penalty.update(population) == pytest.approx([10.0 * 0.85, 0.85, 85.0])
+    assert penalty.update(Population(0, [chromosome])) == pytest.approx([8.5 * 1.2, 0.85 * 0.85, 85.0 * 0.85])
+
+    random.seed(7)
+    population = F.generate_initial_population(sample, 6)
+    penalty = AdaptivePenalty()
+    for _ in range(3):
+        population = F.generate_new_population(population, penalty=penalty)
+    assert population.len() == 6
+    assert all([penalty.minimum <= w <= penalty.maximum for w in penalty.weights])
+
+
+def test_instance_cache(tmp_path):
+    source = os.path.join(DATA, 'input', 'pr01')
+    input_path = str(tmp_path / 'pr01')
+    with open(source) as file:
+        content = file.read()
+    with open(input_path, 'w') as file:
+        file.write(content)
+    arrays = IO.parse_instance(input_path)
+    assert arrays['header'].tolist() == [2, 1, 48, 4]
+    assert arrays['customers'].shape == (48, 5) and arrays['depots'].shape == (4, 3)
+    assert arrays['limits'].tolist() == [[500.0, 200.0]] * 4
+
+    cache_dir = str(tmp_path / 'cache')
+    cache_path = IO.cache_path_of(input_path, cache_dir)
+    assert not os.path.exists(cache_path)
+    first = IO.load_instance(input_path, cache_dir)
+    assert os.path.exists(cache_path)
+    cached = IO.load_instance(input_path, cache_dir, mmap=True)
+    assert isinstance(cached['customers'], np.memmap)
+    for name in arrays:
+        assert np.array_equal(first[name], arrays[name]) and np.array_equal(cached[name], arrays[name])
+    del cached
+
+    # a touched but unchanged file is recognized by its hash, a changed one is parsed again
+    os.utime(input_path, ns=(0, 0))
+    assert np.array_equal(IO.load_instance(input_path, cache_dir)['customers'], arrays['customers'])
+    assert IO.load_npz(cache_path)['key'].tolist() == list(IO.file_key(input_path))
+    with open(input_path, 'w') as file:
+        file.write(content.replace('500 200', '400 200', 1))
+    assert IO.load_instance(input_path, cache_dir)['limits'][0].tolist() == [400.0, 200.0]
+    assert IO.load_instance(input_path, cache_dir, mmap=True)['limits'][0].tolist() == [400.0, 200.0]
+
+    depots, customers = IO.single_data_loader(source, os.path.join(DATA, 'result', 'pr01.res'), cache_dir, True)
+    assert (customers[0].id, customers[0].service, customers[0].cost) == (1, 2.0, 12.0)
+    assert [(d.id, d.max_duration, d.capacity, d.max_vehicles) for d in depots][0] == (49, 500.0, 200.0, 1)
+
+
+@pytest.mark.parametrize('instance', ['p01', 'pr01'])
+def test_result_loader(instance):
+    result_path = os.path.join(DATA, 'result', instance + '.res')
+    depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', instance), result_path)
+    distances = DistanceMatrix(depots + customers, depots=depots.__len__())
+    cost, encoded = IO.result_loader(result_path, depots, customers)
+    assert cost == IO.best_known_cost(result_path) and encoded.fitness == cost
+    assert sorted(encoded.tour.tolist()) == [c.node_index for c in customers]
+    best = E.decode(encoded, depots + customers, distances)
+    assert best.feasible() and best.unrouted() == 0
+    assert abs(IO.gap(best, cost)) < 0.01
+    assert IO.gap(cost * 1.1, cost) == pytest.approx(10.0)
+
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    population = F.generate_initial_population(sample, 4)
+    for ch in population:
+        for d in ch:  # close the open routes left by shuffling
+            if d.len() > 0 and not d[-1].null:
+                d.add(Customer(999, d.x, d.y, 0, True, d.node_index))
+    worst = runner.best_cost(population)
+    assert worst > cost and not runner.target_reached(population, cost, IO.gap(worst, cost) / 2)
+    population.add(best)
+    assert runner.best_cost(population) == pytest.approx(cost, abs=0.01)
+    assert runner.target_reached(population, cost, 0.01)
+
+
+
+def test_population_file(tmp_path):
+    result_path = os.path.join(DATA, 'result', 'pr01.res')
+    depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', 'pr01'), result_path)
+    nodes = depots + customers
+    distances = DistanceMatrix(nodes, depots=depots.__len__())
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    population = F.generate_initial_population(sample, 5)
+    population.fitness_values()
+    path = str(tmp_path / 'population.bin')
+    IO.population_to_file(population, path)
+    for mmap in [False, True]:
+        loaded = IO.population_from_file(path, nodes, distances, mmap)
+        assert loaded.len() == population.len()
+        for ch, other in zip(population, loaded):
+            assert [[c.id for c in d] for d in ch] == [[c.id for c in d] for d in other]
+            assert other.fitness == ch.fitness and other.fitness_value() == pytest.approx(ch.fitness)
+    encoded = IO.population_from_file(path)
+    assert [e.fitness for e in encoded] == [ch.fitness for ch in population]
+    IO.population_to_file(encoded + [E.encode(population[0])], path)
+    assert IO.population_from_file(path).__len__() == population.len() + 1
+    IO.population_to_file([], path)
+    assert IO.population_from_file(path) == []
+
+    # the result format round trips through `result_loader`
+    cost, best = IO.result_loader(result_path, depots, customers)
+    best = E.decode(best, nodes, distances)
+    path = str(tmp_path / 'pr01.res')
+    IO.chromosome_to_res(best, path)
+    with open(path) as written, open(result_path) as expected:
+        assert [line.split()[:3] for line in written.read().splitlines()] == \
+            [line.split()[:3] for line in expected.read().splitlines() if line.strip() != '']
+    reloaded_cost, reloaded = IO.result_loader(path, depots, customers)
+    assert reloaded_cost == cost and np.array_equal(reloaded.tour, E.encode(best).tour)
+
+
+def test_depot_index_and_remove_range():
+    depots, customers = IO.single_data_loader(os.path.join(DATA, 'input', 'p01'),
+                                              os.path.join(DATA, 'result', 'p01.res'))
+    distances = DistanceMatrix(depots + customers, depots=depots.__len__())
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    F.initialize_routing(sample)
+    rng = random.Random(3)
+    for _ in range(30):
+        chromosome = sample.clone()
+        depot = chromosome[rng.randint(0, chromosome.len() - 1)]
+        depot.route_stats(distances)
+        expected = depot.copy()
+        start = rng.randint(0, depot.len())
+        end = rng.randint(start, depot.len() + 1)
+        removed = depot.remove_range(start, end)
+        del expected[start: end]
+        assert removed == sample[chromosome.index(depot)][start: end]
+        assert depot.copy() == expected
+        assert depot.routes_ending_indices == [i for i, c in enumerate(expected) if c.null]
+        lengths, loads = depot.route_stats(distances)
+        fresh = Depot(depot.id, depot.x, depot.y, depot.capacity, expected)
+        fresh.node_index = depot.node_index
+        assert np.allclose(lengths, fresh.route_stats(distances)[0]) and np.allclose(loads, fresh.route_stats()[1])
+        assert np.allclose(depot.route_services, fresh.route_services)
+
+    chromosome = sample.clone()
+    for k, depot in enumerate(chromosome):
+        assert depot.route_ending_index() is depot.routes_ending_indices
+        for i, c in enumerate(depot):
+            assert depot.contains(c) and depot.index(c) == i
+            if not c.null:
+                assert chromosome.locate(c) == (k, depot.route_of(i), i)
+    outsider = Customer(4242, 0, 0, 1)
+    assert not chromosome[0].contains(outsider) and chromosome.locate(outsider) == (-1, -1, -1)
+    with pytest.raises(ValueError):
+        chromosome[0].index(outsider)
+    c = chromosome[0][1]
+    assert chromosome[0].remove(c) and not chromosome[0].contains(c) and not chromosome[0].remove(c)
+    assert sample[0][1] is c  # the clone owns its lists after the removal
+
+    route, depot_index, _, _ = F.extract_random_route(chromosome, True)
+    assert all([chromosome.locate(c)[0] == -1 for c in route if not c.null])
+
+
+def test_shared_problem(tmp_path):
+    input_path = os.path.join(DATA, 'input', 'p01')
+    depots, customers = IO.single_data_loader(input_path, os.path.join(DATA, 'result', 'p01.res'))
+    nodes = depots + customers
+    distances = DistanceMatrix(nodes, depots=depots.__len__())
+    problem = SharedProblem.publish(nodes, distances, str(tmp_path / 'p01.problem'))
+    attached = pickle.loads(pickle.dumps(problem))
+    assert pickle.dumps(problem).__len__() < 1000
+    assert isinstance(attached.arrays['matrix'].base, np.memmap) and not attached.arrays['matrix'].flags.writeable
+    shared_nodes = attached.nodes()
+    assert [(n.id, n.x, n.y, n.node_index) for n in shared_nodes] == [(n.id, n.x, n.y, n.node_index) for n in nodes]
+    assert [(d.capacity, d.max_duration, d.max_vehicles) for d in shared_nodes[:depots.__len__()]] == \
+        [(d.capacity, d.max_duration, d.max_vehicles) for d in depots]
+    assert [(c.cost, c.service) for c in shared_nodes[depots.__len__():]] == [(c.cost, c.service) for c in customers]
+    shared = attached.distance_matrix()
+    assert np.array_equal(shared.matrix, distances.matrix) and shared.rows == distances.rows
+    assert shared.spatial.depot_order == distances.spatial.depot_order
+    assert shared.spatial.neighbours == distances.spatial.neighbours
+    assert np.array_equal(shared.spatial.k_nearest_customers(customers[:3], 4),
+                          distances.spatial.k_nearest_customers(customers[:3], 4))
+    assert attached.distance_matrix(rows=False).distance(nodes[0], nodes[-1]) == distances.distance(nodes[0], nodes[-1])
+
+    # published once per input, later loads attach to it
+    directory = str(tmp_path / 'problems')
+    loaded = SharedProblem.load(input_path, directory)
+    modified = os.path.getmtime(loaded.path)
+    assert SharedProblem.load(input_path, directory).path == loaded.path
+    assert os.path.getmtime(loaded.path) == modified and os.listdir(directory).__len__() == 2
+    assert np.array_equal(loaded.arrays['matrix'], distances.matrix)
+
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    population = F.generate_initial_population(sample, 4)
+    with OffspringPool(nodes, distances, workers=2, seed=1) as pool:
+        evolved = pool.evolve(population, 2)
+    for ch in evolved:
+        assert math.isclose(ch.fitness, recomputed_fitness(ch))
+
+    p01 = runner.result_path_of(input_path)
+    assert runner.solve(input_path, p01, 4, 2, seed=5)['best_cost'] == \
+        runner.solve(input_path, p01, 4, 2, seed=5, cache_dir=directory)['best_cost']
+
+
+def test_selection(supply_indexed_sample):
+    rng = np.random.default_rng(3)
+    fitness = np.array([5.0, 1.0, 9.0, 3.0, 7.0, 2.0])
+    for method in SEL.METHODS:
+        indices = SEL.parent_indices(fitness, 40, rng, method)
+        assert indices.shape == (40, 2)
+        assert indices.min() >= 0 and indices.max() < fitness.__len__()
+    # the tournament over the whole population always wins the fittest
+    assert (SEL.tournament_indices(fitness, 10, rng, tournament_probability=1.0, size=6) == 2).all()
+    # without tournaments the pair is a random unique sample
+    pairs = SEL.tournament_indices(fitness, 50, rng, tournament_probability=0.0)
+    assert (pairs[:, 0] != pairs[:, 1]).all()
+    # with the maximum pressure the least fit is never drawn by rank
+    assert (SEL.rank_indices(fitness, 200, rng, pressure=2.0) != 1).all()
+    for method in ['rank', 'roulette']:
+        counts = np.bincount(SEL.parent_indices(fitness, 2000, rng, method).ravel(), minlength=fitness.__len__())
+        assert counts[2] > counts[4] > counts[0] > counts[1]
+    with pytest.raises(Exception):
+        SEL.parent_indices(fitness, 1, rng, 'unknown')
+
+    chromosome, nodes, distances = supply_indexed_sample
+    population = F.generate_initial_population(chromosome, 6)
+    pairs = list(SEL.parents(population, np.array([[0, 1], [2, 2]])))
+    assert pairs[1][0] is not population[2] and pairs[1][0] is not pairs[1][1]
+    assert E.encode(pairs[1][0]).tour.tolist() == E.encode(population[2]).tour.tolist()
+    for method in SEL.METHODS:
+        results = []
+        for _ in range(2):
+            random.seed(11)
+            evolved = F.generate_initial_population(chromosome, 6)
+            for _ in range(5):
+                fittest = evolved.fitness_values().max()
+                evolved = F.generate_new_population(evolved, selection=method)
+                assert evolved.len() == 6
+                assert evolved.fitness_values().max() >= fittest
+            results.append([E.encode(ch).tour.tolist() for ch in evolved])
+        assert results[0] == results[1]
+
+
+def test_steady_state(supply_indexed_sample):
+    chromosome, nodes, distances = supply_indexed_sample
+    random.seed(5)
+    population = F.generate_initial_population(chromosome, 8)
+    model = SteadyState(population)
+    buffer = population.chromosomes
+    fittest = model.fitness.max()
+    for _ in range(40):
+        worst = model.worst()
+        assert model.fitness[worst] == model.fitness.min()
+        model.step()
+        assert model.fitness.max() >= fittest
+        fittest = model.fitness.max()
+    assert model.steps == 40 and model.replacements > 0
+    assert population.chromosomes is buffer and population.len() == 8
+    assert model.fittest() == int(np.argmax(population.fitness_values()))
+    for ch, value in zip(population, model.fitness):
+        assert math.isclose(ch.fitness_value(), value) and math.isclose(value, recomputed_fitness(ch))
+        for d in ch:
+            assert d.route_ending_index() == [i for i, c in enumerate(d) if c.null]
+    assert sorted(model.heap) == sorted([(value, i) for i, value in enumerate(model.fitness.tolist())])
+
+    p01 = os.path.join(DATA, 'input', 'p01')
+    row = runner.solve(p01, runner.result_path_of(p01), population_size=4, generations=2, seed=0, steady_state=True)
+    assert row['steady_state'] and row['generations_run'] == 2
+
+
+def reordered(encoded: E.EncodedChromosome) -> E.EncodedChromosome:
+    # reverses the order of the closed routes of each depot and the direction of each of them
+    tour, route_offsets, depot_offsets = [], [0], [0]
+    for k in range(encoded.len()):
+        routes = list(range(encoded.depot_offsets[k], encoded.depot_offsets[k + 1]))
+        closed = [r for r in routes if encoded.closed[r]][::-1]
+        for r in closed + [r for r in routes if not encoded.closed[r]]:
+            route = encoded.route(r).tolist()
+            tour += route[::-1] if encoded.closed[r] else route
+            route_offsets.append(tour.__len__())
+        depot_offsets.append(route_offsets.__len__() - 1)
+    closed = np.concatenate([np.sort(encoded.closed[encoded.depot_offsets[k]: encoded.depot_offsets[k + 1]])[::-1]
+                             for k in range(encoded.len())])
+    return E.EncodedChromosome(encoded.id, encoded.capacity, encoded.fitness, tour, route_offsets, depot_offsets,
+                               encoded.depots, closed=closed)
+
+
+def test_canonical_hash_and_memo(supply_indexed_sample):
+    chromosome, nodes, distances = supply_indexed_sample
+    random.seed(13)
+    population = F.generate_initial_population(chromosome, 6)
+    original = population[0]
+    encoded = E.encode(original)
+    assert encoded.route_count() > 2
+    variant = E.decode(reordered(encoded), nodes, distances)
+    assert E.encode(variant).tour.tolist() != encoded.tour.tolist()
+    assert E.canonical_hash(E.encode(variant)) == E.canonical_hash(encoded)
+    assert math.isclose(recomputed_fitness(variant), recomputed_fitness(original))
+    assert len(set([E.canonical_hash(E.encode(ch)) for ch in population])) == population.len()
+    moved = E.encode(original)
+    moved.tour[[0, -1]] = moved.tour[[-1, 0]]
+    assert E.canonical_hash(moved) != E.canonical_hash(encoded)
+
+    memo = FitnessMemo(2)
+    for key in ['a', 'b', 'c']:
+        memo.put(key, 1.0)
+    assert memo.len() == 2 and memo.evictions == 1 and memo.get('a') is None
+    assert memo.get('b') == 1.0
+    memo.put('d', 2.0)  # 'c' is the least recently used
+    assert memo.get('c') is None and memo.get('b') == 1.0
+    assert memo.info()['hits'] == 2 and memo.info()['misses'] == 2
+    with pytest.raises(Exception):
+        FitnessMemo(0)
+
+    memo = FitnessMemo(16)
+    copies = Population(0, [original.clone(), E.decode(reordered(encoded), nodes, distances)])
+    for ch in copies:
+        ch.fitness_cache = None
+    fitness = copies.fitness_values(memo=memo)
+    assert memo.hits == 1 and memo.len() == 1
+    assert math.isclose(fitness[1], fitness[0]) and math.isclose(fitness[0], recomputed_fitness(original))
+    fresh = E.decode(encoded, nodes, distances)
+    assert Population(0, [fresh]).fitness_values(memo=memo)[0] == fitness[0] and memo.hits == 2
+
+    rejecting = Population(0, [original, variant, population[1]], duplicates='reject')
+    assert rejecting.len() == 2 and rejecting.is_duplicate(variant)
+    assert not rejecting.add(E.decode(encoded, nodes, distances)) and rejecting.len() == 2
+    assert rejecting.add(variant, force=True) and rejecting.len() == 3
+    rejecting.remove(original)
+    rejecting.remove(variant)
+    assert not rejecting.is_duplicate(variant) and rejecting.add(variant)
+    penalizing = Population(0, [original, variant, population[1]], duplicates='penalize', duplicate_penalty=5.0)
+    assert penalizing.duplicate_mask().tolist() == [False, True, False]
+    fitness = penalizing.fitness_values()
+    assert math.isclose(fitness[1], fitness[0] + 5.0) and math.isclose(variant.fitness_value(), fitness[0])
+    with pytest.raises(Exception):
+        Population(0, duplicates='unknown')
+
+    for method in [None, 'rank']:
+        evolved = Population(0, population.chromosomes, duplicates='reject')
+        for _ in range(4):
+            evolved = F.generate_new_population(evolved, selection=method, memo=memo)
+            assert evolved.len() == 6 and evolved.duplicates == 'reject'
+    model = SteadyState(Population(0, population.get_all(), duplicates='reject'), memo=memo)
+    model.evolve(20)
+    assert len(set([E.canonical_hash(E.encode(ch)) for ch in model.population])) == 6
+    p01 = os.path.join(DATA, 'input', 'p01')
+    row = runner.solve(p01, runner.result_path_of(p01), population_size=4, generations=2, seed=0,
+                       duplicates='penalize', memo=64)
+    assert row['duplicates'] == 'penalize' and 0.0 <= row['memo_hit_rate'] <= 1.0
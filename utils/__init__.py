@@ -2,4 +2,6 @@ from utils import functional as F
 from utils.depot import Depot
 from utils.population import Population
 from utils.chromosome import Chromosome
-from utils.customer import Customer
\ No newline at end of file
+from utils.customer import Customer
+from utils.distance import DistanceMatrix
+from utils.encoding import EncodedChromosome
@@ -1,9 +1,7 @@
-from utils.customer import Customer
 from utils.depot import Depot
-from utils import functional as F
+from utils.distance import DistanceMatrix
 
 from typing import List
-from copy import deepcopy
 
 
 class Chromosome:
@@ -12,12 +10,17 @@ class Chromosome:
     The outer scope List is `Depot`s and the inner scope List is a List of `Customer` for each `Depot`
     """
 
-    def __init__(self, id: int, capacity: float, fitness: float = -1, chromosome: List[Depot] = None):
+    cache_hits = 0
+    cache_misses = 0
+
+    def __init__(self, id: int, capacity: float, fitness: float = -1, chromosome: List[Depot] = None,
+                 distances: DistanceMatrix = None):
         """
         A empty chromosome regarding provided number of `Depot`s and capacity.
         :param id: Unique int ID for demonstration purposes
         :param capacity: The capacity of the `Depot`s which is same for all `Depot`s in a `Chromosome`
         :param chromosome: The content of the chromosome which a List of `Depot`s
+        :param distances: A precomputed `DistanceMatrix` of the problem instance, if None, distances are computed
         """
         if chromosome is None:
             chromosome = []
@@ -28,32 +31,127 @@ class Chromosome:
         self.chromosome = chromosome
         self.size = self.chromosome.__len__()
         self.fitness = fitness
+        self.distances = distances
+        self.fitness_cache = None
 
-    def fitness_value(self, weight=None) -> float:
+    def fitness_value(self, weight=None, penalty=None) -> float:
         """
         The fitness value of the Chromosome will be calculated based on the defined criteria below:
         1. Calculate how many routes a `Chromosome` has aliased as route_count
         2. Calculate the distance in a route by summing up the distances between all members of route sequentially
-            using `euclidean_distance` function aliases as distance.
+            using `distance` function (looked up in `distances` matrix if available) aliases as distance.
         3. Fitness =  w1*route_count + w2*distance (The C# source code, uses [1, 1] weights.)
+        4. If `penalty` weights [p1, p2, p3] are given, the violations returned by `violations` are added:
+            Fitness += p1*excess_load + p2*excess_duration + p3*excess_routes
+
+        Note: The value is cached with the weights and the `version` of the `Depot`s, so the `Chromosome` is only
+            re-scored if one of its `Depot`s has been modified. Per-route values are cached by `Depot.route_stats`.
 
+        :param weight: A list of two weights [w1, w2]
+        :param penalty: A list of three penalty weights [p1, p2, p3], e.g. `AdaptivePenalty.weights`, or None
         :return: A float value regarding metric
         """
         if weight is None:
             weight = [100, 0.001]
+        cached = self.cached_fitness(weight, penalty)
+        if cached is not None:
+            Chromosome.cache_hits += 1
+            self.fitness = cached
+            return self.fitness
+        Chromosome.cache_misses += 1
         distance = 0
         route_count = 0
         for depot in self:
-            for route_idx in range(depot.route_ending_index().__len__()):
-                route, _, _ = F.extract_route_from_depot(depot, route_idx)
-                temp_depot = Customer(0, depot.x, depot.y, 0, False)
-                route.insert(0, temp_depot)
-                distance += sum([F.euclidean_distance(route[i - 1], route[i]) for i, _ in enumerate(route)])
-                route.remove(temp_depot)
-            route_count += depot.route_ending_index().__len__()
-        self.fitness = weight[0]*distance + weight[1]*route_count
+            lengths, _ = depot.route_stats(self.distances)
+            for length in lengths:
+                distance += length
+            route_count += lengths.__len__()
+        fitness = weight[0]*distance + weight[1]*route_count
+        if penalty is not None:
+            fitness += sum([p * v for p, v in zip(penalty, self.violations())])
+        self.cache_fitness(fitness, weight, penalty)
         return self.fitness
 
+    def violations(self) -> (float, float, int):
+        """
+        Sums the violations of the capacity, duration and fleet constraints over all `Depot`s using `Depot.violations`
+        :return: A tuple of (excess load, excess duration, number of routes over `max_vehicles`)
+        """
+        load, duration, fleet = 0.0, 0.0, 0
+        for depot in self:
+            depot_load, depot_duration, depot_fleet = depot.violations(self.distances)
+            load += depot_load
+            duration += depot_duration
+            fleet += depot_fleet
+        return load, duration, fleet
+
+    def feasible(self) -> bool:
+        """
+        Whether the `Chromosome` violates none of the capacity, duration and fleet constraints
+        :return: Bool true or false
+        """
+        return not any(self.violations())
+
+    def total_distance(self) -> float:
+        """
+        The traveled distance of the `Chromosome`, i.e. the sum of the lengths of all routes of all `Depot`s. This is
+        the cost reported in the result files of the instances.
+        :return: A float number
+        """
+        return sum([sum(depot.route_stats(self.distances)[0]) for depot in self])
+
+    def unrouted(self) -> int:
+        """
+        Number of `Customer`s after the last `null` `Customer` of their `Depot`, which are not part of any route and
+        therefore not counted by `fitness_value` and `total_distance`
+        :return: An int number
+        """
+        return sum([d.len() - (d.routes_ending_indices[-1] + 1 if d.routes_ending_indices.__len__() > 0 else 0)
+                    for d in self])
+
+    def cache_key(self, weight, penalty=None) -> tuple:
+        """
+        The state a fitness value is valid for: weights, penalty weights and `version` of each `Depot`.
+        Note: The `DistanceMatrix` is stored next to the key and compared by identity, see `cached_fitness`.
+        :param weight: A list of two weights [w1, w2]
+        :param penalty: A list of three penalty weights [p1, p2, p3] or None
+        :return: A tuple
+        """
+        return tuple(weight), None if penalty is None else tuple(penalty), tuple([d.version for d in self])
+
+    def cached_fitness(self, weight, penalty=None) -> float:
+        """
+        Returns the cached fitness value if it is still valid for the given weights, else None
+        :param weight: A list of two weights [w1, w2]
+        :param penalty: A list of three penalty weights [p1, p2, p3] or None
+        :return: A float number or None
+        """
+        if self.fitness_cache is not None and self.fitness_cache[1] is self.distances and \
+                self.fitness_cache[0] == self.cache_key(weight, penalty):
+            return self.fitness_cache[2]
+        return None
+
+    def cache_fitness(self, fitness: float, weight, penalty=None):
+        """
+        Stores a fitness value computed for the current state of the `Chromosome` (e.g. by batch evaluation)
+        :param fitness: The fitness value
+        :param weight: A list of two weights [w1, w2] used to compute `fitness`
+        :param penalty: A list of three penalty weights [p1, p2, p3] used to compute `fitness` or None
+        :return: None
+        """
+        self.fitness = fitness
+        self.fitness_cache = (self.cache_key(weight, penalty), self.distances, fitness)
+
+    @classmethod
+    def cache_info(cls) -> dict:
+        """
+        Reports how many `fitness_value` calls have been answered from cache
+        :return: A dict of hits, misses and hit rate
+        """
+        total = cls.cache_hits + cls.cache_misses
+        return {'hits': cls.cache_hits, 'misses': cls.cache_misses,
+                'hit_rate': cls.cache_hits / total if total > 0 else 0.0}
+
     def used_capacity(self) -> List[float]:
         """
         Returns a list of float number that demonstrates how much of the capacity of each `Depot` have been used.
@@ -71,10 +169,20 @@ class Chromosome:
 
     def get_all(self) -> List[Depot]:
         """
-        Returns all `Depot`s as a list independently using deep copy
+        Returns all `Depot`s as a list independently using copy-on-write `Depot.clone`
         :return: A list
         """
-        return deepcopy(self.chromosome)
+        return [d.clone() for d in self.chromosome]
+
+    def clone(self) -> 'Chromosome':
+        """
+        A structural copy-on-write clone of the `Chromosome` which shares the `Customer`s and only copies the
+        sequences of the `Depot`s which get modified later. The cached fitness stays valid for the clone.
+        :return: A `Chromosome`
+        """
+        cloned = Chromosome(self.id, self.capacity, self.fitness, self.get_all(), self.distances)
+        cloned.fitness_cache = self.fitness_cache
+        return cloned
 
     def add(self, depot: Depot):
         """
@@ -99,6 +207,19 @@ class Chromosome:
         """
         return self.chromosome.__contains__(depot)
 
+    def locate(self, customer) -> (int, int, int):
+        """
+        Finds a `Customer` in the `Chromosome` using the maintained `Depot.locations` of each `Depot`
+        :param customer: A `Customer` class instance
+        :return: A tuple of (`Depot` index, route index, position in `Depot`), all -1 if not found. The route index
+            is equal to the number of routes of the `Depot` if the `Customer` is after its last `null` `Customer`.
+        """
+        for k, depot in enumerate(self.chromosome):
+            index = depot.locations().get(id(customer))
+            if index is not None:
+                return k, depot.route_of(index), index
+        return -1, -1, -1
+
     def copy(self) -> List[Depot]:
         """
         A shallow copy of the `Depot`s in the `Chromosome` using builtin `Copy` method
@@ -4,7 +4,7 @@ class Customer:
     These customers is going to fll `Depot` classes.
     """
 
-    def __init__(self, id, x, y, cost, null=False):
+    def __init__(self, id, x, y, cost, null=False, node_index=None, service=0):
         """
 
         :param id: ID assigned to node for tracking
@@ -13,6 +13,8 @@ class Customer:
         :param cost: The cost of servicing each depot
         (in this project, it is 'weight' because vehicles have weight limit)
         :param null: True if the depot is fake and used to split the list of customers as a route in each depot.
+        :param node_index: Compact int ID of the node in `DistanceMatrix` (separators use their `Depot`'s index)
+        :param service: The service duration of the customer which counts to the duration of its route
 
         :return:
         """
@@ -22,6 +24,8 @@ class Customer:
         self.y = y
         self.cost = cost
         self.null = null
+        self.node_index = node_index
+        self.service = service
 
     def describe(self):
         print('ID:{}, coordinate=[{}, {}], cost={}, separator={}'.format(
@@ -1,8 +1,14 @@
 import numpy as np
 from typing import List
-from copy import deepcopy
+from copy import deepcopy, copy
+from itertools import count
+from bisect import bisect_left
 
 from utils.customer import Customer
+from utils import functional as F
+
+# every content of a `Depot` gets a unique version, so copies with same version have same content
+versions = count()
 
 
 class Depot:
@@ -11,7 +17,11 @@ class Depot:
     This class is going to be filled by `Customers` class.
     """
 
-    def __init__(self, id, x, y, capacity, depot_customers: List[Customer] = None):
+    cache_hits = 0
+    cache_misses = 0
+
+    def __init__(self, id, x, y, capacity, depot_customers: List[Customer] = None, max_duration: float = 0,
+                 max_vehicles: int = 0):
         """
         :param id: ID assigned to node for tracking
         :param x: X coordinate of depot
@@ -19,6 +29,8 @@ class Depot:
         :param capacity: The maximum capacity of the Depot
         (in this project, it is filled by 'weight' of `Customers`. In other words, it indicates vehicles weight limit)
         :param depot_customers: A list of `Customer`s
+        :param max_duration: The maximum duration of a route (travel distance plus service durations), 0 if unlimited
+        :param max_vehicles: The maximum number of routes (vehicles) of the `Depot`, 0 if unlimited
 
         :return: A list of `Customers` assigned to this depot
         """
@@ -28,6 +40,9 @@ class Depot:
         self.x = x
         self.y = y
         self.capacity = capacity
+        self.max_duration = max_duration
+        self.max_vehicles = max_vehicles
+        self.node_index = None
         self.depot_customers = depot_customers
         self.routes_ending_indices = []
         if depot_customers is not None:
@@ -35,14 +50,243 @@ class Depot:
                 if c.null:
                     self.routes_ending_indices.append(i)
         self.size = self.depot_customers.__len__()
+        self.version = next(versions)
+        self.distances = None
+        self.route_lengths = None
+        self.route_loads = None
+        self.route_services = None
+        self.owned = True
+        self.position_cache = None
+        self.location_cache = None
+        self.violation_cache = None
+
+    def clone(self) -> 'Depot':
+        """
+        A structural copy-on-write clone of the `Depot`.
+        `Customer`s are immutable input data, so both `Depot`s share them and also share the lists holding them, until
+        one of them is modified. Then that one copies the lists using `own`. The `version` is kept since the content
+        is the same, so cached values stay valid for the clone.
+        :return: A `Depot`
+        """
+        cloned = copy(self)
+        cloned.owned = False
+        self.owned = False
+        return cloned
+
+    def own(self):
+        """
+        Copies the lists of the `Depot` if they are shared with a clone, so they can be modified in place.
+        All mutating methods call it, any code changing `depot_customers` directly has to call it first.
+        :return: None
+        """
+        if self.owned:
+            return
+        self.depot_customers = self.depot_customers.copy()
+        self.routes_ending_indices = self.routes_ending_indices.copy()
+        if self.route_lengths is not None:
+            self.route_lengths = self.route_lengths.copy()
+            self.route_loads = self.route_loads.copy()
+            self.route_services = self.route_services.copy() if self.route_services is not None else None
+        self.owned = True
+
+    def touch(self):
+        """
+        Marks the `Depot` as modified by assigning a new `version`, so cached values computed on it become invalid.
+        All mutating methods call it.
+        :return: None
+        """
+        self.version = next(versions)
+
+    def reindex(self):
+        """
+        Rebuilds the route bookkeeping from scratch, any code changing `depot_customers` directly (e.g. shuffling)
+        has to call it.
+        :return: None
+        """
+        self.own()
+        self.routes_ending_indices = [i for i, c in enumerate(self.depot_customers) if c.null]
+        self.route_lengths = None
+        self.route_loads = None
+        self.route_services = None
+        self.touch()
+
+    def route_stats(self, distances=None) -> (List[float], List[float]):
+        """
+        Returns the length and the load of each route of the `Depot`.
+        The values are computed once and then kept up to date incrementally by `insert` and `remove_at`, so this is
+        O(1) unless the `distances` changes or the `Depot` has been modified without its own methods.
+        Note: The total service duration of each route is maintained the same way in `route_services`.
+        :param distances: A `DistanceMatrix` to look distances up, if None, distances are computed
+        :return: A tuple of (List of route lengths, List of route loads)
+        """
+        if self.route_lengths is not None and self.distances is distances:
+            Depot.cache_hits += 1
+            return self.route_lengths, self.route_loads
+        Depot.cache_misses += 1
+        self.distances = distances
+        self.route_lengths = [0.0] * self.routes_ending_indices.__len__()
+        self.route_loads = [0.0] * self.routes_ending_indices.__len__()
+        self.route_services = [0.0] * self.routes_ending_indices.__len__()
+        for route_idx in range(self.routes_ending_indices.__len__()):
+            self.update_route_stats(route_idx)
+        return self.route_lengths, self.route_loads
+
+    def update_route_stats(self, route_idx: int):
+        """
+        Recomputes the length and the load of a single route from scratch
+        :param route_idx: An int number representing the n'th route in `Depot`
+        :return: None
+        """
+        route = self.depot_customers[self.route_start(route_idx): self.routes_ending_indices[route_idx]]
+        length = 0
+        if route.__len__() > 0:
+            length = F.distance(self, route[0], self.distances) + F.distance(route[-1], self, self.distances)
+            length += sum([F.distance(route[i - 1], route[i], self.distances) for i in range(1, route.__len__())])
+        self.route_lengths[route_idx] = length
+        self.route_loads[route_idx] = sum([c.cost for c in route])
+        self.route_services[route_idx] = sum([c.service for c in route])
+
+    def duration_feasible(self, route_idx: int, length: float, service: float = 0) -> bool:
+        """
+        Checks the duration of a route in O(1) using the maintained route stats, e.g. before an insertion
+        :param route_idx: An int number representing the n'th route in `Depot`
+        :param length: The length the route would have
+        :param service: The service duration added to the route
+        :return: Bool true or false, always true if `max_duration` is 0
+        """
+        return self.max_duration <= 0 or length + self.route_services[route_idx] + service <= self.max_duration
+
+    def route_violation(self, route_idx: int) -> (float, float):
+        """
+        The excess load and the excess duration of a route in O(1) using the maintained route stats
+        :param route_idx: An int number representing the n'th route in `Depot`
+        :return: A tuple of (load over `capacity`, duration over `max_duration`), both 0 if the route is feasible
+        """
+        load = max(0.0, self.route_loads[route_idx] - self.capacity)
+        if self.max_duration <= 0:
+            return load, 0.0
+        return load, max(0.0, self.route_lengths[route_idx] + self.route_services[route_idx] - self.max_duration)
+
+    def violations(self, distances=None) -> (float, float, int):
+        """
+        Sums the violations of the capacity, duration and fleet constraints of the `Depot` up, which are penalized by
+        `Chromosome.fitness_value`.
+        Note: The per-route terms come from the incrementally maintained route stats (see `route_violation`) and the
+            sums are cached per `version` and limits, so they are only recomputed after the `Depot` has been modified.
+        :param distances: A `DistanceMatrix` to look distances up, if None, distances are computed
+        :return: A tuple of (excess load, excess duration, number of routes over `max_vehicles`)
+        """
+        key = (self.version, self.capacity, self.max_duration, self.max_vehicles)
+        if self.violation_cache is not None and self.violation_cache[0] == key and self.violation_cache[1] is distances:
+            return self.violation_cache[2]
+        lengths, _ = self.route_stats(distances)
+        load = 0.0
+        duration = 0.0
+        for route_idx in range(lengths.__len__()):
+            route_load, route_duration = self.route_violation(route_idx)
+            load += route_load
+            duration += route_duration
+        fleet = max(0, lengths.__len__() - self.max_vehicles) if self.max_vehicles > 0 else 0
+        self.violation_cache = (key, distances, (load, duration, fleet))
+        return self.violation_cache[2]
+
+    @classmethod
+    def cache_info(cls) -> dict:
+        """
+        Reports how many `route_stats` calls have been answered from the maintained values without a full rescan
+        :return: A dict of hits, misses and hit rate
+        """
+        total = cls.cache_hits + cls.cache_misses
+        return {'hits': cls.cache_hits, 'misses': cls.cache_misses,
+                'hit_rate': cls.cache_hits / total if total > 0 else 0.0}
+
+    def positions(self) -> dict:
+        """
+        Maps the `node_index` of each `Customer` to its position in the `Depot` (`null` `Customer`s are skipped).
+        The map is built once per `version`, i.e. rebuilt lazily after the `Depot` has been modified.
+        :return: A dict of `node_index` to position
+        """
+        if self.position_cache is None or self.position_cache[0] != self.version:
+            self.position_cache = (self.version, dict([(c.node_index, i) for i, c in enumerate(self.depot_customers)
+                                                       if not c.null]))
+        return self.position_cache[1]
+
+    def locations(self) -> dict:
+        """
+        Maps each member of the `Depot` (including `null` `Customer`s) by identity, i.e. `id(customer)`, to its
+        position, which answers `contains`, `index` and `remove` without scanning the list.
+        The map is built once per `version`, i.e. rebuilt lazily after the `Depot` has been modified.
+        :return: A dict of `id(customer)` to position
+        """
+        if self.location_cache is None or self.location_cache[0] != self.version:
+            locations = {}
+            for i, c in enumerate(self.depot_customers):
+                locations.setdefault(id(c), i)  # same as `list.index`, the first occurrence
+            self.location_cache = (self.version, locations)
+        return self.location_cache[1]
+
+    def route_of(self, index: int) -> int:
+        """
+        Returns the route which the position `index` belongs to, the `null` `Customer` ending a route belongs to it.
+        :param index: The index of a position in `Depot`
+        :return: An int route index, equal to the number of routes if `index` is after the last `null` `Customer`
+        """
+        return bisect_left(self.routes_ending_indices, index)
+
+    def route_start(self, route_idx: int) -> int:
+        """
+        Returns the index of the first position of a route
+        :param route_idx: An int number representing the n'th route in `Depot`
+        :return: An int index
+        """
+        return 0 if route_idx == 0 else self.routes_ending_indices[route_idx - 1] + 1
+
+    def neighbours(self, index: int, removing: bool) -> tuple:
+        """
+        Returns the nodes visited right before and right after the position `index` within its route, where the `Depot`
+        itself stands for the start and the end of the route.
+        :param index: The index of a position in `Depot`
+        :param removing: If True, the `Customer` at `index` is skipped (as if it was removed), otherwise the
+            neighbours of an insertion at `index` are returned
+        :return: A tuple of (previous node, next node)
+        """
+        route_idx = self.route_of(index)
+        previous = self if index == self.route_start(route_idx) else self.depot_customers[index - 1]
+        next_index = index + 1 if removing else index
+        if next_index >= self.len() or self.depot_customers[next_index].null:
+            return previous, self
+        return previous, self.depot_customers[next_index]
+
+    def insertion_cost(self, customer: Customer, index: int) -> float:
+        """
+        The increase of the length of a route if `customer` is inserted at `index` (delta evaluation)
+        :param customer: A `Customer` class instance
+        :param index: The index of insertion
+        :return: A float number
+        """
+        previous, following = self.neighbours(index, False)
+        return F.distance(previous, customer, self.distances) + F.distance(customer, following, self.distances) - \
+            F.distance(previous, following, self.distances)
+
+    def removal_cost(self, index: int) -> float:
+        """
+        The decrease of the length of a route if the `Customer` at `index` is removed (delta evaluation)
+        :param index: The index of a `Customer` in `Depot`
+        :return: A float number
+        """
+        previous, following = self.neighbours(index, True)
+        customer = self.depot_customers[index]
+        return F.distance(previous, customer, self.distances) + F.distance(customer, following, self.distances) - \
+            F.distance(previous, following, self.distances)
 
     def route_ending_index(self) -> List[int]:
         """
-        Sorts then returns the list of indices corresponding to the the index of null customer representing the end
-        of a route in a `Depot`.
+        Returns the list of indices corresponding to the the index of null customer representing the end of a route
+        in a `Depot`.
+        Note: All mutating methods keep `routes_ending_indices` sorted, so it is returned as is (do not modify it).
         :return: A sorted list of ints indices
         """
-        return sorted(self.routes_ending_indices)
+        return self.routes_ending_indices
 
     def used_capacity(self) -> float:
         """
@@ -65,18 +309,21 @@ class Depot:
         :param customer: Customer class instance
         :return: None
         """
-        if customer.null == True:
-            self.routes_ending_indices.insert(self.routes_ending_indices.__len__() - 1, self.len())
-
-        self.depot_customers.append(customer)
+        self.insert(self.len(), customer)
 
     def clear(self):
         """
         Clear the `Depot` from `Customer`s
         :return: None
         """
+        self.own()
         self.routes_ending_indices = []
         self.depot_customers.clear()
+        if self.route_lengths is not None:
+            self.route_lengths = []
+            self.route_loads = []
+            self.route_services = []
+        self.touch()
 
     def len(self) -> int:
         """
@@ -91,7 +338,7 @@ class Depot:
         :param customer: A 'Customer` class instance
         :return: Bool true or false
         """
-        return self.depot_customers.__contains__(customer)
+        return id(customer) in self.locations()
 
     def copy(self) -> List[Customer]:
         """
@@ -106,18 +353,43 @@ class Depot:
         :param customer: A `Customer` class instance
         :return: A int number as the index
         """
-        return self.depot_customers.index(customer)
+        index = self.locations().get(id(customer))
+        if index is None:
+            raise ValueError('Customer "{}" is not in Depot "{}".'.format(customer.id, self.id))
+        return index
 
     def insert(self, index: int, customer: Customer):
         """
         Insterts a new `Customer` into a specific `index`
+        Note: The length and the load of the route are updated using `insertion_cost`, inserting a `null` `Customer`
+            splits a route in two which are recomputed.
         :param customer: A `Customer` class instance
         :return: None
         """
-        if customer.null == True:
-            self.routes_ending_indices.insert(self.routes_ending_indices.__len__() - 1, index)
+        if index < 0:
+            index = max(0, self.len() + index)
+        index = min(index, self.len())
+        self.own()
+        route_idx = self.route_of(index)
+        tracked = self.route_lengths is not None and route_idx < self.routes_ending_indices.__len__()
+        if tracked and not customer.null:
+            self.route_lengths[route_idx] += self.insertion_cost(customer, index)
+            self.route_loads[route_idx] += customer.cost
+            self.route_services[route_idx] += customer.service
 
-        return self.depot_customers.insert(index, customer)
+        self.depot_customers.insert(index, customer)
+        for i in range(route_idx, self.routes_ending_indices.__len__()):
+            self.routes_ending_indices[i] += 1
+        if customer.null:
+            self.routes_ending_indices.insert(route_idx, index)
+            if self.route_lengths is not None:
+                self.route_lengths.insert(route_idx, 0.0)
+                self.route_loads.insert(route_idx, 0.0)
+                self.route_services.insert(route_idx, 0.0)
+                self.update_route_stats(route_idx)
+                if tracked:
+                    self.update_route_stats(route_idx + 1)
+        self.touch()
 
     def remove(self, customer: Customer) -> bool:
         """
@@ -125,25 +397,75 @@ class Depot:
         :param customer: a `Customer` class instance
         :return: bool, if `Customer` does not exist returns False, else True
         """
-        if self.contains(customer):
-            if customer.null == True:
-                self.routes_ending_indices.remove(self.index(customer))
-            self.depot_customers.remove(customer)
-            return True
+        index = self.locations().get(id(customer))
+        if index is not None:
+            return self.remove_at(index)
         return False
 
     def remove_at(self, index: int) -> bool:
         """
         Remove a `Customer` at defined `index` from `Depot`
+        Note: The length and the load of the route are updated using `removal_cost`, removing a `null` `Customer`
+            merges two routes which is recomputed.
         :param index: an int number
         :return: bool, if `Customer` does not exist returns False, else True
         """
-        if index <= self.len():
-            if self.depot_customers[index].null == True:
-                self.routes_ending_indices.remove(index)
-            self.depot_customers.remove(self.depot_customers[index])
-            return True
-        return False
+        if index < 0:
+            index += self.len()
+        if index < 0 or index >= self.len():
+            return False
+        self.own()
+        customer = self.depot_customers[index]
+        route_idx = self.route_of(index)
+        tracked = self.route_lengths is not None and route_idx < self.routes_ending_indices.__len__()
+        if tracked and not customer.null:
+            self.route_lengths[route_idx] -= self.removal_cost(index)
+            self.route_loads[route_idx] -= customer.cost
+            self.route_services[route_idx] -= customer.service
+
+        del self.depot_customers[index]
+        if customer.null:
+            del self.routes_ending_indices[route_idx]
+            if self.route_lengths is not None:
+                del self.route_lengths[route_idx]
+                del self.route_loads[route_idx]
+                del self.route_services[route_idx]
+        for i in range(route_idx, self.routes_ending_indices.__len__()):
+            self.routes_ending_indices[i] -= 1
+        if customer.null and self.route_lengths is not None and route_idx < self.routes_ending_indices.__len__():
+            self.update_route_stats(route_idx)
+        self.touch()
+        return True
+
+    def remove_range(self, start: int, end: int) -> List[Customer]:
+        """
+        Removes the `Customer`s at positions `start` to `end` (exclusive) with a single slice deletion, e.g. a whole
+        route with its `null` `Customer`.
+        Note: The stats of routes whose `null` `Customer` is removed are dropped and only the route which the
+            remaining `Customer`s belong to is recomputed, instead of a delta evaluation per removed `Customer`.
+        :param start: The index of the first `Customer` to be removed
+        :param end: The index after the last `Customer` to be removed
+        :return: The removed `Customer`s
+        """
+        start, end = max(0, start), min(end, self.len())
+        if start >= end:
+            return []
+        self.own()
+        removed = self.depot_customers[start: end]
+        first = self.route_of(start)
+        last = bisect_left(self.routes_ending_indices, end)  # the first route ending after the removed range
+        del self.depot_customers[start: end]
+        del self.routes_ending_indices[first: last]
+        for i in range(first, self.routes_ending_indices.__len__()):
+            self.routes_ending_indices[i] -= end - start
+        if self.route_lengths is not None:
+            del self.route_lengths[first: last]
+            del self.route_loads[first: last]
+            del self.route_services[first: last]
+            if first < self.routes_ending_indices.__len__():
+                self.update_route_stats(first)
+        self.touch()
+        return removed
 
     def __getitem__(self, index: int):
         """
@@ -0,0 +1,117 @@
+from utils.spatial import SpatialIndex
+
+import numpy as np
+
+from typing import List
+
+
+class DistanceMatrix:
+    """
+    A dense matrix of pairwise Euclidean distances between all `Depot`s and `Customer`s of a problem instance.
+    Every node gets a compact int `node_index` assigned (`Depot`s first, then `Customer`s) which is used to look the
+    distances up instead of computing them over and over.
+    """
+
+    def __init__(self, nodes: List, dtype=np.float64, path: str = None, block_size: int = 1024, depots: int = None,
+                 neighbour_count: int = 16):
+        """
+        Builds the matrix once with NumPy and assigns `node_index` of each node regarding its position in `nodes`.
+
+        :param nodes: A list of `Depot`s and `Customer`s, by convention `depots + customers`
+        :param dtype: The float type of the matrix, `np.float32` halves the memory for very large instances
+        :param path: If provided, the matrix is backed by a memory-mapped `.npy` file at this path instead of RAM
+            (then scalar lookups index the memory-mapped matrix instead of a nested list copy of it)
+        :param block_size: Number of rows computed at once to bound the temporary memory used while building
+        :param depots: Number of `Depot`s at the beginning of `nodes`, if given, a `SpatialIndex` is built as `spatial`
+        :param neighbour_count: Number of nearest `Customer`s kept per node by the `SpatialIndex`
+        """
+        for i, node in enumerate(nodes):
+            node.node_index = i
+        self.size = nodes.__len__()
+        self.coordinates = np.array([[node.x, node.y] for node in nodes], dtype=np.float64).reshape(-1, 2)
+        # `Depot`s have no demand
+        self.demands = np.array([getattr(node, 'cost', 0.0) for node in nodes], dtype=np.float64)
+        self.services = np.array([getattr(node, 'service', 0.0) for node in nodes], dtype=np.float64)
+        if path is None:
+            self.matrix = np.empty((self.size, self.size), dtype=dtype)
+        else:
+            self.matrix = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(self.size, self.size))
+        for start in range(0, self.size, block_size):
+            block = self.coordinates[start: start + block_size, None, :] - self.coordinates[None, :, :]
+            self.matrix[start: start + block_size] = np.sqrt(block[..., 0] * block[..., 0] +
+                                                             block[..., 1] * block[..., 1])
+        if path is not None:
+            self.matrix.flush()
+        # scalar lookups from Python code are cheaper on nested lists than on NumPy indexing
+        self.rows = self.matrix.tolist() if path is None else None
+        self.spatial = SpatialIndex(self.coordinates, depots, self.matrix, neighbour_count) \
+            if depots is not None else None
+
+    @classmethod
+    def from_arrays(cls, matrix: np.ndarray, coordinates: np.ndarray, demands: np.ndarray, services: np.ndarray,
+                    spatial: SpatialIndex = None, rows: bool = True) -> 'DistanceMatrix':
+        """
+        Wraps already computed arrays (e.g. mapped from a `shared.SharedProblem`) without copying or recomputing them.
+        Note: The nodes are expected to have their `node_index` assigned already.
+        :param matrix: The distance matrix
+        :param coordinates: The (x, y) coordinates of the nodes ordered by `node_index`
+        :param demands: The demand of each node
+        :param services: The service duration of each node
+        :param spatial: A `SpatialIndex` of the nodes or None
+        :param rows: Whether build the nested list copy of the matrix for scalar lookups
+        :return: A `DistanceMatrix`
+        """
+        distances = cls.__new__(cls)
+        distances.size = matrix.shape[0]
+        distances.coordinates = coordinates
+        distances.demands = demands
+        distances.services = services
+        distances.matrix = matrix
+        distances.rows = matrix.tolist() if rows else None
+        distances.spatial = spatial
+        return distances
+
+    def distance(self, source, target) -> float:
+        """
+        Looks up the distance between two nodes using their `node_index`
+        :param source: An instance of `Customer` or `Depot` class
+        :param target: An instance of `Customer` or `Depot` class
+        :return: A float number
+        """
+        if self.rows is not None:
+            return self.rows[source.node_index][target.node_index]
+        return float(self.matrix[source.node_index, target.node_index])
+
+    def __getitem__(self, index):
+        """
+        Makes the class itself subscribable with NumPy indexing over node indices
+        :param index: A pair of int indices or index arrays
+        :return: A float number or an array of distances
+        """
+        return self.matrix[index]
+
+    def __deepcopy__(self, memo):
+        """
+        The matrix is read-only problem data, so it is shared between copies of `Chromosome`s instead of copied.
+        """
+        return self
+
+    def __getstate__(self):
+        """
+        The nested list copy is rebuilt after unpickling instead of being sent to other processes
+        """
+        state = self.__dict__.copy()
+        state['rows'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not isinstance(self.matrix, np.memmap):
+            self.rows = self.matrix.tolist()
+
+    def len(self) -> int:
+        """
+        Number of nodes covered by the matrix
+        :return: An int number
+        """
+        return self.size
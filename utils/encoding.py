@@ -0,0 +1,304 @@
+from utils.customer import Customer
+from utils.depot import Depot
+from utils.chromosome import Chromosome
+from utils.distance import DistanceMatrix
+from utils import kernels as K
+
+import hashlib
+import numpy as np
+
+from typing import List
+
+
+class EncodedChromosome:
+    """
+    Compact array representation of a `Chromosome`.
+    Instead of `Depot` and `Customer` objects with `null` separators mixed in, the whole solution is a single flat
+    permutation of `Customer` node indices (giant tour) plus two offset vectors that split it into routes and
+    routes into `Depot`s. Cloning is a copy of a few small arrays.
+    Note: `Customer`s after the last `null` `Customer` of a `Depot` are kept as an open route (`closed` is False), so
+        the conversion is lossless.
+    """
+
+    def __init__(self, id: int, capacity: float, fitness: float, tour: np.ndarray, route_offsets: np.ndarray,
+                 depot_offsets: np.ndarray, depots: np.ndarray, separators: np.ndarray = None,
+                 closed: np.ndarray = None):
+        """
+        :param id: Unique int ID for demonstration purposes
+        :param capacity: The capacity of the `Depot`s which is same for all `Depot`s in a `Chromosome`
+        :param fitness: The last computed fitness value
+        :param tour: `node_index` of all `Customer`s of all routes of all `Depot`s one after another
+        :param route_offsets: Route `r` is `tour[route_offsets[r]: route_offsets[r + 1]]`
+        :param depot_offsets: Routes `depot_offsets[k]` to `depot_offsets[k + 1]` belong to the k'th `Depot`
+        :param depots: `node_index` of each `Depot`
+        :param separators: ID of the `null` `Customer` closing each route (999 if None)
+        :param closed: Whether each route is closed by a `null` `Customer` (all True if None)
+        """
+        self.id = id
+        self.capacity = capacity
+        self.fitness = fitness
+        self.tour = np.asarray(tour, dtype=np.int32)
+        self.route_offsets = np.asarray(route_offsets, dtype=np.int32)
+        self.depot_offsets = np.asarray(depot_offsets, dtype=np.int32)
+        self.depots = np.asarray(depots, dtype=np.int32)
+        if separators is None:
+            separators = np.full(self.route_offsets.__len__() - 1, 999)
+        if closed is None:
+            closed = np.ones(self.route_offsets.__len__() - 1, dtype=bool)
+        self.separators = np.asarray(separators, dtype=np.int32)
+        self.closed = np.asarray(closed, dtype=bool)
+
+    def len(self) -> int:
+        """
+        Number of `Depot`s in the encoded `Chromosome`
+        :return: An int number
+        """
+        return self.depots.__len__()
+
+    def route_count(self) -> int:
+        """
+        Number of routes over all `Depot`s
+        :return: An int number
+        """
+        return self.route_offsets.__len__() - 1
+
+    def route(self, route_idx: int) -> np.ndarray:
+        """
+        Returns a view over the `Customer` node indices of a route
+        :param route_idx: An int number representing the n'th route in the whole `Chromosome`
+        :return: An int32 array
+        """
+        return self.tour[self.route_offsets[route_idx]: self.route_offsets[route_idx + 1]]
+
+    def route_depots(self) -> np.ndarray:
+        """
+        Returns the `node_index` of the `Depot` serving each route
+        :return: An int32 array with size of `route_count()`
+        """
+        return np.repeat(self.depots, np.diff(self.depot_offsets))
+
+    def copy(self) -> 'EncodedChromosome':
+        """
+        An independent copy of the encoded `Chromosome` which only copies the underlying arrays
+        :return: An `EncodedChromosome`
+        """
+        return EncodedChromosome(self.id, self.capacity, self.fitness, self.tour.copy(), self.route_offsets.copy(),
+                                 self.depot_offsets.copy(), self.depots.copy(), self.separators.copy(),
+                                 self.closed.copy())
+
+    def nbytes(self) -> int:
+        """
+        Memory used by the arrays of the encoded `Chromosome`
+        :return: An int number of bytes
+        """
+        return self.tour.nbytes + self.route_offsets.nbytes + self.depot_offsets.nbytes + self.depots.nbytes + \
+            self.separators.nbytes + self.closed.nbytes
+
+
+def encode(chromosome: Chromosome) -> EncodedChromosome:
+    """
+    Converts a `Chromosome` into its `EncodedChromosome` form.
+    Note: `Customer`s after the last `null` `Customer` of a `Depot` are encoded as an open last route of that `Depot`.
+
+    :param chromosome: A `Chromosome` whose nodes have been indexed by a `DistanceMatrix`
+    :return: An `EncodedChromosome`
+    """
+    tour = []
+    route_offsets = [0]
+    depot_offsets = [0]
+    depots = []
+    separators = []
+    closed = []
+    for depot in chromosome:
+        if depot.node_index is None:
+            raise Exception('Depot "{}" has no "node_index", build a "DistanceMatrix" first.'.format(depot.id))
+        depots.append(depot.node_index)
+        open_route = False
+        for c in depot:
+            if c.null:
+                route_offsets.append(tour.__len__())
+                separators.append(c.id)
+                closed.append(True)
+                open_route = False
+            else:
+                if c.node_index is None:
+                    raise Exception('Customer "{}" has no "node_index", build a "DistanceMatrix" first.'.format(c.id))
+                tour.append(c.node_index)
+                open_route = True
+        if open_route:
+            route_offsets.append(tour.__len__())
+            separators.append(-1)
+            closed.append(False)
+        depot_offsets.append(route_offsets.__len__() - 1)
+    return EncodedChromosome(chromosome.id, chromosome.capacity, chromosome.fitness, np.array(tour, dtype=np.int32),
+                             route_offsets, depot_offsets, depots, separators, closed)
+
+
+def encodable(chromosome: Chromosome) -> bool:
+    """
+    Checks whether all `Depot`s and non-`null` `Customer`s of the `Chromosome` have a `node_index`
+    :param chromosome: A `Chromosome`
+    :return: Bool true or false
+    """
+    return all([d.node_index is not None and all([c.null or c.node_index is not None for c in d]) for d in chromosome])
+
+
+def decode(encoded: EncodedChromosome, nodes: List, distances: DistanceMatrix = None) -> Chromosome:
+    """
+    Converts an `EncodedChromosome` back to a `Chromosome` with `Depot`s and `Customer`s.
+    The `Customer` objects are shared with `nodes` and each closed route is closed by a new `null` `Customer`.
+
+    :param encoded: An `EncodedChromosome`
+    :param nodes: The list of `Depot`s and `Customer`s used to build the `DistanceMatrix` (indexed by `node_index`)
+    :param distances: The `DistanceMatrix` to be attached to the result `Chromosome`
+    :return: A `Chromosome`
+    """
+    depots = []
+    for k, depot_index in enumerate(encoded.depots):
+        template = nodes[depot_index]
+        depot = Depot(template.id, template.x, template.y, encoded.capacity, max_duration=template.max_duration,
+                      max_vehicles=template.max_vehicles)
+        depot.node_index = template.node_index
+        for r in range(encoded.depot_offsets[k], encoded.depot_offsets[k + 1]):
+            for customer_index in encoded.route(r):
+                depot.add(nodes[customer_index])
+            if encoded.closed[r]:
+                depot.add(Customer(int(encoded.separators[r]), depot.x, depot.y, 0, True, depot.node_index))
+        depots.append(depot)
+    return Chromosome(encoded.id, encoded.capacity, encoded.fitness, depots, distances)
+
+
+def canonical_hash(encoded: EncodedChromosome) -> bytes:
+    """
+    A hash of the solution an `EncodedChromosome` represents, so `Chromosome`s which only differ in the order of the
+    routes within a `Depot` or in the direction of routes (and so have the same fitness) get the same hash: each
+    closed route is read in the direction whose sequence is smaller, then the routes of a `Depot` are sorted.
+    The `Customer`s of an open route are hashed regardless of their order, since they are not scored.
+    Note: Separator IDs and the `capacity` are not part of the hash.
+
+    :param encoded: An `EncodedChromosome`
+    :return: The 16-byte BLAKE2b digest of the canonical form
+    """
+    canonical = []
+    for k, depot_index in enumerate(encoded.depots.tolist()):
+        routes = []
+        unrouted = []
+        for r in range(encoded.depot_offsets[k], encoded.depot_offsets[k + 1]):
+            route = encoded.route(r).tolist()
+            if encoded.closed[r]:
+                routes.append(min(route, route[::-1]))
+            else:
+                unrouted += route
+        routes.sort()
+        canonical += [-2, depot_index]
+        for route in routes:
+            canonical += [-1] + route
+        canonical += [-3] + sorted(unrouted)
+    return hashlib.blake2b(np.array(canonical, dtype=np.int64).tobytes(), digest_size=16).digest()
+
+
+def route_lengths(encoded: List[EncodedChromosome], distances: DistanceMatrix) -> (np.ndarray, np.ndarray):
+    """
+    Computes the length of every route of every given `EncodedChromosome` in a single NumPy pass.
+    All giant tours are concatenated, the distance of each leg is gathered from the `DistanceMatrix` where the
+    predecessor of the first `Customer` of a route is its `Depot`, and legs are summed per route using segment sums.
+    Returning from the last `Customer` of each route to its `Depot` is added at the end.
+    Note: With the compiled backend (see `kernels`), the lengths are summed by a loop kernel instead.
+
+    :param encoded: A list of `EncodedChromosome`s
+    :param distances: The `DistanceMatrix` the chromosomes have been encoded against
+    :return: A tuple of (lengths of all routes one chromosome after another, number of routes of each chromosome)
+    """
+    route_counts = np.array([e.route_count() for e in encoded], dtype=np.int64)
+    tour_sizes = np.array([e.tour.__len__() for e in encoded], dtype=np.int64)
+    tour = np.concatenate([e.tour for e in encoded]).astype(np.int64)
+    tour_shift = np.repeat(np.cumsum(tour_sizes) - tour_sizes, route_counts)
+    starts = np.concatenate([e.route_offsets[:-1] for e in encoded]).astype(np.int64) + tour_shift
+    ends = np.concatenate([e.route_offsets[1:] for e in encoded]).astype(np.int64) + tour_shift
+    route_depots = np.concatenate([e.route_depots() for e in encoded]).astype(np.int64)
+
+    if K.enabled():
+        return K.route_lengths(tour, starts, ends, route_depots, np.asarray(distances.matrix)), route_counts
+    sizes = ends - starts
+    route_ids = np.repeat(np.arange(sizes.__len__()), sizes)
+    previous = np.empty_like(tour)
+    previous[1:] = tour[:-1]
+    non_empty = sizes > 0
+    previous[starts[non_empty]] = route_depots[non_empty]
+    lengths = np.bincount(route_ids, weights=distances[previous, tour], minlength=sizes.__len__())
+    lengths[non_empty] += distances[tour[ends[non_empty] - 1], route_depots[non_empty]]
+    return lengths, route_counts
+
+
+def batch_fitness(encoded: List[EncodedChromosome], distances: DistanceMatrix, weight=None) -> np.ndarray:
+    """
+    Computes the fitness value of all given `EncodedChromosome`s at once with the same criteria as
+    `Chromosome.fitness_value`: w1*distance + w2*route_count.
+    Note: Same as `Depot.route_stats`, only closed routes are counted, open routes (`Customer`s after the last `null`
+        `Customer` of a `Depot`) are ignored.
+
+    :param encoded: A list of `EncodedChromosome`s
+    :param distances: The `DistanceMatrix` the chromosomes have been encoded against
+    :param weight: A list of two weights [w1, w2]
+    :return: A float array with the fitness of each `EncodedChromosome`
+    """
+    if weight is None:
+        weight = [100, 0.001]
+    if encoded.__len__() == 0:
+        return np.empty(0, dtype=np.float64)
+    lengths, route_counts = route_lengths(encoded, distances)
+    closed = np.concatenate([e.closed for e in encoded])
+    chromosome_ids = np.repeat(np.arange(encoded.__len__()), route_counts)
+    distance = np.bincount(chromosome_ids, weights=np.where(closed, lengths, 0.0), minlength=encoded.__len__())
+    closed_counts = np.bincount(chromosome_ids, weights=closed, minlength=encoded.__len__())
+    fitness = weight[0] * distance + weight[1] * closed_counts
+    for e, f in zip(encoded, fitness):
+        e.fitness = float(f)
+    return fitness
+
+
+def pack(encoded: List[EncodedChromosome]) -> dict:
+    """
+    Packs a list of `EncodedChromosome`s into a few flat arrays (one per field) so a whole `Population` can be sent to
+    other processes or written to a file at once.
+
+    :param encoded: A list of `EncodedChromosome`s
+    :return: A dict of NumPy arrays
+    """
+    def concatenate(arrays, dtype):
+        return np.concatenate([np.empty(0, dtype=dtype)] + [np.asarray(a, dtype=dtype) for a in arrays])
+
+    return {
+        'ids': np.array([e.id for e in encoded], dtype=np.int64),
+        'capacities': np.array([e.capacity for e in encoded], dtype=np.float64),
+        'fitness': np.array([e.fitness for e in encoded], dtype=np.float64),
+        'tour_sizes': np.array([e.tour.__len__() for e in encoded], dtype=np.int64),
+        'route_counts': np.array([e.route_count() for e in encoded], dtype=np.int64),
+        'depot_counts': np.array([e.len() for e in encoded], dtype=np.int64),
+        'tours': concatenate([e.tour for e in encoded], np.int32),
+        'route_offsets': concatenate([e.route_offsets for e in encoded], np.int32),
+        'depot_offsets': concatenate([e.depot_offsets for e in encoded], np.int32),
+        'depots': concatenate([e.depots for e in encoded], np.int32),
+        'separators': concatenate([e.separators for e in encoded], np.int32),
+        'closed': concatenate([e.closed for e in encoded], bool),
+    }
+
+
+def unpack(arrays: dict) -> List[EncodedChromosome]:
+    """
+    Inverse of `pack`
+    :param arrays: A dict of NumPy arrays created by `pack`
+    :return: A list of `EncodedChromosome`s
+    """
+    def split(values, sizes):
+        return np.split(values, np.cumsum(sizes)[:-1]) if sizes.__len__() > 0 else []
+
+    route_counts = arrays['route_counts']
+    return [EncodedChromosome(int(id), float(capacity), float(fitness), tour, route_offsets, depot_offsets, depots,
+                              separators, closed)
+            for id, capacity, fitness, tour, route_offsets, depot_offsets, depots, separators, closed in
+            zip(arrays['ids'], arrays['capacities'], arrays['fitness'], split(arrays['tours'], arrays['tour_sizes']),
+                split(arrays['route_offsets'], route_counts + 1),
+                split(arrays['depot_offsets'], arrays['depot_counts'] + 1),
+                split(arrays['depots'], arrays['depot_counts']), split(arrays['separators'], route_counts),
+                split(arrays['closed'], route_counts))]
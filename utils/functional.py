@@ -2,10 +2,13 @@ from utils.population import Population
 from utils.customer import Customer
 from utils.depot import Depot
 from utils.chromosome import Chromosome
+from utils.distance import DistanceMatrix
+from utils import local_search as LS
+from utils import kernels as K
+from utils import selection as S
 
 import math
 import random
-from copy import deepcopy
 import numpy as np
 
 from typing import List
@@ -21,27 +24,78 @@ def euclidean_distance(source: Customer, target) -> float:
     return math.sqrt(math.pow(source.x - target.x, 2) + math.pow(source.y - target.y, 2))
 
 
-def initial_routing(depot: Depot) -> None:
+def distance(source: Customer, target, distances: DistanceMatrix = None) -> float:
+    """
+    Returns the distance between two nodes by looking it up in the precomputed `DistanceMatrix` if available,
+    otherwise computes it using `euclidean_distance`.
+    :param source: An instance of `Customer` or `Depot` class
+    :param target: An instance of `Customer` or `Depot` class
+    :param distances: A `DistanceMatrix` which both nodes have been indexed in, or None
+    :return: A float number
+    """
+    if distances is None or source.node_index is None or target.node_index is None:
+        return euclidean_distance(source, target)
+    if distances.rows is not None:
+        return distances.rows[source.node_index][target.node_index]
+    return distances.distance(source, target)
+
+
+def initial_routing(depot: Depot, distances: DistanceMatrix = None) -> None:
     """
     Adds `Customer`s sequentially to the `Depot` until accumulated `weight` of `Customer`s, surpasses
-    the `Depot`'s maximum `capacity.
+    the `Depot`'s maximum `capacity, or the duration of the route (travel distance back to the `Depot` plus service
+    durations) would surpass its `max_duration`.
 
     Note: Between two `separator` `Customer`, constructs a route to be satisfied by a vehicle.
+    Note: With the compiled backend (see `kernels`), the accumulation runs on arrays of demands and services.
     :param depot: An instance of `Depot` class
+    :param distances: A `DistanceMatrix` to look distances up, if None, distances are computed
     :return: None
     """
+    limited = depot.max_duration > 0
+    if K.enabled() and (not limited or distances is not None):
+        breaks = K.greedy_breaks(np.array([c.node_index if limited else 0 for c in depot], dtype=np.int64),
+                                 np.array([c.cost for c in depot], dtype=np.float64),
+                                 np.array([c.service for c in depot], dtype=np.float64), depot.capacity,
+                                 depot.node_index if limited else 0, depot.max_duration,
+                                 distances.matrix if limited else np.zeros((1, 1)))
+        breaks = set(breaks.tolist())
+        routed = []
+        for i, c in enumerate(depot):
+            if i in breaks:
+                routed.append(Customer(999, depot.x, depot.y, 0, True, depot.node_index))
+            routed.append(c)
+        if routed.__len__() > 0 and not routed[-1].null:
+            routed.append(Customer(999, depot.x, depot.y, 0, True, depot.node_index))
+        depot.own()
+        depot.depot_customers = routed
+        depot.reindex()
+        return
     accumulated_weight = 0
-    separator = Customer(999, depot.x, depot.y, 0, True)
+    accumulated_duration = 0
+    previous = depot
     i = 0
     while i < depot.len():
-        if accumulated_weight + depot[i].cost > depot.capacity:
-            depot.insert(i, separator)
+        customer = depot[i]
+        split = accumulated_weight + customer.cost > depot.capacity
+        if limited:
+            duration = accumulated_duration + distance(previous, customer, distances) + customer.service
+            if previous is not depot and duration + distance(customer, depot, distances) > depot.max_duration:
+                split = True
+        if split:
+            depot.insert(i, Customer(999, depot.x, depot.y, 0, True, depot.node_index))
             accumulated_weight = 0
+            previous = depot
             i += 1
-        accumulated_weight += depot[i].cost
+            if limited:
+                duration = distance(depot, customer, distances) + customer.service
+        accumulated_weight += customer.cost
+        if limited:
+            accumulated_duration = duration
+            previous = customer
         i += 1
-    if not depot[-1].null:
-        depot.add(separator)
+    if depot.len() > 0 and not depot[-1].null:
+        depot.add(Customer(999, depot.x, depot.y, 0, True, depot.node_index))
 
 
 def initialize_routing(instance) -> None:
@@ -57,10 +111,10 @@ def initialize_routing(instance) -> None:
     if instance.__class__.__name__.__contains__('Population'):
         for ch in instance:
             for d in ch:
-                initial_routing(d)
+                initial_routing(d, ch.distances)
     elif instance.__class__.__name__.__contains__('Chromosome'):
         for d in instance:
-            initial_routing(d)
+            initial_routing(d, instance.distances)
     else:
         initial_routing(instance)
 
@@ -74,17 +128,19 @@ def randomize_customers(chromosome: Chromosome) -> None:
     :return: None
     """
     for d in chromosome:
+        d.own()
         random.shuffle(d.depot_customers)
+        d.reindex()
 
 
 def clone(chromosome: Chromosome) -> Chromosome:
     """
-    Clones a Chromosome with all same characteristics
+    Clones a Chromosome with all same characteristics using copy-on-write `Chromosome.clone`
     :param chromosome: An instance of `Chromosome` class to be cloned
     :return: A cloned `Chromosome`
     """
 
-    return deepcopy(chromosome)
+    return chromosome.clone()
 
 
 # aka TournamentPopulation
@@ -102,17 +158,19 @@ def extract_population(population: Population, size: int) -> Population:
     return new_population
 
 
-def fittest_chromosome(population: Population) -> Chromosome:
+def fittest_chromosome(population: Population, penalty=None) -> Chromosome:
     """
     Returns the `Chromosome` with maximum `fitness_value` within whole `Population`
     :param population: An instance of `Population` class
+    :param penalty: A list of three penalty weights [p1, p2, p3] passed to `fitness_value`, or None
     :return: A single `Chromosome`
     """
 
-    return max(population, key=lambda chromosome: chromosome.fitness_value())
+    return max(population, key=lambda chromosome: chromosome.fitness_value(penalty=penalty))
 
 
-def tournament(population: Population, tournament_probability: float = 0.8, size: int = 2) -> Population:
+def tournament(population: Population, tournament_probability: float = 0.8, size: int = 2,
+               penalty=None) -> Population:
     """
     Selects TWO parents to send them to `crossover` step based on `tournament` approach.
 
@@ -128,48 +186,38 @@ def tournament(population: Population, tournament_probability: float = 0.8, size
     :param population: An instance of `Population` class
     :param tournament_probability: The probability of using fittest or random sample (=0.8)
     :param size: The size of population to be sampled. By default, we use Binary tournament.
+    :param penalty: A list of three penalty weights [p1, p2, p3] used to find the fittest, or None
     :return: A `Population` with size of `size`
     """
 
-    # we create new objects to make sure asexual can happen too. (all methods are by reference)
-    first_fittest = Chromosome(7770, -1)
-    second_fittest = Chromosome(7771, -1)
-
+    # we clone the winners to make sure asexual can happen too. (all methods are by reference)
     first_sample = extract_population(population, size)
     if random.random() <= tournament_probability:
         second_sample = extract_population(population, size)
-        first = fittest_chromosome(first_sample)
-        second = fittest_chromosome(second_sample)
-        for new, found in zip([first_fittest, second_fittest], [first, second]):
-            new.chromosome = found.get_all()
-            new.id = found.id
-            new.fitness = found.fitness
-            new.capacity = found.capacity
-            new.size = found.size
-
-        return Population(0, [first_fittest, second_fittest])
+        first = fittest_chromosome(first_sample, penalty)
+        second = fittest_chromosome(second_sample, penalty)
+        return Population(0, [first.clone(), second.clone()])
     else:
         indices = random.sample(range(0, first_sample.len()), 2)
         first = first_sample[indices[0]]
         second = first_sample[indices[1]]
-        for new, found in zip([first_fittest, second_fittest], [first, second]):
-            new.chromosome = found.get_all()
-            new.id = found.id
-            new.fitness = found.fitness
-            new.capacity = found.capacity
-            new.size = found.size
-        return Population(0, [first_fittest, second_fittest])
+        return Population(0, [first.clone(), second.clone()])
 
 
 def extract_random_route(chromosome: Chromosome, delete=True) -> (List[Customer], int, int, int):
     """
     Extracts a random route within a random `Depot` in given `Chromosome`.
-    Note: A route defined is indicated by the `Customer`s between two `null` `Customer`s.
+    Note: A route defined is indicated by the `Customer`s between two `null` `Customer`s, so `Depot`s without any
+        `null` `Customer` are skipped. If there is no route at all, an empty route and -1 indices are returned.
+    Note: The route is deleted with a single slice deletion by `Depot.remove_range`.
     :param chromosome: A `Chromosome` to be searched for route
     :param delete: Whether delete the extracted route from `Chromosome` or not.
     :return: A tuple of (List of `Customer`s, depot, start and end index)
     """
-    rand_depot_index = random.randint(0, chromosome.len() - 1)
+    routed = [i for i, d in enumerate(chromosome) if d.routes_ending_indices.__len__() > 0]
+    if routed.__len__() == 0:  # only open routes left, nothing to extract
+        return [], -1, -1, -1
+    rand_depot_index = routed[random.randint(0, routed.__len__() - 1)]
     rand_depot: Depot = chromosome[rand_depot_index]
     rand_route_idx = random.randint(0, rand_depot.route_ending_index().__len__() - 1)
     rand_route_end_idx = rand_depot.route_ending_index()[rand_route_idx]
@@ -177,16 +225,14 @@ def extract_random_route(chromosome: Chromosome, delete=True) -> (List[Customer]
         rand_route_start_idx = 0
         route = rand_depot[rand_route_start_idx: rand_route_end_idx + 1]
         if delete:
-            for c in reversed(route):  # use `reversed` or we loose the `null customer` index
-                rand_depot.remove(c)
+            rand_depot.remove_range(rand_route_start_idx, rand_route_end_idx + 1)
         return route, rand_depot_index, rand_route_start_idx, rand_route_end_idx
 
     else:
         rand_route_start_idx = rand_depot.route_ending_index()[rand_route_idx - 1]
     route = rand_depot[rand_route_start_idx + 1: rand_route_end_idx + 1]
     if delete:
-        for c in reversed(route):  # use `reversed` or we loose the `null customer` index
-            rand_depot.remove(c)
+        rand_depot.remove_range(rand_route_start_idx + 1, rand_route_end_idx + 1)
     return route, rand_depot_index, rand_route_start_idx, rand_route_end_idx
 
 
@@ -201,7 +247,7 @@ def extract_route_from_depot(depot: Depot, route_idx: int, return_separator=Fals
     """
     if route_idx >= depot.route_ending_index().__len__():
         raise Exception('There are not "{}" routes, try numbers between [0,{}] as "route_idx".'
-                        .format(route_idx, depot.routes_ending_indices.len() - 1))
+                        .format(route_idx, depot.routes_ending_indices.__len__() - 1))
     route_end_idx = depot.route_ending_index()[route_idx]
     if route_idx == 0:
         route_start_idx = 0
@@ -219,68 +265,168 @@ def extract_route_from_depot(depot: Depot, route_idx: int, return_separator=Fals
         return route, route_start_idx + 1, route_end_idx
 
 
-def insert_customer(customer: Customer, chromosome: Chromosome) -> (int, int, int):
+def nearest_depots(customer: Customer, chromosome: Chromosome, k: int = 1) -> List[int]:
+    """
+    Returns the indices of the `k` nearest `Depot`s of a `Customer` within the `Chromosome`.
+    Note: If the `DistanceMatrix` of the `Chromosome` has a `SpatialIndex`, the precomputed `depot_order` is used,
+        otherwise the distances to all `Depot`s are computed.
+    :param customer: A `Customer`
+    :param chromosome: An instance of `Chromosome` class
+    :param k: Number of `Depot`s
+    :return: A list of `Depot` indices from the nearest to the farthest
+    """
+    distances = chromosome.distances
+    if distances is not None and distances.spatial is not None and customer.node_index is not None:
+        return distances.spatial.candidate_depots(customer.node_index, k)
+    return [int(i) for i in np.argsort([distance(customer, d, distances) for d in chromosome], kind='stable')[:k]]
+
+
+def granular_positions(customer: Customer, depot: Depot, k: int) -> List[int]:
+    """
+    Returns the insertion positions right before and right after the `k` nearest neighbours of the `Customer` which are
+    in the `Depot`, using the neighbour lists of the `SpatialIndex` of the `DistanceMatrix`.
+    :param customer: A `Customer` with a `node_index`
+    :param depot: A `Depot` whose `distances` has a `SpatialIndex`
+    :param k: Number of nearest neighbours
+    :return: A sorted list of insertion indices
+    """
+    positions = depot.positions()
+    candidates = set()
+    for neighbour in depot.distances.spatial.neighbours[customer.node_index][:k]:
+        position = positions.get(neighbour)
+        if position is not None:
+            candidates.add(position)
+            candidates.add(position + 1)
+    return sorted(candidates)
+
+
+def best_position(customer: Customer, chromosome: Chromosome, depot_indices: List[int], relaxed: bool = False) \
+        -> (float, int, int, int):
+    """
+    Evaluates all insertion positions of a `Customer` in all routes of the given `Depot`s and returns the cheapest one
+    regarding the capacity and duration constraints, see `insert_customer`.
+    Note: With the compiled backend (see `kernels`), the scan of each `Depot` runs on arrays.
+    :param customer: A `Customer` to be inserted
+    :param chromosome: An instance of `Chromosome` class
+    :param depot_indices: Indices of the `Depot`s to be searched
+    :param relaxed: If True, the capacity and duration constraints are ignored
+    :return: A tuple of (route length after insertion, `Depot` index, route index, insert index), indices are -1 if
+        no position is feasible
+    """
+    distances_matrix = chromosome.distances
+    min_distance = 99999999  # +inf
+    depot_index = -1
+    insert_index = -1
+    route_index = -1
+    if K.enabled() and distances_matrix is not None and customer.node_index is not None:
+        for candidate in depot_indices:
+            depot = chromosome[candidate]
+            lengths, loads = depot.route_stats(distances_matrix)
+            t3, i, index = K.insertion_scan(np.array([c.node_index for c in depot], dtype=np.int64),
+                                            np.array(depot.routes_ending_indices, dtype=np.int64),
+                                            np.array(lengths, dtype=np.float64), np.array(loads, dtype=np.float64),
+                                            np.array(depot.route_services, dtype=np.float64), depot.node_index,
+                                            customer.node_index, customer.cost, customer.service,
+                                            np.inf if relaxed else depot.capacity,
+                                            0.0 if relaxed else depot.max_duration, distances_matrix.matrix)
+            if i != -1 and min_distance > t3:
+                min_distance = t3
+                route_index = i
+                insert_index = index
+                depot_index = candidate
+        return min_distance, depot_index, route_index, insert_index
+
+    for candidate in depot_indices:
+        depot = chromosome[candidate]
+        lengths, loads = depot.route_stats(distances_matrix)
+        for i in range(lengths.__len__()):
+            if relaxed or customer.cost + loads[i] <= depot.capacity:
+                for index in range(depot.route_start(i), depot.routes_ending_indices[i] + 1):
+                    t3 = lengths[i] + depot.insertion_cost(customer, index)
+
+                    if min_distance > t3 and (relaxed or depot.duration_feasible(i, t3, customer.service)):
+                        min_distance = t3
+                        route_index = i
+                        insert_index = index
+                        depot_index = candidate
+    return min_distance, depot_index, route_index, insert_index
+
+
+def insert_customer(customer: Customer, chromosome: Chromosome, candidates: int = 1, granular: int = 0) -> (int, int):
     """
     Inserts a `Customer` from randomly removed route of a `Depot` at a optimal place in `Chromosome`.
 
     The optimal place can be found using following steps:
-    1. Find the nearest `Depot` to the given `Customer` using `euclidean_distance` function.
-    2. Calculate the `cost` and `distance` between all members of all routes of the the chosen `Depot` from previous
-       step
-    3. Now the code calculates the distance in each route in the selected `Depot` if we add the `Customer` in all routes
-       from index 0 to the routes' lengths. Then we add customer in the route with minimum distance regarding the
-       capacity constraint on each `Depot`.
+    1. Find the `candidates` nearest `Depot`s to the given `Customer` using `nearest_depots` function.
+    2. Get the `cost` and `distance` of all routes of the the chosen `Depot`s from previous step which are maintained
+       incrementally by `Depot.route_stats`
+    3. Now the code calculates the distance in each route in the selected `Depot`s if we add the `Customer` in all
+       routes from index 0 to the routes' lengths using `Depot.insertion_cost`. Then we add customer in the route with
+       minimum distance regarding the capacity and duration constraints on each `Depot` (both O(1) per position
+       using `Depot.route_stats`, `Depot.route_services` and `Depot.duration_feasible`).
     4. Finally the code returns the index of `Depot` and the position the `Customer` has been added.
+    Note: If no route of the candidate `Depot`s can take the `Customer`, a new route is opened in the nearest one,
+        unless its fleet is exhausted (`Depot.max_vehicles` routes), then the `Customer` is inserted at the cheapest
+        position ignoring capacity and duration, the violations are penalized by `Chromosome.fitness_value`.
+    Note: In granular mode (`granular` > 0) only the positions next to the `granular` nearest neighbours of the
+        `Customer` are evaluated (see `granular_positions`), if none of them is feasible, all positions are evaluated
+        by `best_position`. It needs a `DistanceMatrix` with a `SpatialIndex`, otherwise all positions are evaluated.
 
     :param customer: A `Customer` to be inserted in `Chromosome`
     :param chromosome: An instance of `Chromosome` class
+    :param candidates: Number of nearest `Depot`s to be considered
+    :param granular: Number of nearest neighbours to restrict the insertion positions to, 0 evaluates all positions
     :return: A tuple of (the `Depot` index, insert index)
     """
-    nearest_depot_index = int(np.argmin([euclidean_distance(customer, d) for d in chromosome]))
-    nearest_depot = chromosome[nearest_depot_index]
-    distances = []
-    costs = []
+    distances_matrix = chromosome.distances
+    depot_indices = nearest_depots(customer, chromosome, candidates)
     min_distance = 99999999  # +inf
+    depot_index = depot_indices[0]
     insert_index = -1
     route_index = -1
-    depot_temp = Customer(-1, nearest_depot.x, nearest_depot.y, 0, False)  # to calculate distance between depot
-    # and customers and will be removed after inserting new `Customer`
-
-    for i in range(nearest_depot.routes_ending_indices.__len__()):
-        route, _, _ = extract_route_from_depot(nearest_depot, i, False)
-        route.insert(0, depot_temp)
-        distances.append(sum([euclidean_distance(route[i - 1], route[i]) for i, _ in enumerate(route)]))
-        costs.append(sum([c.cost for c in route]))
-
-        if customer.cost + costs[i] <= nearest_depot.capacity:
-            for ci in range(route.__len__()):
-                t1 = euclidean_distance(route[ci], route[(ci + 1) % route.__len__()])
-                t2 = euclidean_distance(route[ci], customer) + euclidean_distance(customer,
-                                                                                  route[(ci + 1) % route.__len__()])
-                t3 = distances[i] - t1 + t2
-
-                if min_distance > t3:
-                    min_distance = t3
-                    route_index = i
-                    insert_index = ci
 
-        route.remove(depot_temp)
-
-    if route_index > 0:
-        insert_index += nearest_depot.route_ending_index()[route_index - 1] + 1
+    # length and load of routes are maintained by `Depot`, so each position costs a delta evaluation
+    if granular > 0 and distances_matrix is not None and distances_matrix.spatial is not None and \
+            customer.node_index is not None:
+        for candidate in depot_indices:
+            depot = chromosome[candidate]
+            lengths, loads = depot.route_stats(distances_matrix)
+            for index in granular_positions(customer, depot, granular):
+                i = depot.route_of(index)
+                if i < lengths.__len__() and customer.cost + loads[i] <= depot.capacity:
+                    t3 = lengths[i] + depot.insertion_cost(customer, index)
+
+                    if min_distance > t3 and depot.duration_feasible(i, t3, customer.service):
+                        min_distance = t3
+                        route_index = i
+                        insert_index = index
+                        depot_index = candidate
 
     if route_index == -1:
-        separator = Customer(9999, nearest_depot.x, nearest_depot.y, 0, True)
+        t3, candidate, i, index = best_position(customer, chromosome, depot_indices)
+        if i != -1 and min_distance > t3:
+            min_distance, depot_index, route_index, insert_index = t3, candidate, i, index
+
+    # the fleet of the nearest `Depot` is exhausted, so the violation is left to the penalized fitness
+    fleet = chromosome[depot_index]
+    if route_index == -1 and 0 < fleet.max_vehicles <= fleet.routes_ending_indices.__len__():
+        _, candidate, i, index = best_position(customer, chromosome, depot_indices, relaxed=True)
+        if i != -1:
+            depot_index, route_index, insert_index = candidate, i, index
+
+    nearest_depot = chromosome[depot_index]
+    if route_index == -1:
+        separator = Customer(9999, nearest_depot.x, nearest_depot.y, 0, True, nearest_depot.node_index)
         nearest_depot.add(customer)
         nearest_depot.add(separator)
         insert_index = nearest_depot.len() - 2
     else:
         nearest_depot.insert(insert_index, customer)
 
-    return nearest_depot_index, insert_index
+    return depot_index, insert_index
 
 
-def cross_over(parents: Population) -> (Population, List[Customer], List[Customer]):
+def cross_over(parents: Population, granular: int = 0) -> (Population, List[Customer], List[Customer]):
     """
     Gets a `Population` instance consisting of two `Chromosome`s and apply cross over on the parents based the
     following steps:
@@ -291,6 +437,7 @@ def cross_over(parents: Population) -> (Population, List[Customer], List[Custome
        to the "first" parent using aforementioned method too.
 
     :param parents: An instance of `Population` class with "two" `Chromosome`s
+    :param granular: Number of nearest neighbours `insert_customer` restricts the positions to, 0 evaluates all
     :return: A `Population` class with "two" `Chromosome`s which has been obtained after cross-over.
     """
 
@@ -298,28 +445,38 @@ def cross_over(parents: Population) -> (Population, List[Customer], List[Custome
     first_route = extract_random_route(first_parent, True)[0][:-1]
     second_route = extract_random_route(second_parent, True)[0][:-1]
     for c in first_route:
-        insert_customer(c, second_parent)
+        insert_customer(c, second_parent, granular=granular)
     for c in second_route:
-        insert_customer(c, first_parent)
+        insert_customer(c, first_parent, granular=granular)
     crossed_parents = Population(6969, [first_parent, second_parent])
     return crossed_parents, first_route, second_route
 
 
-def generate_chromosome_sample(depots: List[Depot], customers: List[Customer], out: Chromosome = None) -> Chromosome:
+def generate_chromosome_sample(depots: List[Depot], customers: List[Customer], out: Chromosome = None,
+                               distances: DistanceMatrix = None) -> Chromosome:
     """
     Gets a list of `Depot`s and `Customer`s and creates a new `Chromosome` regarding these information.
     Note: input `Depot` are only `Depot` objects and contains no `Customer` in it, so to fill those `Depot`s,
-        we assign each `Customer` to its NEAREST `Depot` based on `euclidean_distance` metric.
+        we assign each `Customer` to its NEAREST `Depot` based on `euclidean_distance` metric. If `distances` has a
+        `SpatialIndex`, the nearest `Depot`s are looked up in its precomputed `depot_order`.
 
     :param depots: A list of empty `Depot`s
     :param customers: A list of `Customer`s to be distributed between `Depot`s in the final `Chromosome`
     :param out: A `Chromosome` type object to be used instead of creating new instance. (All values will be overridden)
+    :param distances: A `DistanceMatrix` built over `depots + customers` to be used by the `Chromosome`
     :return: A filled `Chromosome`
     """
     if out is None:
-        out = Chromosome(1001, depots[0].capacity, -1, depots)
+        out = Chromosome(1001, depots[0].capacity, -1, depots, distances)
+    elif distances is not None:
+        out.distances = distances
+    if distances is not None and distances.spatial is not None:
+        depot_order = distances.spatial.depot_order
+        for c in customers:
+            depots[depot_order[c.node_index][0]].add(c)
+        return out
     for c in customers:
-        depots[int(np.argmin([euclidean_distance(c, d) for d in depots]))].add(c)
+        depots[int(np.argmin([distance(c, d, distances) for d in depots]))].add(c)
     return out
 
 
@@ -340,20 +497,55 @@ def generate_initial_population(sample: Chromosome, size: int) -> Population:
     return population
 
 
-def generate_new_population(population: Population):
+def generate_new_population(population: Population, pool=None, granular: int = 0, education: int = 0,
+                            penalty=None, selection: str = None, memo=None) -> Population:
     """
     Generates new `Population` by crossing over winners of tournament algorithm over the whole input `Population`.
     Note: We always save the fittest for next generation, if it causes size mismatch, we remove latest new `Chromosome`.
+    Note: With `selection`, all parents of the generation are drawn at once over the fitness vector of the
+        `Population` (see `selection.parent_indices`) with a `np.random.Generator` seeded from `random`, and only the
+        drawn parents are cloned, when their pair is crossed over.
+    Note: The new `Population` handles duplicates the same way as the input `Population` (see `Population.duplicates`),
+        if it keeps rejecting offspring (e.g. a converged `Population`), the rest of the offspring are added anyway.
 
     :param population: An initialized instance of`Population`
+    :param pool: An optional `parallel.OffspringPool` to produce and evaluate offspring pairs in worker processes
+    :param granular: Number of nearest neighbours `cross_over` restricts the insertion positions to, 0 evaluates all
+    :param education: Maximum number of `local_search.educate` moves applied to each offspring, 0 disables it
+    :param penalty: An optional `penalty.AdaptivePenalty` whose weights penalize the fitness of infeasible
+        `Chromosome`s during selection, it is updated with the new `Population` (not supported with `pool`)
+    :param selection: One of `selection.METHODS` ('tournament', 'rank' or 'roulette'), if None, each pair of parents
+        is chosen by `tournament`
+    :param memo: An optional `memo.FitnessMemo` used to score the `Population` for `selection`
     :return: An evolved instance `Population`
     """
+    if pool is not None:
+        return pool.generate_new_population(population)
 
-    new_population = Population(123, [fittest_chromosome(population)])
+    weights = None if penalty is None else penalty.weights.copy()
+    pairs = None
+    if selection is None:
+        elite = fittest_chromosome(population, weights)
+    else:
+        fitness = population.fitness_values(penalty=weights, memo=memo)
+        elite = population[int(np.argmax(fitness))]
+        rng = np.random.default_rng(random.getrandbits(64))
+        pairs = S.parents(population, S.parent_indices(fitness, population.len() // 2, rng, selection))
+    new_population = Population(123, [elite], population.duplicates, population.duplicate_penalty)
+    rejected = 0
     while new_population.len() < population.len():
-        crossed_parents = cross_over(tournament(population, 0.8, population.len()))
+        parents = tournament(population, 0.8, population.len(), weights) if pairs is None else next(pairs, None)
+        if parents is None:  # rejected duplicates used up the drawn parents
+            pairs = S.parents(population, S.parent_indices(fitness, population.len() // 2 + 1, rng, selection))
+            parents = next(pairs)
+        crossed_parents, _, _ = cross_over(parents, granular)
         for ch in crossed_parents:
-            new_population.add(ch)
+            if education > 0 and ch.distances is not None:
+                LS.educate(ch, education)
+            if not new_population.add(ch, rejected > 10 * population.len()):
+                rejected += 1
     if new_population.len() > population.len():
         new_population.remove_at(-1)
+    if penalty is not None:
+        penalty.update(new_population)
     return new_population
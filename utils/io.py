@@ -2,35 +2,232 @@ from utils.customer import Customer
 from utils.depot import Depot
 from utils.chromosome import Chromosome
 from utils.population import Population
+from utils import encoding as E
 
+import hashlib
 import os
-import re
+import zipfile
+import numpy as np
+
+from typing import List
 
 
 def chromosome_to_file(chromosome: Chromosome, path='chromosome.txt'):
+    """
+    Writes a `Chromosome` as text: a line "id fitness capacity", then for each `Depot` a line "id x y" followed by a
+    line "id x y cost null" for each of its `Customer`s.
+    Note: For compact checkpoints use `population_to_file`, for the format of the result files `chromosome_to_res`.
+    :param chromosome: A `Chromosome`
+    :param path: The output path, created if it does not exist
+    :return: None
+    """
+    lines = [str(chromosome.id) + ' ' + str(chromosome.fitness) + ' ' + str(chromosome.capacity)]
+    for d in chromosome:
+        lines.append(str(d.id) + ' ' + str(d.x) + ' ' + str(d.y))
+        lines.extend([str(c.id) + ' ' + str(c.x) + ' ' + str(c.y) + ' ' + str(c.cost) + ' ' + str(c.null).lower()
+                      for c in d])
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def population_to_file(population, path: str):
+    """
+    Writes a `Population` (or a list of `Chromosome`s or `EncodedChromosome`s) in a compact binary format: the
+    `EncodedChromosome`s packed by `encoding.pack` (int32 giant tours plus route and `Depot` offsets) stored in an
+    uncompressed `.npz` file, see `population_from_file`.
+    :param population: A `Population`, a list of `Chromosome`s whose nodes are indexed by a `DistanceMatrix` or a list
+        of `EncodedChromosome`s
+    :param path: The output path, '.npz' is not appended
+    :return: None
+    """
+    encoded = [ch if isinstance(ch, E.EncodedChromosome) else E.encode(ch) for ch in population]
+    with open(path, 'wb') as file:
+        np.savez(file, **E.pack(encoded))
+
+
+def population_from_file(path: str, nodes: List = None, distances=None, mmap: bool = False):
+    """
+    Reads a `Population` written by `population_to_file`
+    :param path: The path of the file
+    :param nodes: The list of `Depot`s and `Customer`s used to build the `DistanceMatrix` (indexed by `node_index`),
+        if None, the `EncodedChromosome`s are returned without decoding them
+    :param distances: The `DistanceMatrix` to be attached to the decoded `Chromosome`s
+    :param mmap: Whether memory-map the arrays instead of reading them, see `load_npz`
+    :return: A `Population` or a list of `EncodedChromosome`s
+    """
     if not os.path.exists(path):
-        path = 'chromosome.txt'
+        raise Exception('{} does not exists.'.format(path))
+    encoded = E.unpack(load_npz(path, mmap))
+    if nodes is None:
+        return encoded
+    return Population(0, [E.decode(e, nodes, distances) for e in encoded])
 
-    line = str(chromosome.id)+' '+str(chromosome.fitness)+' '+str(chromosome.capacity)+'\n'
-    file = open(path, 'w+')
-    file.write(line)
 
-    for d in chromosome:
-        line = str(d.id)+' '+str(d.x)+' '+str(d.y)+'\n'
-        file.write(line)
-        for c in d:
-            line = str(c.id)+' '+str(c.x)+' '+str(c.y)+' '+str(c.cost)+' '+str(c.null).lower()+'\n'
-            file.write(line)
-    file.close()
+def chromosome_to_res(chromosome: Chromosome, path: str):
+    """
+    Writes a `Chromosome` in the format of the 'p***.res' result files (see `result_loader`): the traveled distance
+    and a line "depot vehicle duration load 0 i j ... 0" per route, where depot is the position of the `Depot` in
+    the `Chromosome` (starting from 1) and duration the length of the route plus its service durations.
+    Note: `Customer`s after the last `null` `Customer` of a `Depot` are not part of any route and not written.
+    :param chromosome: A `Chromosome`
+    :param path: The output path
+    :return: None
+    """
+    lines = ['{:.2f}'.format(chromosome.total_distance())]
+    for k, d in enumerate(chromosome):
+        lengths, loads = d.route_stats(chromosome.distances)
+        for i in range(lengths.__len__()):
+            route = d[d.route_start(i): d.routes_ending_indices[i]]
+            lines.append('{} {} {:.2f} {:g} 0 {} 0'.format(k + 1, i + 1, lengths[i] + d.route_services[i], loads[i],
+                                                          ' '.join([str(c.id) for c in route])))
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def parse_instance(input_path: str) -> dict:
+    """
+    Parses an input file straight into NumPy arrays, the numeric lines are parsed by `np.loadtxt` in one pass each.
+    Note: The first line of the header is "type m n t" (number of vehicles per depot, customers and depots), the
+        depot lines of the header are "D Q" (maximum route duration, 0 if unlimited, and vehicle capacity), customer
+        lines are "i x y d q ..." (service duration and demand) and the depot lines at the end are "i x y ...".
+
+    :param input_path: Path to 'p***' file
+    :return: A dict of arrays: 'header' [type, m, n, t], 'limits' (t x [D, Q]), 'customers' (n x [i, x, y, d, q])
+        and 'depots' (t x [i, x, y])
+    """
+    with open(input_path) as file:
+        input_lines = file.read().split('\n')
+    header = np.array(input_lines[0].split(), dtype=np.int64)
+    customer_count, depot_count = int(header[2]), int(header[3])
+    limits = np.loadtxt(input_lines[1: depot_count + 1], dtype=np.float64, usecols=(0, 1), ndmin=2)
+    nodes = np.loadtxt(input_lines[depot_count + 1: 2 * depot_count + customer_count + 1], dtype=np.float64,
+                       usecols=(0, 1, 2, 3, 4), ndmin=2)
+    return {'header': header, 'limits': limits, 'customers': nodes[:customer_count],
+            'depots': nodes[customer_count:, :3].copy()}
+
+
+def file_key(path: str) -> (int, int):
+    """
+    The cheap part of the cache key of a file: its modification time and size
+    :param path: Path to a file
+    :return: A tuple of (mtime in ns, size in bytes)
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_hash(path: str) -> np.ndarray:
+    """
+    The SHA-1 digest of the content of a file
+    :param path: Path to a file
+    :return: A uint8 array of 20 bytes
+    """
+    with open(path, 'rb') as file:
+        return np.frombuffer(hashlib.sha1(file.read()).digest(), dtype=np.uint8)
+
+
+def cache_path_of(input_path: str, cache_dir: str = None) -> str:
+    """
+    Returns the path of the `.npz` cache of an input file
+    :param input_path: Path to 'p***' file
+    :param cache_dir: The directory of the cache files, if None, the directory of `input_path`
+    :return: A path
+    """
+    if cache_dir is None:
+        cache_dir = os.path.dirname(os.path.abspath(input_path))
+    return os.path.join(cache_dir, os.path.basename(input_path) + '.npz')
 
 
-def single_data_loader(input_path: str, result_path: str) -> (Population, Population):
+def load_npz(path: str, mmap: bool = False) -> dict:
+    """
+    Loads all arrays of an `.npz` file written by `np.savez`.
+    Note: `np.load` ignores `mmap_mode` for `.npz` files, but `np.savez` stores the members uncompressed, so with
+        `mmap` each member is memory-mapped at its offset within the file instead of being read.
+    :param path: Path to `.npz` file
+    :param mmap: Whether memory-map the arrays read-only instead of reading them
+    :return: A dict of NumPy arrays
+    """
+    if not mmap:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as file:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise Exception('{} of {} is compressed and can not be memory-mapped.'.format(info.filename, path))
+            file.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(file.read(4), dtype='<u2')
+            file.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+            version = np.lib.format.read_magic(file)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else \
+                np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(file)
+            if dtype.hasobject or 0 in shape:
+                arrays[info.filename[:-4]] = np.lib.format.read_array(file)
+                continue
+            arrays[info.filename[:-4]] = np.memmap(path, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                                                   order='F' if fortran_order else 'C')
+    return arrays
+
+
+def load_instance(input_path: str, cache_dir: str = None, cache: bool = True, mmap: bool = False) -> dict:
+    """
+    Returns the arrays of an input file parsed by `parse_instance`, using a `.npz` cache written after the first
+    parse.
+    The cache is keyed by the modification time, the size and the SHA-1 hash of the input file: if mtime and size are
+    unchanged, the cache is used right away, otherwise the file is hashed and only parsed again if its content has
+    changed (the cache is rewritten with the new key either way).
+    Note: If the cache can not be written (e.g. read-only directory), the parsed arrays are returned anyway.
+
+    :param input_path: Path to 'p***' file
+    :param cache_dir: The directory of the cache files, see `cache_path_of`
+    :param cache: Whether to use and write the cache at all
+    :param mmap: Whether memory-map the cached arrays instead of reading them, see `load_npz`
+    :return: A dict of arrays, see `parse_instance`
+    """
+    if not os.path.exists(input_path):
+        raise Exception('{} does not exists.'.format(input_path))
+    if not cache:
+        return parse_instance(input_path)
+    path = cache_path_of(input_path, cache_dir)
+    mtime, size = file_key(input_path)
+    digest = None
+    arrays = None
+    if os.path.exists(path):
+        arrays = load_npz(path, mmap)
+        key = arrays.pop('key')
+        if int(key[0]) == mtime and int(key[1]) == size:
+            arrays.pop('digest')
+            return arrays
+        digest = file_hash(input_path)
+        if not np.array_equal(arrays.pop('digest'), digest):
+            arrays = None
+    if arrays is None:  # the key of an unchanged content is refreshed without parsing it again
+        arrays = parse_instance(input_path)
+    if digest is None:
+        digest = file_hash(input_path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as file:
+            np.savez(file, key=np.array([mtime, size], dtype=np.int64), digest=digest, **arrays)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
+    return arrays
+
+
+def single_data_loader(input_path: str, result_path: str, cache_dir: str = None, cache: bool = False) \
+        -> (Population, Population):
     """
     Takes a path to input file with defined structure and create a `Population` regarding that. Also, takes the second
     path to the result file with defined structure and creates a `Population` filled with result values.
+    Note: The file is parsed into arrays by `load_instance` (see `parse_instance` for the structure) and optionally
+        cached, the `Depot`s and `Customer`s are built from the arrays.
 
     :param input_path: Path to 'p***' files as the input
     :param result_path: Path to 'p***.res` files as the result
+    :param cache_dir: The directory of the `.npz` cache files, see `cache_path_of`
+    :param cache: Whether to use and write the `.npz` cache
     :return: A tuple (`Population`: input, `Population`: desired result to be compared)
     """
     if not os.path.exists(input_path):
@@ -38,27 +235,79 @@ def single_data_loader(input_path: str, result_path: str) -> (Population, Popula
     if not os.path.exists(result_path):
         raise Exception('{} does not exists.'.format(result_path))
 
-    input_file = open(input_path)
-    input_lines = input_file.read().split('\n')
-    customer_count = int(input_lines[0].split(' ')[2])
-    depot_count = int(input_lines[0].split(' ')[3])
-    depot_capacities = [float(l.split(' ')[1]) for l in input_lines[1:depot_count + 1]]
-    customers = []
-    for line in input_lines[depot_count + 1: depot_count+customer_count + 1]:
-        line = re.sub(' +', ' ', line)
-        attrs = line.split(' ')
-        if line[0].isspace():
-            attrs = line[1:].split(' ')
-        customer = Customer(int(attrs[0]), float(attrs[1]), float(attrs[2]), float(attrs[4]), False)
-        customers.append(customer)
-
-    depots = []
-    for line, c in zip(input_lines[depot_count+customer_count + 1:], depot_capacities):
-        line = re.sub(' +', ' ', line)
-        attrs = line.split(' ')
-        if line[0].isspace():
-            attrs = line[1:].split(' ')
-        depot = Depot(int(attrs[0]), float(attrs[1]), float(attrs[2]), c)
-        depots.append(depot)
+    return instance_nodes(load_instance(input_path, cache_dir, cache))
+
 
+def instance_nodes(arrays: dict) -> (List[Depot], List[Customer]):
+    """
+    Builds the `Depot`s and `Customer`s of an instance from the arrays of `parse_instance`
+    :param arrays: A dict of arrays, see `parse_instance`
+    :return: A tuple of (list of `Depot`s, list of `Customer`s)
+    """
+    vehicle_count = int(arrays['header'][1])
+    customers = [Customer(int(i), float(x), float(y), float(q), False, service=float(d))
+                 for i, x, y, d, q in arrays['customers'].tolist()]
+    depots = [Depot(int(i), float(x), float(y), q, max_duration=duration, max_vehicles=vehicle_count)
+              for (i, x, y), (duration, q) in zip(arrays['depots'].tolist(), arrays['limits'].tolist())]
     return depots, customers
+
+
+def best_known_cost(result_path: str) -> float:
+    """
+    Reads the best-known cost of an instance which is the first line of its 'p***.res' result file
+    :param result_path: Path to 'p***.res' file
+    :return: A float number
+    """
+    if not os.path.exists(result_path):
+        raise Exception('{} does not exists.'.format(result_path))
+    with open(result_path) as file:
+        return float(file.readline().strip())
+
+
+def result_loader(result_path: str, depots: List[Depot], customers: List[Customer]) -> (float, E.EncodedChromosome):
+    """
+    Parses a 'p***.res' result file into the best-known cost and the best-known solution as `EncodedChromosome`.
+    Note: The first line is the cost and each following line is a route "depot vehicle duration load 0 i j ... 0",
+        where depot is the position of the `Depot` in the input file (starting from 1) and i, j, ... the IDs of the
+        `Customer`s. Some files enclose the route by the ID of the `Depot` instead of 0. The routes are grouped by
+        `Depot` in the order of `depots`.
+
+    :param result_path: Path to 'p***.res' file
+    :param depots: The `Depot`s of the instance, indexed by a `DistanceMatrix`
+    :param customers: The `Customer`s of the instance, indexed by the same `DistanceMatrix`
+    :return: A tuple of (best-known cost, `EncodedChromosome` with the cost as fitness)
+    """
+    if not os.path.exists(result_path):
+        raise Exception('{} does not exists.'.format(result_path))
+    if any([node.node_index is None for node in depots + customers]):
+        raise Exception('Nodes of {} have no "node_index", build a "DistanceMatrix" first.'.format(result_path))
+    with open(result_path) as file:
+        result_lines = [line.split() for line in file.read().split('\n')]
+    cost = float(result_lines[0][0])
+    node_indices = dict([(c.id, c.node_index) for c in customers])
+    routes = [[] for _ in depots]
+    for attrs in result_lines[1:]:
+        if attrs.__len__() == 0:
+            continue
+        depot = int(attrs[0]) - 1
+        if depot < 0 or depot >= depots.__len__():
+            raise Exception('Depot "{}" of {} does not exist.'.format(attrs[0], result_path))
+        routes[depot].append([node_indices[int(i)] for i in attrs[4:] if int(i) not in (0, depots[depot].id)])
+    tour = [i for depot_routes in routes for route in depot_routes for i in route]
+    route_sizes = [route.__len__() for depot_routes in routes for route in depot_routes]
+    route_offsets = np.concatenate([[0], np.cumsum(route_sizes, dtype=np.int64)])
+    depot_offsets = np.concatenate([[0], np.cumsum([depot_routes.__len__() for depot_routes in routes],
+                                                   dtype=np.int64)])
+    return cost, E.EncodedChromosome(0, depots[0].capacity, cost, np.array(tour, dtype=np.int32), route_offsets,
+                                     depot_offsets, [d.node_index for d in depots])
+
+
+def gap(chromosome, best_known: float) -> float:
+    """
+    The relative gap of a solution to the best-known cost in percent, e.g. as a cheap target for early stopping.
+    :param chromosome: A `Chromosome`, whose `total_distance` is used, or a float cost
+    :param best_known: The best-known cost, see `best_known_cost` and `result_loader`
+    :return: A float number, negative if the solution is better than the best-known one
+    """
+    cost = chromosome.total_distance() if isinstance(chromosome, Chromosome) else float(chromosome)
+    return 100 * (cost - best_known) / best_known
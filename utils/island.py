@@ -0,0 +1,189 @@
+from utils.population import Population
+from utils.chromosome import Chromosome
+from utils.distance import DistanceMatrix
+from utils import encoding as E
+from utils import functional as F
+from utils.shared import SharedProblem
+
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import tempfile
+import time
+import traceback
+import numpy as np
+
+from typing import List
+
+
+def migration_targets(islands: int, topology: str, seeds: np.random.SeedSequence, epoch: int) -> List[int]:
+    """
+    Returns the island each island sends its migrants to in a migration epoch.
+    Every island computes the same targets from `seeds` and `epoch`, so each island receives exactly one message.
+
+    :param islands: Number of islands
+    :param topology: 'ring' sends to the next island, 'random' uses a random permutation without fixed points
+    :param seeds: The `np.random.SeedSequence` of the migrations, shared by all islands
+    :param epoch: The number of the migration
+    :return: A list of target island indices
+    """
+    if topology == 'ring' or islands < 3:
+        return [(i + 1) % islands for i in range(islands)]
+    if topology != 'random':
+        raise Exception('Topology "{}" is not supported, use "ring" or "random".'.format(topology))
+    order = np.random.default_rng([epoch] + seeds.generate_state(4).tolist()).permutation(islands)
+    targets = [0] * islands
+    for i in range(islands):
+        targets[order[i]] = int(order[(i + 1) % islands])
+    return targets
+
+
+def evolve_island(island: int, nodes, distances: DistanceMatrix, sample: E.EncodedChromosome,
+                  population_size: int, generations: int, interval: int, migrants: int, topology: str,
+                  seeds: np.random.SeedSequence, migration_seeds: np.random.SeedSequence, inboxes: List, results):
+    """
+    Evolves a single island with `generate_new_population` and exchanges its best `migrants` `Chromosome`s with other
+    islands every `interval` generations. Received migrants replace the worst `Chromosome`s of the island.
+    Runs in its own process and sends either (island, encoded `Population`) or (island, error) to `results`.
+
+    :param island: Index of this island
+    :param nodes: A `shared.SharedProblem` to attach to, or the list of `Depot`s and `Customer`s used to build the
+        `DistanceMatrix`
+    :param distances: The `DistanceMatrix` of the problem if `nodes` is a list
+    :param sample: The sample `Chromosome` of the initial `Population` in encoded form
+    :param population_size: Size of the `Population` of this island
+    :param generations: Number of generations
+    :param interval: Number of generations between two migrations
+    :param migrants: Number of `Chromosome`s sent in each migration
+    :param topology: 'ring' or 'random', see `migration_targets`
+    :param seeds: The `np.random.SeedSequence` of this island
+    :param migration_seeds: The `np.random.SeedSequence` of the migrations, shared by all islands
+    :param inboxes: A queue per island to receive migrants
+    :param results: A queue to send the final encoded `Population` of this island or its error back
+    :return: None
+    """
+    try:
+        if isinstance(nodes, SharedProblem):
+            distances = nodes.distance_matrix()
+            nodes = nodes.nodes()
+        # the operators draw from the module level `random`, which is private to this process
+        random.seed(int(seeds.generate_state(1)[0]))
+        population = F.generate_initial_population(E.decode(sample, nodes, distances), population_size)
+        population.fitness_values()
+        for generation in range(1, generations + 1):
+            population = F.generate_new_population(population)
+            population.fitness_values()
+            if interval > 0 and generation % interval == 0 and inboxes.__len__() > 1:
+                ranked = sorted(population, key=lambda ch: ch.fitness, reverse=True)
+                target = migration_targets(inboxes.__len__(), topology, migration_seeds, generation // interval)[island]
+                inboxes[target].put([E.encode(ch) for ch in ranked[:migrants]])
+                for worst, encoded in zip(reversed(ranked), inboxes[island].get()):
+                    population.remove(worst)
+                    population.add(E.decode(encoded, nodes, distances))
+                population.fitness_values()
+        results.put((island, [E.encode(ch) for ch in population]))
+    except BaseException:
+        results.put((island, traceback.format_exc()))
+
+
+class IslandModel:
+    """
+    Island model GA: `islands` sub-populations evolve independently in their own processes and exchange their best
+    `migrants` `Chromosome`s over a ring or random topology every `interval` generations using queues.
+    Each island gets its own seed spawned from a `np.random.SeedSequence`, the same scheme `OffspringPool` uses, so a
+    run is reproducible for a given `seed`. Same as `OffspringPool`, the islands attach to the problem data published
+    once to a `shared.SharedProblem` if the `DistanceMatrix` has a `SpatialIndex`.
+    """
+
+    def __init__(self, nodes: List, distances: DistanceMatrix, islands: int = 4, population_size: int = 10,
+                 interval: int = 10, migrants: int = 1, topology: str = 'ring', seed: int = 0,
+                 timeout: float = None):
+        """
+        :param nodes: The list of `Depot`s and `Customer`s used to build the `DistanceMatrix`
+        :param distances: The `DistanceMatrix` of the problem
+        :param islands: Number of islands (processes)
+        :param population_size: Size of the `Population` of each island
+        :param interval: Number of generations between two migrations, 0 disables migration
+        :param migrants: Number of `Chromosome`s each island sends in a migration
+        :param topology: 'ring' or 'random'
+        :param seed: The seed of the run
+        :param timeout: Seconds to wait for all islands to finish, if None, waits as long as the islands are alive
+        """
+        if topology not in ['ring', 'random']:
+            raise Exception('Topology "{}" is not supported, use "ring" or "random".'.format(topology))
+        self.nodes = nodes
+        self.distances = distances
+        self.islands = islands
+        self.population_size = population_size
+        self.interval = interval
+        self.migrants = migrants
+        self.topology = topology
+        self.seed = seed
+        self.timeout = timeout
+
+    def run(self, sample: Chromosome, generations: int) -> Population:
+        """
+        Evolves all islands in parallel, each one starting from its own `generate_initial_population` of `sample`.
+
+        :param sample: A `Chromosome` to be cloned and disseminated in search area
+        :param generations: Number of generations
+        :return: A `Population` of all `Chromosome`s of all islands after the last generation
+        """
+        context = multiprocessing.get_context()
+        inboxes = [context.Queue() for _ in range(self.islands)]
+        results = context.Queue()
+        *island_seeds, migration_seeds = np.random.SeedSequence(self.seed).spawn(self.islands + 1)
+        encoded = E.encode(sample)
+        directory = tempfile.mkdtemp(prefix='islands-')
+        problem = (self.nodes, self.distances) if self.distances.spatial is None else \
+            (SharedProblem.publish(self.nodes, self.distances, os.path.join(directory, 'problem.bin')), None)
+        processes = [context.Process(target=evolve_island,
+                                     args=(island, *problem, encoded, self.population_size,
+                                           generations, self.interval, self.migrants, self.topology,
+                                           island_seeds[island], migration_seeds, inboxes, results))
+                     for island in range(self.islands)]
+        for process in processes:
+            process.start()
+        try:
+            final = self.collect(processes, results)
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            shutil.rmtree(directory, ignore_errors=True)
+        population = Population(0)
+        for island in range(self.islands):
+            for e in final[island]:
+                ch = E.decode(e, self.nodes, self.distances)
+                ch.cache_fitness(e.fitness, [100, 0.001])
+                population.add(ch)
+        return population
+
+    def collect(self, processes: List, results) -> dict:
+        """
+        Waits for the encoded `Population` of every island. Fails as soon as an island reports an error, dies without
+        reporting or `timeout` passes, instead of waiting forever for islands blocked on a migration.
+
+        :param processes: The island processes
+        :param results: The queue the islands report to
+        :return: A dict of island index to its encoded `Population`
+        """
+        final = {}
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while final.__len__() < processes.__len__():
+            try:
+                island, result = results.get(timeout=1)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise Exception('Islands did not finish in {} seconds.'.format(self.timeout))
+                for island, process in enumerate(processes):
+                    if island not in final and not process.is_alive() and results.empty():
+                        raise Exception('Island {} exited with code {}.'.format(island, process.exitcode))
+                continue
+            if isinstance(result, str):
+                raise Exception('Island {} failed:\n{}'.format(island, result))
+            final[island] = result
+        return final
@@ -0,0 +1,129 @@
+"""
+Numeric kernels of the hot loops over the array representation, compiled with Numba when it is installed.
+The kernels are plain loops over NumPy arrays, so without Numba they still run (slowly) as Python functions; callers
+only use them if `enabled()` and keep their own pure-Python / NumPy path as the fallback.
+Set the environment variable `MDVRP_BACKEND=python` to disable the compiled backend.
+"""
+import os
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKEND = 'numba' if numba is not None and os.environ.get('MDVRP_BACKEND', 'numba') != 'python' else 'python'
+
+
+def jit(function):
+    """
+    Compiles `function` in nopython mode if Numba is available, the original function stays in `py_func`
+    """
+    if numba is None:
+        function.py_func = function
+        return function
+    return numba.njit(cache=True)(function)
+
+
+def enabled() -> bool:
+    """
+    Whether the compiled backend is used
+    :return: Bool true or false
+    """
+    return BACKEND == 'numba'
+
+
+@jit
+def route_lengths(tour, starts, ends, route_depots, matrix):
+    """
+    Length of each route `tour[starts[r]: ends[r]]` served by `route_depots[r]`, same as `encoding.route_lengths`
+    :return: A float array
+    """
+    lengths = np.zeros(starts.shape[0])
+    for r in range(starts.shape[0]):
+        if ends[r] > starts[r]:
+            previous = route_depots[r]
+            total = 0.0
+            for k in range(starts[r], ends[r]):
+                total += matrix[previous, tour[k]]
+                previous = tour[k]
+            lengths[r] = total + matrix[previous, route_depots[r]]
+    return lengths
+
+
+@jit
+def insertion_scan(nodes, route_ends, lengths, loads, services, depot, customer, demand, service, capacity,
+                   max_duration, matrix):
+    """
+    The position scan of `functional.insert_customer` over a single `Depot`
+    :param nodes: `node_index` of each position of the `Depot`, `null` `Customer`s included
+    :param route_ends: Position of the `null` `Customer` ending each route
+    :param lengths: Length of each route
+    :param loads: Load of each route
+    :param services: Total service duration of each route
+    :param depot: `node_index` of the `Depot`
+    :param customer: `node_index` of the `Customer` to be inserted
+    :param demand: Demand of the `Customer`
+    :param service: Service duration of the `Customer`
+    :param capacity: Capacity of the routes
+    :param max_duration: Maximum duration of the routes, 0 if unlimited
+    :param matrix: The distance matrix
+    :return: A tuple of (route length after the insertion, route index, insert index), (-1, -1) indices if infeasible
+    """
+    best = 99999999.0
+    best_route = -1
+    best_index = -1
+    start = 0
+    for r in range(route_ends.shape[0]):
+        end = route_ends[r]
+        if demand + loads[r] <= capacity:
+            for index in range(start, end + 1):
+                previous = depot if index == start else nodes[index - 1]
+                following = depot if index == end else nodes[index]
+                cost = lengths[r] + (matrix[previous, customer] + matrix[customer, following] -
+                                     matrix[previous, following])
+                if best > cost and (max_duration <= 0 or cost + services[r] + service <= max_duration):
+                    best = cost
+                    best_route = r
+                    best_index = index
+        start = end + 1
+    return best, best_route, best_index
+
+
+@jit
+def greedy_breaks(nodes, demands, services, capacity, depot, max_duration, matrix):
+    """
+    The capacity and duration accumulation of `functional.initial_routing`
+    :param nodes: `node_index` of each position of the `Depot` (only read if `max_duration` is set)
+    :param demands: Demand of each position of the `Depot`
+    :param services: Service duration of each position of the `Depot`
+    :param capacity: Capacity of the routes
+    :param depot: `node_index` of the `Depot`
+    :param max_duration: Maximum duration of the routes, 0 if unlimited
+    :param matrix: The distance matrix (only read if `max_duration` is set)
+    :return: An int array of the positions a `null` `Customer` is inserted before
+    """
+    breaks = np.empty(demands.shape[0], dtype=np.int64)
+    count = 0
+    accumulated = 0.0
+    accumulated_duration = 0.0
+    duration = 0.0
+    previous = depot
+    empty = True
+    for k in range(demands.shape[0]):
+        split = accumulated + demands[k] > capacity
+        if max_duration > 0:
+            duration = accumulated_duration + matrix[previous, nodes[k]] + services[k]
+            if not empty and duration + matrix[nodes[k], depot] > max_duration:
+                split = True
+        if split:
+            breaks[count] = k
+            count += 1
+            accumulated = 0.0
+            if max_duration > 0:
+                duration = matrix[depot, nodes[k]] + services[k]
+        accumulated += demands[k]
+        accumulated_duration = duration
+        previous = nodes[k]
+        empty = False
+    return breaks[:count]
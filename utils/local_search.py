@@ -0,0 +1,276 @@
+from utils.customer import Customer
+from utils.chromosome import Chromosome
+
+import time
+import numpy as np
+
+from typing import List
+
+EPSILON = 1e-9
+
+
+class RouteState:
+    """
+    The closed routes of a `Chromosome` as lists of `node_index`s which the moves of `educate` work on.
+    Keeps the load of each route and the position of each `Customer`, so every move is checked with an O(1) delta.
+    """
+
+    def __init__(self, chromosome: Chromosome, neighbour_count: int):
+        """
+        :param chromosome: A `Chromosome` whose nodes have been indexed by its `DistanceMatrix`
+        :param neighbour_count: Number of nearest neighbours each `Customer` is tried to be moved next to
+        """
+        distances = chromosome.distances
+        self.rows = distances.rows if distances.rows is not None else distances.matrix
+        self.demands = distances.demands.tolist()
+        self.services = distances.services.tolist()
+        self.capacity = chromosome.capacity
+        self.routes = []
+        self.route_depots = []
+        self.route_owners = []
+        self.limits = []
+        self.customers = {}
+        for k, depot in enumerate(chromosome):
+            route = []
+            for c in depot:
+                if c.null:
+                    self.routes.append(route)
+                    self.route_depots.append(depot.node_index)
+                    self.route_owners.append(k)
+                    self.limits.append(depot.max_duration)
+                    route = []
+                else:
+                    route.append(c.node_index)
+                    self.customers[c.node_index] = c
+        self.loads = [sum([self.demands[u] for u in route]) for route in self.routes]
+        self.durations = [sum([self.services[u] for u in route]) for route in self.routes]
+        self.lengths = [sum([self.d(self.node(r, i - 1), self.node(r, i)) for i in range(route.__len__() + 1)])
+                        for r, route in enumerate(self.routes)]
+        self.where = {}
+        for r in range(self.routes.__len__()):
+            self.locate(r)
+        self.neighbours = self.neighbour_lists(chromosome, neighbour_count)
+        self.changed = set()
+
+    def neighbour_lists(self, chromosome: Chromosome, k: int) -> dict:
+        """
+        The `k` nearest routed `Customer`s of each routed `Customer`, from the `SpatialIndex` if available
+        """
+        routed = sorted(self.where.keys())
+        spatial = chromosome.distances.spatial
+        if spatial is not None:
+            return dict([(u, [v for v in spatial.neighbours[u][:k] if v in self.where]) for u in routed])
+        if routed.__len__() == 0:
+            return {}
+        indices = np.array(routed, dtype=np.int64)
+        order = np.argsort(np.asarray(chromosome.distances[indices[:, None], indices[None, :]]), axis=1, kind='stable')
+        return dict([(u, [routed[j] for j in order[i] if routed[j] != u][:k]) for i, u in enumerate(routed)])
+
+    def locate(self, r: int):
+        """
+        Updates the positions of the `Customer`s of route `r`
+        """
+        for i, u in enumerate(self.routes[r]):
+            self.where[u] = (r, i)
+
+    def d(self, a: int, b: int) -> float:
+        return self.rows[a][b]
+
+    def fits(self, r: int, length: float, service: float) -> bool:
+        """
+        Checks the duration of route `r` if its length and total service duration changed by the given amounts
+        """
+        return self.limits[r] <= 0 or self.lengths[r] + length + self.durations[r] + service <= self.limits[r]
+
+    def node(self, r: int, i: int) -> int:
+        """
+        The node at position `i` of route `r` where positions out of the route are its `Depot`
+        """
+        route = self.routes[r]
+        return route[i] if 0 <= i < route.__len__() else self.route_depots[r]
+
+    def relocate(self, u: int, v: int) -> bool:
+        """
+        Moves `u` right before or right after `v` if it shortens the routes
+        """
+        r, i = self.where[u]
+        s, j = self.where[v]
+        if r != s and self.loads[s] + self.demands[u] > self.capacity:
+            return False
+        gain = self.d(self.node(r, i - 1), u) + self.d(u, self.node(r, i + 1)) - \
+            self.d(self.node(r, i - 1), self.node(r, i + 1))
+        for k in [j, j + 1]:
+            if r == s and (k == i or k == i + 1):
+                continue
+            a, b = self.node(s, k - 1), self.node(s, k)
+            cost = self.d(a, u) + self.d(u, b) - self.d(a, b)
+            if cost - gain < -EPSILON and (r == s or self.fits(s, cost, self.services[u])):
+                del self.routes[r][i]
+                if r == s and k > i:
+                    k -= 1
+                self.routes[s].insert(k, u)
+                self.loads[r] -= self.demands[u]
+                self.loads[s] += self.demands[u]
+                self.durations[r] -= self.services[u]
+                self.durations[s] += self.services[u]
+                self.lengths[r] -= gain
+                self.lengths[s] += cost
+                self.applied(r, s)
+                return True
+        return False
+
+    def swap(self, u: int, v: int) -> bool:
+        """
+        Exchanges `u` and `v` if it shortens the routes
+        """
+        r, i = self.where[u]
+        s, j = self.where[v]
+        if r == s and abs(i - j) < 2:
+            return False
+        if r != s and (self.loads[r] - self.demands[u] + self.demands[v] > self.capacity or
+                       self.loads[s] - self.demands[v] + self.demands[u] > self.capacity):
+            return False
+        pu, nu, pv, nv = self.node(r, i - 1), self.node(r, i + 1), self.node(s, j - 1), self.node(s, j + 1)
+        delta_r = self.d(pu, v) + self.d(v, nu) - self.d(pu, u) - self.d(u, nu)
+        delta_s = self.d(pv, u) + self.d(u, nv) - self.d(pv, v) - self.d(v, nv)
+        if delta_r + delta_s >= -EPSILON:
+            return False
+        service = self.services[v] - self.services[u]
+        if r != s and not (self.fits(r, delta_r, service) and self.fits(s, delta_s, -service)):
+            return False
+        self.routes[r][i], self.routes[s][j] = v, u
+        self.loads[r] += self.demands[v] - self.demands[u]
+        self.loads[s] += self.demands[u] - self.demands[v]
+        self.durations[r] += service
+        self.durations[s] -= service
+        self.lengths[r] += delta_r
+        self.lengths[s] += delta_s
+        self.applied(r, s)
+        return True
+
+    def two_opt(self, u: int, v: int) -> bool:
+        """
+        Reverses the part of a route between `u` and `v` so they become adjacent if it shortens the route
+        """
+        r, i = self.where[u]
+        s, j = self.where[v]
+        if r != s or i == j:
+            return False
+        a, b = min(i, j), max(i, j)
+        x, y, nx, ny = self.node(r, a), self.node(r, b), self.node(r, a + 1), self.node(r, b + 1)
+        delta = self.d(x, y) + self.d(nx, ny) - self.d(x, nx) - self.d(y, ny)
+        if delta >= -EPSILON:
+            return False
+        self.lengths[r] += delta
+        route = self.routes[r]
+        route[a + 1: b + 1] = route[a + 1: b + 1][::-1]
+        self.applied(r, r)
+        return True
+
+    def or_opt(self, u: int, v: int, length: int) -> bool:
+        """
+        Moves the `length` `Customer`s starting at `u` right after `v` if it shortens the routes
+        """
+        r, i = self.where[u]
+        s, j = self.where[v]
+        route = self.routes[r]
+        if i + length > route.__len__() or (r == s and i - 1 <= j < i + length):
+            return False
+        segment = route[i: i + length]
+        load = sum([self.demands[w] for w in segment])
+        if r != s and self.loads[s] + load > self.capacity:
+            return False
+        p, n = self.node(r, i - 1), self.node(r, i + length)
+        a, b = v, self.node(s, j + 1)
+        gain = self.d(p, segment[0]) + self.d(segment[-1], n) - self.d(p, n)
+        cost = self.d(a, segment[0]) + self.d(segment[-1], b) - self.d(a, b)
+        service = sum([self.services[w] for w in segment])
+        inner = sum([self.d(segment[k - 1], segment[k]) for k in range(1, length)])  # moves along with the segment
+        if cost - gain >= -EPSILON or (r != s and not self.fits(s, cost + inner, service)):
+            return False
+        del route[i: i + length]
+        if r == s and j > i:
+            j -= length
+        self.routes[s][j + 1: j + 1] = segment
+        self.loads[r] -= load
+        self.loads[s] += load
+        self.durations[r] -= service
+        self.durations[s] += service
+        self.lengths[r] -= gain + inner
+        self.lengths[s] += cost + inner
+        self.applied(r, s)
+        return True
+
+    def applied(self, r: int, s: int):
+        self.locate(r)
+        self.locate(s)
+        self.changed.add(self.route_owners[r])
+        self.changed.add(self.route_owners[s])
+
+    def write_back(self, chromosome: Chromosome):
+        """
+        Replaces the closed routes of the modified `Depot`s by the improved ones, emptied routes are dropped.
+        `Customer`s of an open last route stay at the end of their `Depot`.
+        """
+        for k in sorted(self.changed):
+            depot = chromosome[k]
+            separators = [c for c in depot if c.null]
+            last = depot.routes_ending_indices[-1] if depot.routes_ending_indices.__len__() > 0 else -1
+            tail = depot.depot_customers[last + 1:]
+            customers = []
+            for r in range(self.routes.__len__()):
+                if self.route_owners[r] == k and self.routes[r].__len__() > 0:
+                    customers.extend([self.customers[u] for u in self.routes[r]])
+                    customers.append(separators.pop(0) if separators.__len__() > 0 else
+                                     Customer(999, depot.x, depot.y, 0, True, depot.node_index))
+            depot.own()
+            depot.depot_customers = customers + tail
+            depot.reindex()
+
+
+def educate(chromosome: Chromosome, max_moves: int = 1000, time_limit: float = None, neighbour_count: int = 8,
+            operators: List[str] = None) -> int:
+    """
+    Improves the routes of a `Chromosome` in place by local search (education) with first-improvement moves:
+    intra-route 2-opt, or-opt (moving 2 or 3 consecutive `Customer`s) and relocate, plus swap and relocate between
+    routes of the same or different `Depot`s. Each `Customer` is only moved next to its `neighbour_count` nearest
+    neighbours, and each move is evaluated with an O(1) delta cost regarding the capacity and duration constraints
+    (the length, load and service duration of each route are maintained).
+
+    Note: Only closed routes are improved, `Customer`s after the last `null` `Customer` of a `Depot` are kept as is.
+
+    :param chromosome: A `Chromosome` whose nodes have been indexed by its `DistanceMatrix`
+    :param max_moves: Maximum number of moves applied
+    :param time_limit: Maximum number of seconds spent, if None, not limited
+    :param neighbour_count: Number of nearest neighbours each `Customer` is tried to be moved next to
+    :param operators: Names of the moves to use among 'relocate', 'swap', '2-opt' and 'or-opt', if None, all
+    :return: Number of moves applied
+    """
+    if chromosome.distances is None:
+        raise Exception('Chromosome "{}" has no "DistanceMatrix", local search needs one.'.format(chromosome.id))
+    if operators is None:
+        operators = ['relocate', 'swap', '2-opt', 'or-opt']
+    state = RouteState(chromosome, neighbour_count)
+    moves = {
+        'relocate': [state.relocate],
+        'swap': [state.swap],
+        '2-opt': [state.two_opt],
+        'or-opt': [lambda u, v: state.or_opt(u, v, 2), lambda u, v: state.or_opt(u, v, 3)],
+    }
+    operations = [move for name in operators for move in moves[name]]
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    applied = 0
+    improved = True
+    while improved and applied < max_moves:
+        improved = False
+        for u in list(state.where.keys()):
+            if applied >= max_moves or (deadline is not None and time.perf_counter() > deadline):
+                improved = False
+                break
+            for v in state.neighbours[u]:
+                if any(operation(u, v) for operation in operations):
+                    applied += 1
+                    improved = True
+                    break
+    state.write_back(chromosome)
+    return applied
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+
+class FitnessMemo:
+    """
+    A bounded least-recently-used memo of fitness values keyed by `encoding.canonical_hash`, so a solution which shows
+    up again (e.g. a clone of the elite produced by `cross_over`) is not scored again, even as a different
+    `Chromosome` with reordered or reversed routes.
+    Note: A memo is valid for a single problem instance, the `DistanceMatrix` is not part of the key.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        """
+        :param capacity: Maximum number of memorized fitness values, the least recently used one is evicted first
+        """
+        if capacity < 1:
+            raise Exception('The capacity of a "FitnessMemo" must be positive, got {}.'.format(capacity))
+        self.capacity = capacity
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(digest: bytes, weight, penalty=None) -> tuple:
+        """
+        The key of a fitness value: the canonical hash of the solution and the weights it has been computed with
+        :param digest: The canonical hash of the solution, see `encoding.canonical_hash`
+        :param weight: A list of two weights [w1, w2]
+        :param penalty: A list of three penalty weights [p1, p2, p3] or None
+        :return: A tuple
+        """
+        return digest, tuple(weight), None if penalty is None else tuple(penalty)
+
+    def get(self, key: tuple) -> float:
+        """
+        Looks a fitness value up and marks it as the most recently used one
+        :param key: A key created by `key`
+        :return: A float number or None if it is not memorized
+        """
+        value = self.values.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.values.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple, value: float):
+        """
+        Memorizes a fitness value, evicting the least recently used one if the memo is full
+        :param key: A key created by `key`
+        :param value: The fitness value
+        :return: None
+        """
+        self.values[key] = value
+        self.values.move_to_end(key)
+        if self.values.__len__() > self.capacity:
+            self.values.popitem(last=False)
+            self.evictions += 1
+
+    def len(self) -> int:
+        """
+        Number of memorized fitness values
+        :return: An int number
+        """
+        return self.values.__len__()
+
+    def info(self) -> dict:
+        """
+        Reports how many lookups have been answered from the memo, same as `Chromosome.cache_info`
+        :return: A dict of hits, misses, hit rate, evictions and size
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total > 0 else 0.0,
+                'evictions': self.evictions, 'size': self.len()}
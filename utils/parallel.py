@@ -0,0 +1,171 @@
+from utils.population import Population
+from utils.distance import DistanceMatrix
+from utils import encoding as E
+from utils import functional as F
+from utils.shared import SharedProblem, publish, attach
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random
+import shutil
+import tempfile
+import numpy as np
+
+from typing import List
+
+# problem data of the instance, set up once in each worker process by `initialize_worker`
+worker_nodes = None
+worker_distances = None
+
+
+def initialize_worker(nodes, distances: DistanceMatrix = None):
+    """
+    Stores the problem data in the worker process, so tasks only carry their share and seed
+    :param nodes: A `shared.SharedProblem` to attach to, or the list of `Depot`s and `Customer`s used to build the
+        `DistanceMatrix`
+    :param distances: The `DistanceMatrix` of the problem if `nodes` is a list
+    :return: None
+    """
+    global worker_nodes, worker_distances
+    if isinstance(nodes, SharedProblem):
+        distances = nodes.distance_matrix()
+        nodes = nodes.nodes()
+    worker_nodes = nodes
+    worker_distances = distances
+
+
+def produce_offspring(path: str, layout: list, pairs: int, seed: int, weight) -> dict:
+    """
+    Produces `pairs` offspring pairs by `tournament` + `cross_over` over the parents published at `path` in a worker
+    process and evaluates them.
+
+    :param path: The file the parent `Population` was published to by `publish`
+    :param layout: The layout of the file
+    :param pairs: Number of offspring pairs to be produced
+    :param seed: The seed of the random stream of this task
+    :param weight: A list of two weights [w1, w2] used to evaluate offspring
+    :return: `2 * pairs` evaluated offspring packed by `encoding.pack`
+    """
+    random.seed(seed)
+    parents = E.unpack(attach(path, layout))
+    population = Population(0, [E.decode(e, worker_nodes, worker_distances) for e in parents])
+    offspring = []
+    for _ in range(pairs):
+        crossed_parents, _, _ = F.cross_over(F.tournament(population, 0.8, population.len()))
+        for ch in crossed_parents:
+            ch.fitness_value(weight)
+            offspring.append(E.encode(ch))
+    return E.pack(offspring)
+
+
+class OffspringPool:
+    """
+    A process pool producing and evaluating the offspring of a generation in parallel.
+    The problem data is published once to a `shared.SharedProblem` which the workers attach to when the pool starts
+    (if the `DistanceMatrix` has no `SpatialIndex`, it is sent to each worker pickled instead). The parent `Population`
+    of a generation is packed and published once to a file which the workers map, so each task only carries its share
+    and its seed, and the offspring come back packed. Seeds are spawned from a `np.random.SeedSequence`, so a run is
+    reproducible for a given `seed` and number of `workers`.
+    """
+
+    def __init__(self, nodes: List, distances: DistanceMatrix, workers: int = None, seed: int = None, weight=None):
+        """
+        :param nodes: The list of `Depot`s and `Customer`s used to build the `DistanceMatrix`
+        :param distances: The `DistanceMatrix` of the problem
+        :param workers: Number of worker processes, if None, number of CPUs
+        :param seed: The seed of the whole run
+        :param weight: A list of two weights [w1, w2] used to evaluate offspring, same as `Chromosome.fitness_value`
+        """
+        if weight is None:
+            weight = [100, 0.001]
+        if workers is None:
+            workers = os.cpu_count()
+        self.nodes = nodes
+        self.distances = distances
+        self.workers = workers
+        self.weight = weight
+        self.seeds = np.random.SeedSequence(seed)
+        self.generation = 0
+        self.directory = tempfile.mkdtemp(prefix='offspring-')
+        if distances.spatial is not None:
+            problem = SharedProblem.publish(nodes, distances, os.path.join(self.directory, 'problem.bin'))
+            self.executor = ProcessPoolExecutor(workers, initializer=initialize_worker, initargs=(problem,))
+        else:
+            self.executor = ProcessPoolExecutor(workers, initializer=initialize_worker, initargs=(nodes, distances))
+
+    def step(self, parents: List[E.EncodedChromosome]) -> List[E.EncodedChromosome]:
+        """
+        Evolves one generation without leaving the encoded form: the fittest parent survives and the rest is filled
+        with offspring produced by the workers.
+
+        :param parents: The evaluated parent `Population` in its encoded form
+        :return: The evaluated new `Population` in its encoded form
+        """
+        elite = parents[int(np.argmax([e.fitness for e in parents]))]
+        pairs = parents.__len__() // 2
+        shares = [pairs // self.workers + (1 if i < pairs % self.workers else 0) for i in range(self.workers)]
+        seeds = [int(s.generate_state(1)[0]) for s in self.seeds.spawn(self.workers)]
+        path = os.path.join(self.directory, 'generation-{}.bin'.format(self.generation))
+        self.generation += 1
+        layout = publish(E.pack(parents), path)
+        try:
+            tasks = [self.executor.submit(produce_offspring, path, layout, share, seed, self.weight)
+                     for share, seed in zip(shares, seeds) if share > 0]
+            offspring = [elite]
+            for task in tasks:
+                offspring.extend(E.unpack(task.result()))
+        finally:
+            os.remove(path)
+        return offspring[:parents.__len__()]
+
+    def evolve(self, population: Population, generations: int) -> Population:
+        """
+        Runs `generations` generations keeping the `Population` encoded in between, so it is decoded only once at the
+        end.
+
+        :param population: An initialized instance of `Population`
+        :param generations: Number of generations
+        :return: An evolved instance of `Population` with evaluated `Chromosome`s
+        """
+        population.fitness_values(self.weight, self.distances)
+        encoded = [E.encode(ch) for ch in population]
+        for _ in range(generations):
+            encoded = self.step(encoded)
+        return Population(population.id, self.decode(encoded))
+
+    def generate_new_population(self, population: Population) -> Population:
+        """
+        Generates new `Population` the same way as `functional.generate_new_population` does, but offspring pairs are
+        split between workers.
+
+        :param population: An initialized instance of`Population`
+        :return: An evolved instance `Population`
+        """
+        return self.evolve(population, 1)
+
+    def decode(self, encoded: List[E.EncodedChromosome]) -> list:
+        """
+        Decodes evaluated `EncodedChromosome`s keeping their fitness cached
+        :param encoded: A list of `EncodedChromosome`s
+        :return: A list of `Chromosome`s
+        """
+        chromosomes = []
+        for e in encoded:
+            ch = E.decode(e, self.nodes, self.distances)
+            ch.cache_fitness(e.fitness, self.weight)
+            chromosomes.append(ch)
+        return chromosomes
+
+    def close(self):
+        """
+        Shuts the worker processes down
+        :return: None
+        """
+        self.executor.shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,58 @@
+from utils.population import Population
+
+from typing import List
+
+
+class AdaptivePenalty:
+    """
+    Penalty weights of the capacity, duration and fleet violations added to the fitness by `Chromosome.fitness_value`,
+    so infeasible `Chromosome`s take part in the evolution at a cost instead of being rejected.
+    After each generation `update` adapts every weight to the share of the `Population` satisfying its constraint:
+    if fewer than `target` do, the weight is increased, if more do, it is decreased.
+    """
+
+    def __init__(self, capacity: float = 100.0, duration: float = 100.0, fleet: float = 1000.0, target: float = 0.2,
+                 increase: float = 1.2, decrease: float = 0.85, minimum: float = 0.1, maximum: float = 100000.0):
+        """
+        :param capacity: The initial weight of one unit of load over the capacity of a route
+        :param duration: The initial weight of one unit of duration over the maximum duration of a route
+        :param fleet: The initial weight of one route over the number of vehicles of a `Depot`
+        :param target: The desired share of `Chromosome`s satisfying each constraint
+        :param increase: The factor a weight is multiplied by if too few `Chromosome`s satisfy its constraint
+        :param decrease: The factor a weight is multiplied by if too many `Chromosome`s satisfy its constraint
+        :param minimum: The lower bound of the weights
+        :param maximum: The upper bound of the weights
+        """
+        self.weights = [capacity, duration, fleet]
+        self.target = target
+        self.increase = increase
+        self.decrease = decrease
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def feasible_shares(self, population: Population) -> List[float]:
+        """
+        The share of `Chromosome`s satisfying the capacity, the duration and the fleet constraint
+        :param population: An instance of `Population` class
+        :return: A list of three float numbers
+        """
+        counts = [0, 0, 0]
+        for ch in population:
+            for i, violation in enumerate(ch.violations()):
+                if violation <= 0:
+                    counts[i] += 1
+        return [count / population.len() for count in counts] if population.len() > 0 else [1.0, 1.0, 1.0]
+
+    def update(self, population: Population) -> List[float]:
+        """
+        Adapts the weights to the feasibility of the given `Population`, the weights of constraints satisfied by
+        `target` (+- 0.05) of the `Chromosome`s are kept.
+        :param population: An instance of `Population` class
+        :return: The new weights
+        """
+        for i, share in enumerate(self.feasible_shares(population)):
+            if share < self.target - 0.05:
+                self.weights[i] = min(self.maximum, self.weights[i] * self.increase)
+            elif share > self.target + 0.05:
+                self.weights[i] = max(self.minimum, self.weights[i] * self.decrease)
+        return self.weights
@@ -1,7 +1,11 @@
 from utils.chromosome import Chromosome
+from utils.distance import DistanceMatrix
+from utils import encoding as E
 
 from typing import List
-from copy import deepcopy
+import numpy as np
+
+DUPLICATES = ['reject', 'penalize']
 
 
 class Population:
@@ -9,16 +13,33 @@ class Population:
     A List of `Chromosome`s as a population represents different sizes.
     """
 
-    def __init__(self, id: int, chromosomes: List[Chromosome] = None):
+    def __init__(self, id: int, chromosomes: List[Chromosome] = None, duplicates: str = None,
+                 duplicate_penalty: float = 1000.0):
         """
 
         :param id: Unique int ID for demonstration purposes
         :param chromosomes: A `List` of `Chromosome`s
+        :param duplicates: How `Chromosome`s representing the same solution as one in the `Population` (same
+            `encoding.canonical_hash`) are handled on insertion: 'reject' does not add them, 'penalize' adds them but
+            `fitness_values` adds `duplicate_penalty` to their fitness, None allows them (the default)
+        :param duplicate_penalty: The value added to the fitness of each duplicate if `duplicates` is 'penalize'
         """
         if chromosomes is None:
             chromosomes = []
+        if duplicates is not None and duplicates not in DUPLICATES:
+            raise Exception('Duplicates "{}" is not supported, use one of {} or None.'.format(duplicates, DUPLICATES))
         self.id = id
-        self.chromosomes = chromosomes
+        self.duplicates = duplicates
+        self.duplicate_penalty = duplicate_penalty
+        # canonical hash of each tracked `Chromosome` by `id` and number of `Chromosome`s of each hash
+        self.hashes = {}
+        self.counts = {}
+        if duplicates is None:
+            self.chromosomes = chromosomes
+        else:
+            self.chromosomes = []
+            for chromosome in chromosomes:
+                self.add(chromosome)
         self.size = self.chromosomes.__len__()
 
     def len(self) -> int:
@@ -28,20 +49,163 @@ class Population:
         """
         return self.chromosomes.__len__()
 
+    def fitness_values(self, weight=None, distances: DistanceMatrix = None, penalty=None, memo=None) -> np.ndarray:
+        """
+        Evaluates all `Chromosome`s of the `Population` in one vectorized pass over their `EncodedChromosome` form
+        using `encoding.batch_fitness` and stores the result in the `fitness` of each `Chromosome` as well.
+        Note: `Chromosome`s which have a valid cached fitness value for `weight` are not re-scored, the ones with nodes
+            missing from the `DistanceMatrix` are scored by `Chromosome.fitness_value`.
+        Note: Penalized fitness values (see `penalty.AdaptivePenalty`) are computed by `Chromosome.fitness_value`
+            which reuses the violations cached per route instead of the batch evaluation.
+        Note: With `duplicates` set to 'penalize', `duplicate_penalty` is added to the returned fitness of every
+            `Chromosome` but the first of the same solution (the cached fitness of the `Chromosome`s stays unpenalized).
+
+        :param weight: A list of two weights [w1, w2], same as `Chromosome.fitness_value`
+        :param distances: The `DistanceMatrix` of the problem, if None, the one of the first `Chromosome` is used
+        :param penalty: A list of three penalty weights [p1, p2, p3], same as `Chromosome.fitness_value`, or None
+        :param memo: An optional `memo.FitnessMemo` looked up by canonical hash before scoring a `Chromosome`, the
+            scored fitness values are memorized in it
+        :return: A float array with the fitness of each `Chromosome` in order
+        """
+        if weight is None:
+            weight = [100, 0.001]
+        fitness = np.array([ch.cached_fitness(weight, penalty) for ch in self], dtype=np.float64)
+        dirty = np.flatnonzero(np.isnan(fitness))
+        Chromosome.cache_hits += self.len() - dirty.__len__()
+        if dirty.__len__() == 0:
+            return self.penalize_duplicates(fitness)
+        encoded = {}
+        keys = {}
+        copies = {}
+        if memo is not None:
+            scored = {}  # the first dirty `Chromosome` of each solution missing from the memo
+            for i in dirty:
+                if E.encodable(self.chromosomes[i]):
+                    encoded[i] = E.encode(self.chromosomes[i])
+                    key = memo.key(E.canonical_hash(encoded[i]), weight, penalty)
+                    if key in scored:
+                        copies[i] = scored[key]
+                        memo.hits += 1
+                        continue
+                    value = memo.get(key)
+                    if value is None:
+                        keys[i] = key
+                        scored[key] = i
+                    else:
+                        fitness[i] = value
+            dirty = np.array([i for i in dirty if i not in copies and np.isnan(fitness[i])], dtype=np.int64)
+        if distances is None:
+            distances = self.chromosomes[0].distances
+        batch = [i for i in dirty if penalty is None and distances is not None and E.encodable(self.chromosomes[i])]
+        batched = set(batch)
+        for i in dirty:
+            if i not in batched:  # nodes which are not in a `DistanceMatrix` are scored one by one
+                fitness[i] = self.chromosomes[i].fitness_value(weight, penalty)
+        if batch.__len__() > 0:
+            Chromosome.cache_misses += batch.__len__()
+            fitness[batch] = E.batch_fitness([encoded[i] if i in encoded else E.encode(self.chromosomes[i])
+                                              for i in batch], distances, weight)
+        for i, key in keys.items():
+            memo.put(key, float(fitness[i]))
+        for i, first in copies.items():
+            fitness[i] = fitness[first]
+        for i in range(self.len()):
+            self.chromosomes[i].cache_fitness(float(fitness[i]), weight, penalty)
+        return self.penalize_duplicates(fitness)
+
+    def penalize_duplicates(self, fitness: np.ndarray) -> np.ndarray:
+        """
+        Adds `duplicate_penalty` to the fitness of the duplicates marked by `duplicate_mask` if `duplicates` is
+        'penalize'
+        :param fitness: A float array with the fitness of each `Chromosome` in order
+        :return: The penalized float array
+        """
+        if self.duplicates == 'penalize':
+            fitness += self.duplicate_penalty * self.duplicate_mask()
+        return fitness
+
+    def canonical_hash(self, chromosome: Chromosome) -> bytes:
+        """
+        The canonical hash duplicates are detected by, see `encoding.canonical_hash`
+        :param chromosome: A `Chromosome` class instance
+        :return: A bytes digest, or None if the nodes of the `Chromosome` have no `node_index`
+        """
+        return E.canonical_hash(E.encode(chromosome)) if E.encodable(chromosome) else None
+
+    def is_duplicate(self, chromosome: Chromosome, key: bytes = None) -> bool:
+        """
+        Checks whether the `Population` already has a `Chromosome` representing the same solution
+        Note: Only `Chromosome`s inserted while `duplicates` is set are tracked.
+        :param chromosome: A `Chromosome` class instance
+        :param key: The canonical hash of `chromosome` if already computed
+        :return: Bool true or false
+        """
+        if key is None:
+            key = self.canonical_hash(chromosome)
+        return key is not None and self.counts.get(key, 0) > 0
+
+    def duplicate_mask(self) -> np.ndarray:
+        """
+        Marks every `Chromosome` which represents the same solution as an earlier one of the `Population`
+        :return: A bool array with the size of the `Population`
+        """
+        seen = set()
+        mask = np.zeros(self.len(), dtype=bool)
+        for i, ch in enumerate(self.chromosomes):
+            key = self.hashes.get(id(ch))
+            if key is not None:
+                mask[i] = key in seen
+                seen.add(key)
+        return mask
+
+    def track(self, chromosome: Chromosome, force: bool = False) -> bool:
+        """
+        Registers the canonical hash of a `Chromosome` being inserted regarding `duplicates`
+        :param chromosome: A `Chromosome` class instance
+        :param force: If True, a duplicate is registered even if `duplicates` is 'reject'
+        :return: Bool false if the `Chromosome` is rejected, else true
+        """
+        if self.duplicates is None:
+            return True
+        key = self.canonical_hash(chromosome)
+        if key is None:
+            return True
+        if self.duplicates == 'reject' and not force and self.counts.get(key, 0) > 0:
+            return False
+        self.hashes[id(chromosome)] = key
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return True
+
+    def untrack(self, chromosome: Chromosome):
+        """
+        Unregisters the canonical hash of a `Chromosome` being removed
+        :param chromosome: A `Chromosome` class instance
+        :return: None
+        """
+        key = self.hashes.pop(id(chromosome), None)
+        if key is not None:
+            self.counts[key] -= 1
+            if self.counts[key] == 0:
+                del self.counts[key]
+
     def get_all(self) -> List[Chromosome]:
         """
-        Returns all `Chromosome`s as a list independently using deep copy
+        Returns all `Chromosome`s as a list independently using copy-on-write `Chromosome.clone`
         :return: A list
         """
-        return deepcopy(self.chromosomes)
+        return [ch.clone() for ch in self.chromosomes]
 
-    def add(self, chromosome: Chromosome):
+    def add(self, chromosome: Chromosome, force: bool = False) -> bool:
         """
         Adds a `Chromosome` to the `Population`
         :param chromosome: `Chromosome` class instance
-        :return: None
+        :param force: If True, a duplicate is added even if `duplicates` is 'reject'
+        :return: bool, if the `Chromosome` is rejected as a duplicate returns False, else True
         """
+        if not self.track(chromosome, force):
+            return False
         self.chromosomes.append(chromosome)
+        return True
 
     def clear(self):
         """
@@ -49,6 +213,8 @@ class Population:
         :return: None
         """
         self.chromosomes.clear()
+        self.hashes.clear()
+        self.counts.clear()
 
     def contains(self, chromosome: Chromosome) -> bool:
         """
@@ -73,14 +239,32 @@ class Population:
         """
         return self.chromosomes.index(chromosome)
 
-    def insert(self, index: int, chromosome: Chromosome):
+    def insert(self, index: int, chromosome: Chromosome) -> bool:
         """
         Inserts a new `Chromosome` at a specific `index`
         :param index: The index of insertion
         :param chromosome: A `Chromosome` class instance
-        :return: None
+        :return: bool, if the `Chromosome` is rejected as a duplicate returns False, else True
+        """
+        if not self.track(chromosome):
+            return False
+        self.chromosomes.insert(index, chromosome)
+        return True
+
+    def replace_at(self, index: int, chromosome: Chromosome) -> bool:
+        """
+        Replaces the `Chromosome` at `index` in place
+        :param index: an int number
+        :param chromosome: A `Chromosome` class instance
+        :return: bool, if the `Chromosome` is rejected as a duplicate returns False, else True
         """
-        return self.chromosomes.insert(index, chromosome)
+        previous = self.chromosomes[index]
+        self.untrack(previous)
+        if not self.track(chromosome):
+            self.track(previous, True)
+            return False
+        self.chromosomes[index] = chromosome
+        return True
 
     def remove(self, chromosome: Chromosome) -> bool:
         """
@@ -90,6 +274,7 @@ class Population:
         """
         if self.contains(chromosome):
             self.chromosomes.remove(chromosome)
+            self.untrack(chromosome)
             return True
         return False
 
@@ -100,6 +285,7 @@ class Population:
         :return: bool, if `Chromosome` does not exist returns False, else True
         """
         if index <= self.len():
+            self.untrack(self.chromosomes[index])
             self.chromosomes.remove(self.chromosomes[index])
             return True
         return False
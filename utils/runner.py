@@ -0,0 +1,260 @@
+"""
+Command line entry point to solve one or many instances, e.g.:
+
+    python -m utils.runner solve data/input/p01 --generations 100 --seed 0
+    python -m utils.runner batch 'data/input/p*' --seeds 0 1 2 --jobs 4 --output summary.csv
+"""
+from utils.distance import DistanceMatrix
+from utils.population import Population, DUPLICATES
+from utils.shared import SharedProblem
+import utils.io as IO
+import utils.functional as F
+import utils.selection as S
+from utils.steady_state import SteadyState
+from utils.memo import FitnessMemo
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import glob
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+
+from typing import List
+
+FIELDS = ['instance', 'seed', 'population_size', 'generations', 'generations_run', 'granular', 'education', 'selection',
+          'steady_state', 'duplicates', 'memo', 'memo_hit_rate', 'best_cost', 'best_known_cost', 'gap', 'runtime',
+          'generations_per_second']
+
+
+def result_path_of(input_path: str, result_dir: str = None) -> str:
+    """
+    Returns the path to the 'p***.res' file of an instance, by default 'data/result/p01.res' for 'data/input/p01'
+    :param input_path: Path to 'p***' file
+    :param result_dir: The directory of the result files, if None, 'result' next to the directory of `input_path`
+    :return: A path
+    """
+    if result_dir is None:
+        result_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(input_path))), 'result')
+    return os.path.join(result_dir, os.path.basename(input_path) + '.res')
+
+
+def best_cost(population, strict: bool = False) -> float:
+    """
+    The traveled distance of the best `Chromosome` of a `Population`, preferring feasible `Chromosome`s (see
+    `Chromosome.violations`) which route all of their `Customer`s (see `Chromosome.unrouted`), as the open routes
+    are not counted in the traveled distance.
+    :param population: An instance of `Population` class
+    :param strict: If True, None is returned if no `Chromosome` is feasible and routes all `Customer`s
+    :return: A float number or None
+    """
+    complete = [ch for ch in population if ch.unrouted() == 0]
+    feasible = [ch for ch in complete if ch.feasible()]
+    if feasible.__len__() == 0 and strict:
+        return None
+    candidates = feasible if feasible.__len__() > 0 else complete if complete.__len__() > 0 else population.chromosomes
+    return min([ch.total_distance() for ch in candidates])
+
+
+def target_reached(population, best_known: float, target_gap: float) -> bool:
+    """
+    Checks whether a feasible `Chromosome` routing all `Customer`s is within `target_gap` percent of the best-known
+    cost, used to stop a run early
+    :param population: An instance of `Population` class
+    :param best_known: The best-known cost, see `io.best_known_cost`
+    :param target_gap: The gap in percent, see `io.gap`
+    :return: Bool true or false
+    """
+    cost = best_cost(population, True)
+    return cost is not None and IO.gap(cost, best_known) <= target_gap
+
+
+def solve(input_path: str, result_path: str, population_size: int = 10, generations: int = 100,
+          seed: int = None, granular: int = 0, education: int = 0, cache_dir: str = None,
+          target_gap: float = None, selection: str = None, steady_state: bool = False, duplicates: str = None,
+          memo: int = 0) -> dict:
+    """
+    Solves a single instance with the GA loop of `ga.py` and reports the traveled distance of the best `Chromosome` of
+    the last generation (see `best_cost`) against the best-known cost.
+
+    Note: The operators draw from the module level `random`, so it is seeded here and `solve` is meant to run in its
+        own (worker) process.
+
+    :param input_path: Path to 'p***' file
+    :param result_path: Path to 'p***.res' file
+    :param population_size: Size of the `Population`
+    :param generations: Number of generations
+    :param seed: The seed of the run, if None, the run is not reproducible
+    :param granular: Number of nearest neighbours the insertion positions are restricted to, 0 evaluates all
+    :param education: Maximum number of local search moves applied to each offspring, 0 disables it
+    :param cache_dir: The directory of the problem data published by `shared.SharedProblem.load` (parsed instance,
+        distance matrix and neighbour lists), so it is computed once per host, if None, it is computed for each run
+    :param target_gap: Stops early once the gap to the best-known cost in percent is at most this (see
+        `target_reached`), if None, all `generations` are run
+    :param selection: One of `selection.METHODS` to draw all parents of a generation at once, if None, `tournament`
+    :param steady_state: Whether evolve the `Population` in place with `steady_state.SteadyState`, then a generation
+        is `population_size // 2` steps (`selection` is ignored)
+    :param duplicates: 'reject' or 'penalize' duplicate solutions in the `Population` (see `Population.duplicates`),
+        if None, they are allowed
+    :param memo: Capacity of the `memo.FitnessMemo` of the run, 0 disables it
+    :return: A dict with the keys of `FIELDS`
+    """
+    random.seed(None if seed is None else int(np.random.SeedSequence(seed).generate_state(1)[0]))
+    start = time.perf_counter()
+    if cache_dir is None:
+        depots, customers = IO.single_data_loader(input_path, result_path)
+        distances = DistanceMatrix(depots + customers, depots=depots.__len__())
+    else:
+        problem = SharedProblem.load(input_path, cache_dir)
+        nodes = problem.nodes()
+        depots, customers = nodes[:problem.depot_count], nodes[problem.depot_count:]
+        distances = problem.distance_matrix()
+    sample = F.generate_chromosome_sample(depots, customers, distances=distances)
+    population = F.generate_initial_population(sample, population_size)
+    if duplicates is not None:
+        population = Population(population.id, population.chromosomes, duplicates)
+    fitness_memo = FitnessMemo(memo) if memo > 0 else None
+    population.fitness_values(memo=fitness_memo)
+    best_known = IO.best_known_cost(result_path)
+    evolution_start = time.perf_counter()
+    generations_run = 0
+    model = SteadyState(population, granular, education, memo=fitness_memo) if steady_state else None
+    while generations_run < generations and (target_gap is None or
+                                             not target_reached(population, best_known, target_gap)):
+        if model is None:
+            population = F.generate_new_population(population, granular=granular, education=education,
+                                                   selection=selection, memo=fitness_memo)
+            population.fitness_values(memo=fitness_memo)
+        else:
+            model.evolve(max(population.len() // 2, 1))
+        generations_run += 1
+    end = time.perf_counter()
+    cost = best_cost(population)
+    return {
+        'instance': os.path.basename(input_path),
+        'seed': seed,
+        'population_size': population_size,
+        'generations': generations,
+        'generations_run': generations_run,
+        'granular': granular,
+        'education': education,
+        'selection': selection,
+        'steady_state': steady_state,
+        'duplicates': duplicates,
+        'memo': memo,
+        'memo_hit_rate': fitness_memo.info()['hit_rate'] if fitness_memo is not None else 0.0,
+        'best_cost': cost,
+        'best_known_cost': best_known,
+        'gap': IO.gap(cost, best_known),
+        'runtime': end - start,
+        'generations_per_second': generations_run / (end - evolution_start) if end > evolution_start else 0.0,
+    }
+
+
+def batch(input_paths: List[str], seeds: List[int], population_size: int = 10, generations: int = 100,
+          jobs: int = None, result_dir: str = None, granular: int = 0, education: int = 0,
+          cache_dir: str = None, target_gap: float = None, selection: str = None,
+          steady_state: bool = False, duplicates: str = None, memo: int = 0) -> List[dict]:
+    """
+    Solves every instance with every seed, scheduling instance x seed jobs over a process pool
+    :param input_paths: Paths to 'p***' files
+    :param seeds: The seeds each instance is solved with
+    :param population_size: Size of the `Population`
+    :param generations: Number of generations
+    :param jobs: Number of worker processes, if None, number of CPUs
+    :param result_dir: The directory of the result files, see `result_path_of`
+    :param granular: Number of nearest neighbours the insertion positions are restricted to, 0 evaluates all
+    :param education: Maximum number of local search moves applied to each offspring, 0 disables it
+    :param cache_dir: The directory of the problem data shared by the runs, see `solve`
+    :param target_gap: Stops each run early once its gap to the best-known cost in percent is at most this
+    :param selection: One of `selection.METHODS` to draw all parents of a generation at once, if None, `tournament`
+    :param steady_state: Whether evolve each run in place with `steady_state.SteadyState`
+    :param duplicates: 'reject' or 'penalize' duplicate solutions, see `solve`
+    :param memo: Capacity of the `memo.FitnessMemo` of each run, 0 disables it
+    :return: A list of dicts returned by `solve` ordered by instance and seed
+    """
+    with ProcessPoolExecutor(jobs) as executor:
+        tasks = [executor.submit(solve, path, result_path_of(path, result_dir), population_size, generations, seed,
+                                 granular, education, cache_dir, target_gap, selection, steady_state,
+                                 duplicates, memo)
+                 for path in input_paths for seed in seeds]
+        return [task.result() for task in tasks]
+
+
+def write_summary(rows: List[dict], path: str):
+    """
+    Writes the rows returned by `batch` as JSON if `path` ends with '.json', else as CSV
+    :param rows: A list of dicts with the keys of `FIELDS`
+    :param path: The output path
+    :return: None
+    """
+    with open(path, 'w', newline='') as file:
+        if path.endswith('.json'):
+            json.dump(rows, file, indent=2)
+        else:
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m utils.runner', description='Solves MDVRP instances with the GA.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    for name, help in [('solve', 'solve a single instance'), ('batch', 'solve all instances matching a glob')]:
+        sub = subparsers.add_parser(name, help=help)
+        sub.add_argument('instances', help='path (solve) or glob (batch) of the "p***" input files')
+        sub.add_argument('--result-dir', default=None, help='directory of the "p***.res" files')
+        sub.add_argument('--population-size', type=int, default=10)
+        sub.add_argument('--generations', type=int, default=100)
+        sub.add_argument('--granular', type=int, default=0,
+                         help='restrict insertions to positions next to this many nearest neighbours, 0 for all')
+        sub.add_argument('--education', type=int, default=0,
+                         help='maximum number of local search moves applied to each offspring, 0 disables it')
+        sub.add_argument('--selection', choices=S.METHODS, default=None,
+                         help='draw all parents of a generation at once over the fitness vector')
+        sub.add_argument('--steady-state', action='store_true',
+                         help='replace the least fit chromosome in place with each offspring instead of generations')
+        sub.add_argument('--duplicates', choices=DUPLICATES, default=None,
+                         help='reject or penalize chromosomes representing the same solution as another one')
+        sub.add_argument('--memo', type=int, default=0,
+                         help='capacity of the memo of fitness values by canonical solution hash, 0 disables it')
+        sub.add_argument('--target-gap', type=float, default=None,
+                         help='stop once the gap to the best-known cost in percent is at most this')
+        sub.add_argument('--cache-dir', default=None,
+                         help='directory of the problem data computed once and shared by all runs of the host')
+        sub.add_argument('--output', default=None, help='write the summary to a .csv or .json file')
+        if name == 'solve':
+            sub.add_argument('--seed', type=int, default=None)
+        else:
+            sub.add_argument('--seeds', type=int, nargs='+', default=[0])
+            sub.add_argument('--jobs', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    if args.command == 'solve':
+        rows = batch([args.instances], [args.seed], args.population_size, args.generations, 1, args.result_dir,
+                     args.granular, args.education, args.cache_dir,
+                     args.target_gap, args.selection, args.steady_state,
+                     args.duplicates, args.memo)
+    else:
+        paths = sorted(glob.glob(args.instances))
+        if paths.__len__() == 0:
+            raise Exception('No instance matches "{}".'.format(args.instances))
+        rows = batch(paths, args.seeds, args.population_size, args.generations, args.jobs, args.result_dir,
+                     args.granular, args.education, args.cache_dir,
+                     args.target_gap, args.selection, args.steady_state,
+                     args.duplicates, args.memo)
+    if args.output is not None:
+        write_summary(rows, args.output)
+    writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+from utils.population import Population
+
+import numpy as np
+
+from typing import Iterator
+
+METHODS = ['tournament', 'rank', 'roulette']
+
+
+def tournament_indices(fitness: np.ndarray, pairs: int, rng: np.random.Generator, tournament_probability: float = 0.8,
+                       size: int = 2) -> np.ndarray:
+    """
+    Draws the parents of `pairs` offspring pairs at once the same way `functional.tournament` does, but over the
+    fitness vector of the `Population`:
+    1. Draw a random unique sample of `size` indices for each pair
+    2. With `tournament_probability` draw a second sample and take the fittest of each sample (`np.argmax` along the
+       samples, the fittest `Chromosome` has the maximum fitness), else take the first two indices of the first sample.
+
+    :param fitness: A float array with the fitness of each `Chromosome`, e.g. by `Population.fitness_values`
+    :param pairs: Number of parent pairs
+    :param rng: A `np.random.Generator`
+    :param tournament_probability: The probability of using fittest or random sample (=0.8)
+    :param size: The size of the samples, at least 2 and at most the size of the `Population`
+    :return: An int array with shape (pairs, 2) of indices into `fitness`
+    """
+    count = fitness.__len__()
+    size = min(max(size, 2), count)
+    samples = np.argsort(rng.random((2 * pairs, count)), axis=1)[:, :size]  # random unique samples per row
+    winners = np.take_along_axis(samples, np.argmax(fitness[samples], axis=1)[:, None], axis=1)[:, 0]
+    first = samples[:pairs]
+    fittest = rng.random(pairs) <= tournament_probability
+    return np.where(fittest[:, None], np.stack([winners[:pairs], winners[pairs:]], axis=1), first[:, :2])
+
+
+def rank_indices(fitness: np.ndarray, pairs: int, rng: np.random.Generator, pressure: float = 1.5) -> np.ndarray:
+    """
+    Draws the parents of `pairs` offspring pairs at once with linear ranking: the i'th fittest of n `Chromosome`s is
+    drawn with probability (pressure - (2 * pressure - 2) * i / (n - 1)) / n, only the order of the fitness values
+    matters.
+
+    :param fitness: A float array with the fitness of each `Chromosome`
+    :param pairs: Number of parent pairs
+    :param rng: A `np.random.Generator`
+    :param pressure: Expected number of draws of the fittest `Chromosome` per n draws, between 1 and 2
+    :return: An int array with shape (pairs, 2) of indices into `fitness`
+    """
+    count = fitness.__len__()
+    ranks = np.empty(count, dtype=np.float64)
+    ranks[np.argsort(-fitness, kind='stable')] = np.arange(count)
+    weights = pressure - (2 * pressure - 2) * ranks / max(count - 1, 1)
+    return rng.choice(count, size=(pairs, 2), p=weights / weights.sum())
+
+
+def roulette_indices(fitness: np.ndarray, pairs: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Draws the parents of `pairs` offspring pairs at once with probabilities proportional to the fitness, shifted so
+    the least fit `Chromosome` has a small positive weight.
+
+    :param fitness: A float array with the fitness of each `Chromosome`
+    :param pairs: Number of parent pairs
+    :param rng: A `np.random.Generator`
+    :return: An int array with shape (pairs, 2) of indices into `fitness`
+    """
+    weights = fitness - fitness.min()
+    weights += max(weights.max(), 1.0) * 1e-3
+    return rng.choice(fitness.__len__(), size=(pairs, 2), p=weights / weights.sum())
+
+
+def parent_indices(fitness: np.ndarray, pairs: int, rng: np.random.Generator, method: str = 'tournament') \
+        -> np.ndarray:
+    """
+    Draws the parents of `pairs` offspring pairs with one of `METHODS`
+    :param fitness: A float array with the fitness of each `Chromosome`
+    :param pairs: Number of parent pairs
+    :param rng: A `np.random.Generator`
+    :param method: 'tournament' (see `tournament_indices`), 'rank' or 'roulette'
+    :return: An int array with shape (pairs, 2) of indices into `fitness`
+    """
+    if method == 'tournament':
+        return tournament_indices(fitness, pairs, rng)
+    if method == 'rank':
+        return rank_indices(fitness, pairs, rng)
+    if method == 'roulette':
+        return roulette_indices(fitness, pairs, rng)
+    raise Exception('Selection "{}" is not supported, use one of {}.'.format(method, METHODS))
+
+
+def parents(population: Population, indices: np.ndarray) -> Iterator[Population]:
+    """
+    Materializes the chosen parents lazily: each pair is cloned only when it is consumed, same as the result of
+    `functional.tournament`
+    :param population: An instance of `Population` class
+    :param indices: An int array with shape (pairs, 2), e.g. by `parent_indices`
+    :return: An iterator of `Population`s with two cloned `Chromosome`s
+    """
+    for first, second in indices.tolist():
+        yield Population(0, [population[first].clone(), population[second].clone()])
@@ -0,0 +1,163 @@
+from utils.customer import Customer
+from utils.depot import Depot
+from utils.distance import DistanceMatrix
+from utils.spatial import SpatialIndex
+import utils.io as IO
+
+import json
+import os
+import numpy as np
+
+from typing import List
+
+
+def publish(arrays: dict, path: str) -> list:
+    """
+    Writes packed arrays one after another into a single file so other processes can map it instead of receiving the
+    arrays pickled.
+
+    :param arrays: A dict of NumPy arrays, e.g. created by `encoding.pack`
+    :param path: The file to write
+    :return: The layout of the file, a list of (name, dtype, shape, offset) tuples used by `attach`
+    """
+    layout = []
+    offset = 0
+    for name, array in arrays.items():
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += array.nbytes
+    with open(path, 'wb') as file:
+        for array in arrays.values():
+            file.write(np.ascontiguousarray(array).tobytes())
+    return layout
+
+
+def attach(path: str, layout: list, copy: bool = True) -> dict:
+    """
+    Inverse of `publish`, maps the file and copies the arrays out of it
+    :param path: The file written by `publish`
+    :param layout: The layout returned by `publish`
+    :param copy: If False, the arrays are read-only views of the mapped file instead of copies
+    :return: A dict of NumPy arrays
+    """
+    if os.path.getsize(path) == 0:
+        return {name: np.empty(shape, dtype=dtype) for name, dtype, shape, _ in layout}
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+              for name, dtype, shape, offset in layout}
+    if copy:
+        arrays = {name: array.copy() for name, array in arrays.items()}
+        del buffer
+    return arrays
+
+
+class SharedProblem:
+    """
+    The problem data of an instance (nodes, limits, distance matrix and the tables of the `SpatialIndex`) published
+    once to a memory-mapped file, so any process can attach to it by its path without unpickling or recomputing
+    anything: the arrays are read-only views of the mapped file, which the OS shares between all processes of a host.
+    The layout is stored next to the file as '<path>.json', which is written last, so an existing layout means a
+    complete file.
+    """
+
+    def __init__(self, path: str):
+        """
+        Attaches to a published problem, see `publish` and `load`
+        :param path: The path of the file written by `publish`
+        """
+        if not os.path.exists(path + '.json'):
+            raise Exception('{} has not been published.'.format(path))
+        with open(path + '.json') as file:
+            layout = [(name, dtype, tuple(shape), offset) for name, dtype, shape, offset in json.load(file)]
+        self.path = path
+        self.arrays = attach(path, layout, copy=False)
+        self.depot_count = int(self.arrays['limits'].shape[0])
+
+    @classmethod
+    def publish(cls, nodes: List, distances: DistanceMatrix, path: str) -> 'SharedProblem':
+        """
+        Writes the problem data to `path` and attaches to it
+        :param nodes: The list of `Depot`s and `Customer`s used to build the `DistanceMatrix`, `Depot`s first
+        :param distances: The `DistanceMatrix` of the problem, built with a `SpatialIndex` (`depots=`)
+        :param path: The file to write
+        :return: A `SharedProblem`
+        """
+        if distances.spatial is None:
+            raise Exception('The "DistanceMatrix" has no "SpatialIndex", build it with "depots=".')
+        depots = nodes[:distances.spatial.depots]
+        arrays = {
+            'ids': np.array([node.id for node in nodes], dtype=np.int64),
+            'coordinates': distances.coordinates,
+            'demands': distances.demands,
+            'services': distances.services,
+            'limits': np.array([[d.capacity, d.max_duration, d.max_vehicles] for d in depots],
+                               dtype=np.float64).reshape(-1, 3),
+            'matrix': np.asarray(distances.matrix),
+            'depot_order': np.array(distances.spatial.depot_order, dtype=np.int64).reshape(nodes.__len__(), -1),
+            'neighbours': np.array(distances.spatial.neighbours, dtype=np.int64).reshape(nodes.__len__(), -1),
+        }
+        # processes publishing the same problem at once write their own temporary files
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        layout = publish(arrays, temporary)
+        os.replace(temporary, path)
+        with open(temporary, 'w') as file:
+            json.dump(layout, file)
+        os.replace(temporary, path + '.json')
+        return cls(path)
+
+    @classmethod
+    def load(cls, input_path: str, directory: str, neighbour_count: int = 16) -> 'SharedProblem':
+        """
+        Attaches to the published problem of an input file, parsing and publishing it first if no process of the host
+        has done so yet. The file is named after the SHA-1 hash of the input file, so changed inputs are published
+        again.
+        :param input_path: Path to 'p***' file
+        :param directory: The directory of the published problems
+        :param neighbour_count: Number of nearest `Customer`s kept per node by the `SpatialIndex`
+        :return: A `SharedProblem`
+        """
+        digest = ''.join(['{:02x}'.format(b) for b in IO.file_hash(input_path)[:8]])
+        path = os.path.join(directory, '{}-{}-{}.problem'.format(os.path.basename(input_path), digest,
+                                                                neighbour_count))
+        if os.path.exists(path + '.json'):
+            return cls(path)
+        os.makedirs(directory, exist_ok=True)
+        arrays = IO.load_instance(input_path, cache=False)
+        depots, customers = IO.instance_nodes(arrays)
+        distances = DistanceMatrix(depots + customers, depots=depots.__len__(), neighbour_count=neighbour_count)
+        return cls.publish(depots + customers, distances, path)
+
+    def nodes(self) -> List:
+        """
+        Builds the `Depot`s and `Customer`s of the problem with their `node_index` assigned
+        :return: A list of `Depot`s and `Customer`s, `Depot`s first
+        """
+        ids = self.arrays['ids'].tolist()
+        coordinates = self.arrays['coordinates'].tolist()
+        nodes = [Depot(ids[i], coordinates[i][0], coordinates[i][1], capacity, max_duration=duration,
+                       max_vehicles=int(vehicles))
+                 for i, (capacity, duration, vehicles) in enumerate(self.arrays['limits'].tolist())]
+        nodes += [Customer(ids[i], coordinates[i][0], coordinates[i][1], demand, False, service=service)
+                  for i, demand, service in zip(range(self.depot_count, ids.__len__()),
+                                                self.arrays['demands'][self.depot_count:].tolist(),
+                                                self.arrays['services'][self.depot_count:].tolist())]
+        for i, node in enumerate(nodes):
+            node.node_index = i
+        return nodes
+
+    def distance_matrix(self, rows: bool = True) -> DistanceMatrix:
+        """
+        Builds the `DistanceMatrix` of the problem over the mapped arrays without recomputing them
+        :param rows: Whether build the nested list copy of the matrix for fast scalar lookups (see `DistanceMatrix`),
+            if False, scalar lookups index the mapped matrix
+        :return: A `DistanceMatrix`
+        """
+        spatial = SpatialIndex.from_tables(self.arrays['coordinates'], self.depot_count,
+                                           self.arrays['depot_order'].tolist(), self.arrays['neighbours'].tolist())
+        return DistanceMatrix.from_arrays(self.arrays['matrix'], self.arrays['coordinates'], self.arrays['demands'],
+                                          self.arrays['services'], spatial, rows)
+
+    def __reduce__(self):
+        """
+        Pickles as the path only, so sending a `SharedProblem` to a process attaches it there
+        """
+        return SharedProblem, (self.path,)
@@ -0,0 +1,139 @@
+import numpy as np
+
+from typing import List
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # queries fall back to brute force over the coordinates
+    cKDTree = None
+
+
+class SpatialIndex:
+    """
+    A spatial index over the `Depot`s and `Customer`s of a problem instance, built once per instance to answer
+    nearest-depot, k-nearest-depots and k-nearest-customers queries in bulk with KD-trees.
+    Nodes are identified by their `node_index` in the `DistanceMatrix` (`Depot`s first, then `Customer`s).
+
+    Per-node tables for the scalar lookups of the operators are precomputed as nested lists:
+    `depot_order[node_index]` holds the `node_index` of all `Depot`s from the nearest to the farthest and
+    `neighbours[node_index]` holds the `node_index` of the `neighbour_count` nearest `Customer`s.
+    """
+
+    def __init__(self, coordinates: np.ndarray, depots: int, matrix: np.ndarray = None, neighbour_count: int = 16):
+        """
+        :param coordinates: An array of (x, y) coordinates of all nodes ordered by `node_index`
+        :param depots: Number of `Depot`s, i.e. the first `depots` rows of `coordinates`
+        :param matrix: The distance matrix of the nodes, if given, `depot_order` ties are broken the same way as
+            `np.argmin` over the distances does
+        :param neighbour_count: Number of nearest `Customer`s kept per node in `neighbours`
+        """
+        self.coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self.depots = depots
+        self.customers = self.coordinates.__len__() - depots
+        self.depot_tree = cKDTree(self.coordinates[:depots]) if cKDTree is not None else None
+        self.customer_tree = cKDTree(self.coordinates[depots:]) if cKDTree is not None and self.customers > 0 \
+            else None
+        if matrix is not None:
+            order = np.argsort(np.asarray(matrix[:, :depots]), axis=1, kind='stable')
+        else:
+            order = self.k_nearest_depots(self.coordinates, depots)
+        self.depot_order = order.tolist()
+        self.neighbour_count = min(neighbour_count, max(self.customers - 1, 0))
+        self.neighbours = self.nearest_customers_of_nodes(self.neighbour_count).tolist()
+
+    @classmethod
+    def from_tables(cls, coordinates: np.ndarray, depots: int, depot_order: List[List[int]],
+                    neighbours: List[List[int]]) -> 'SpatialIndex':
+        """
+        Rebuilds a `SpatialIndex` from precomputed `depot_order` and `neighbours` tables (e.g. of a
+        `shared.SharedProblem`), only the KD-trees are built again
+        :param coordinates: An array of (x, y) coordinates of all nodes ordered by `node_index`
+        :param depots: Number of `Depot`s, i.e. the first `depots` rows of `coordinates`
+        :param depot_order: The `depot_order` table
+        :param neighbours: The `neighbours` table
+        :return: A `SpatialIndex`
+        """
+        spatial = cls.__new__(cls)
+        spatial.coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        spatial.depots = depots
+        spatial.customers = spatial.coordinates.__len__() - depots
+        spatial.depot_tree = cKDTree(spatial.coordinates[:depots]) if cKDTree is not None else None
+        spatial.customer_tree = cKDTree(spatial.coordinates[depots:]) if cKDTree is not None and \
+            spatial.customers > 0 else None
+        spatial.depot_order = depot_order
+        spatial.neighbour_count = neighbours[0].__len__() if neighbours.__len__() > 0 else 0
+        spatial.neighbours = neighbours
+        return spatial
+
+    def points(self, nodes) -> np.ndarray:
+        """
+        Converts the query argument to an array of coordinates
+        :param nodes: A list of `Customer`s or `Depot`s or an array of (x, y) coordinates
+        :return: An array with shape (n, 2)
+        """
+        if isinstance(nodes, np.ndarray):
+            return nodes.reshape(-1, 2).astype(np.float64)
+        return np.array([[node.x, node.y] for node in nodes], dtype=np.float64).reshape(-1, 2)
+
+    def query(self, tree, offset: int, count: int, points: np.ndarray, k: int) -> np.ndarray:
+        """
+        Returns the `node_index` of the `k` nearest nodes among `count` nodes starting at `offset` for each point
+        """
+        k = min(k, count)
+        if k == 0 or points.__len__() == 0:
+            return np.empty((points.__len__(), k), dtype=np.int64)
+        if tree is not None:
+            _, indices = tree.query(points, k=k)
+            return np.asarray(indices, dtype=np.int64).reshape(-1, k) + offset
+        candidates = self.coordinates[offset: offset + count]
+        difference = points[:, None, :] - candidates[None, :, :]
+        distances = np.sqrt((difference * difference).sum(axis=2))
+        return np.argsort(distances, axis=1, kind='stable')[:, :k] + offset
+
+    def nearest_depot(self, nodes) -> np.ndarray:
+        """
+        Finds the nearest `Depot` of each node
+        :param nodes: A list of `Customer`s or `Depot`s or an array of (x, y) coordinates
+        :return: An int array with the `node_index` (= position in the list of `Depot`s) of the nearest `Depot`s
+        """
+        return self.k_nearest_depots(nodes, 1)[:, 0]
+
+    def k_nearest_depots(self, nodes, k: int) -> np.ndarray:
+        """
+        Finds the `k` nearest `Depot`s of each node
+        :param nodes: A list of `Customer`s or `Depot`s or an array of (x, y) coordinates
+        :param k: Number of `Depot`s
+        :return: An int array with shape (n, k) of `Depot` `node_index`s from the nearest to the farthest
+        """
+        return self.query(self.depot_tree, 0, self.depots, self.points(nodes), k)
+
+    def k_nearest_customers(self, nodes, k: int) -> np.ndarray:
+        """
+        Finds the `k` nearest `Customer`s of each node
+        :param nodes: A list of `Customer`s or `Depot`s or an array of (x, y) coordinates
+        :param k: Number of `Customer`s
+        :return: An int array with shape (n, k) of `Customer` `node_index`s from the nearest to the farthest
+        """
+        return self.query(self.customer_tree, self.depots, self.customers, self.points(nodes), k)
+
+    def nearest_customers_of_nodes(self, k: int) -> np.ndarray:
+        """
+        Finds the `k` nearest other `Customer`s of every node of the instance
+        :param k: Number of `Customer`s
+        :return: An int array with shape (nodes, k) of `Customer` `node_index`s
+        """
+        nearest = self.k_nearest_customers(self.coordinates, k + 1)
+        result = np.empty((nearest.__len__(), k), dtype=np.int64)
+        for node in range(nearest.__len__()):
+            row = nearest[node][nearest[node] != node]
+            result[node] = row[:k]
+        return result
+
+    def candidate_depots(self, node_index: int, k: int = 1) -> List[int]:
+        """
+        The `node_index` of the `k` nearest `Depot`s of a node
+        :param node_index: The `node_index` of a `Customer` or `Depot`
+        :param k: Number of `Depot`s
+        :return: A list of int numbers
+        """
+        return self.depot_order[node_index][:k]
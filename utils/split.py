@@ -0,0 +1,108 @@
+from utils.customer import Customer
+from utils.depot import Depot
+from utils.distance import DistanceMatrix
+from utils import encoding as E
+
+import numpy as np
+
+
+
+def split(tour: np.ndarray, depot: int, distances: DistanceMatrix, capacity: float,
+          max_duration: float = None) -> np.ndarray:
+    """
+    Splits a giant tour of a `Depot` into routes optimally (Prins' Split).
+    The tour is a path of a DAG where the arc i -> j is the route serving `tour[i: j]`, its cost is computed in O(1)
+    from prefix sums of loads and leg distances. The shortest path is found in a single forward pass where the arcs
+    leaving a node are relaxed at once with NumPy. Loads are non-negative, so the arcs leaving a node stop at the first
+    route exceeding `capacity`, which bounds each pass by the size of the largest feasible route, i.e. O(n * B).
+    Note: A `Customer` whose demand or duration alone exceeds the limits is served by a route of its own.
+
+    :param tour: `node_index` of the `Customer`s of the `Depot` in visiting order
+    :param depot: `node_index` of the `Depot`
+    :param distances: The `DistanceMatrix` of the problem, its `demands` and `services` are the loads and the service
+        durations of the nodes
+    :param capacity: The maximum load of a route
+    :param max_duration: The maximum duration (length plus service durations) of a route, if None or 0, not
+        constrained
+    :return: An int array with the end (exclusive) of each route in `tour`
+    """
+    tour = np.asarray(tour, dtype=np.int64)
+    n = tour.__len__()
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    loads = np.concatenate([[0.0], np.cumsum(distances.demands[tour])])
+    services = np.concatenate([[0.0], np.cumsum(distances.services[tour])])
+    legs = np.concatenate([[0.0], np.cumsum(distances[tour[:-1], tour[1:]])])
+    from_depot = distances[depot, tour]
+    to_depot = distances[tour, depot]
+
+    labels = np.full(n + 1, np.inf)
+    labels[0] = 0.0
+    predecessors = np.zeros(n + 1, dtype=np.int64)
+    for i in range(n):
+        last = max(int(np.searchsorted(loads, loads[i] + capacity, side='right')) - 1, i + 1)
+        ends = np.arange(i + 1, last + 1)
+        costs = from_depot[i] + legs[ends - 1] - legs[i] + to_depot[ends - 1]
+        if max_duration is not None and max_duration > 0:
+            feasible = costs + services[ends] - services[i] <= max_duration
+            feasible[0] = True
+            ends, costs = ends[feasible], costs[feasible]
+        costs += labels[i]
+        better = costs < labels[ends]
+        labels[ends[better]] = costs[better]
+        predecessors[ends[better]] = i
+
+    breaks = []
+    j = n
+    while j > 0:
+        breaks.append(j)
+        j = predecessors[j]
+    return np.array(breaks[::-1], dtype=np.int64)
+
+
+def split_routing(depot: Depot, distances: DistanceMatrix, max_duration: float = None) -> None:
+    """
+    Replaces the routes of a `Depot` by the optimal routes of its `Customer`s in their current order (see `split`).
+    It can be used instead of `initial_routing` which cuts routes greedily.
+    :param depot: An instance of `Depot` class whose nodes have been indexed by `distances`
+    :param distances: The `DistanceMatrix` of the problem
+    :param max_duration: The maximum duration of a route, if None, the `max_duration` of the `Depot`
+    :return: None
+    """
+    if max_duration is None:
+        max_duration = depot.max_duration
+    customers = [c for c in depot if not c.null]
+    breaks = split(np.array([c.node_index for c in customers], dtype=np.int64), depot.node_index, distances,
+                   depot.capacity, max_duration)
+    routed = []
+    start = 0
+    for end in breaks:
+        routed.extend(customers[start: end])
+        routed.append(Customer(999, depot.x, depot.y, 0, True, depot.node_index))
+        start = end
+    depot.own()
+    depot.depot_customers = routed
+    depot.reindex()
+
+
+def split_encoded(encoded: E.EncodedChromosome, distances: DistanceMatrix,
+                  max_duration: float = None) -> E.EncodedChromosome:
+    """
+    Splits the giant tour of each `Depot` of an `EncodedChromosome` into optimal routes, so the GA can work on
+    separator-free permutations and decode them with one pass per `Depot`.
+    :param encoded: An `EncodedChromosome`, its current routes are ignored
+    :param distances: The `DistanceMatrix` the chromosome has been encoded against
+    :param max_duration: The maximum duration (length plus service durations) of a route, if None, not constrained
+    :return: A new `EncodedChromosome` with the same giant tours and all routes closed
+    """
+    route_offsets = [np.zeros(1, dtype=np.int64)]
+    depot_offsets = [0]
+    for k, depot in enumerate(encoded.depots):
+        start = encoded.route_offsets[encoded.depot_offsets[k]]
+        end = encoded.route_offsets[encoded.depot_offsets[k + 1]]
+        breaks = split(encoded.tour[start: end], depot, distances, encoded.capacity, max_duration)
+        route_offsets.append(breaks + start)
+        depot_offsets.append(depot_offsets[-1] + breaks.__len__())
+    return E.EncodedChromosome(encoded.id, encoded.capacity, encoded.fitness, encoded.tour.copy(),
+                               np.concatenate(route_offsets), depot_offsets, encoded.depots.copy())
+
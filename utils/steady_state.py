@@ -0,0 +1,139 @@
+from utils.population import Population
+from utils import functional as F
+from utils import local_search as LS
+
+import heapq
+import random
+import numpy as np
+
+
+class SteadyState:
+    """
+    Steady-state evolution of a `Population`: instead of building a new `Population` each generation, every `step`
+    crosses over one pair of parents and each offspring replaces the least fit `Chromosome` in place if it is fitter.
+    The `Population` is a preallocated buffer of fixed size, its fitness values are kept in a float array and the
+    least fit `Chromosome` is found by a min-heap of (fitness, index) over it, so a replacement costs O(log n).
+    Note: The fittest `Chromosome` is never replaced, since only the least fit is.
+    Note: Offspring are checked against `Population.duplicates` on replacement, a penalized duplicate enters the fitness
+        array with `Population.duplicate_penalty` added.
+    """
+
+    def __init__(self, population: Population, granular: int = 0, education: int = 0,
+                 tournament_probability: float = 0.8, memo=None):
+        """
+        :param population: An initialized instance of `Population`, evolved in place
+        :param granular: Number of nearest neighbours `cross_over` restricts the insertion positions to, 0 evaluates
+            all
+        :param education: Maximum number of `local_search.educate` moves applied to each offspring, 0 disables it
+        :param tournament_probability: The probability of choosing each parent as the fitter of two random
+            `Chromosome`s instead of a random one (=0.8)
+        :param memo: An optional `memo.FitnessMemo` looked up by canonical hash before scoring an offspring
+        """
+        self.population = population
+        self.granular = granular
+        self.education = education
+        self.tournament_probability = tournament_probability
+        self.memo = memo
+        self.fitness = population.fitness_values(memo=memo)
+        self.heap = [(fitness, i) for i, fitness in enumerate(self.fitness.tolist())]
+        heapq.heapify(self.heap)
+        self.steps = 0
+        self.replacements = 0
+
+    def worst(self) -> int:
+        """
+        The index of the least fit `Chromosome` of the `Population`
+        :return: An int number
+        """
+        return self.heap[0][1]
+
+    def fittest(self) -> int:
+        """
+        The index of the fittest `Chromosome` of the `Population`
+        :return: An int number
+        """
+        return int(np.argmax(self.fitness))
+
+    def parent(self) -> int:
+        """
+        Chooses a parent by a binary tournament over the fitness array, same as `functional.tournament` with samples
+        of two `Chromosome`s
+        :return: The index of the parent in the `Population`
+        """
+        count = self.population.len()
+        first = random.randrange(count)
+        if count < 2 or random.random() > self.tournament_probability:
+            return first
+        second = random.randrange(count - 1)
+        second += second >= first  # a different `Chromosome` than `first`
+        return first if self.fitness[first] >= self.fitness[second] else second
+
+    def evaluate(self, chromosome, key: bytes = None) -> float:
+        """
+        Scores an offspring, looking it up in `memo` first if there is one
+        :param chromosome: A `Chromosome` class instance
+        :param key: The canonical hash of `chromosome` (see `Population.canonical_hash`), or None
+        :return: A float number
+        """
+        if self.memo is None or key is None:
+            return chromosome.fitness_value()
+        weight = [100, 0.001]
+        memo_key = self.memo.key(key, weight)
+        fitness = self.memo.get(memo_key)
+        if fitness is None:
+            fitness = chromosome.fitness_value(weight)
+            self.memo.put(memo_key, fitness)
+        else:
+            chromosome.cache_fitness(fitness, weight)
+        return fitness
+
+    def replace(self, chromosome) -> bool:
+        """
+        Replaces the least fit `Chromosome` of the `Population` with `chromosome` if it is fitter
+        :param chromosome: A `Chromosome` class instance
+        :return: Bool true if it was replaced, else false
+        """
+        key = None
+        if self.memo is not None or self.population.duplicates is not None:
+            key = self.population.canonical_hash(chromosome)
+        fitness = self.evaluate(chromosome, key)
+        duplicate = self.population.duplicates is not None and self.population.is_duplicate(chromosome, key)
+        if duplicate and self.population.duplicates == 'reject':
+            return False
+        if duplicate:
+            fitness += self.population.duplicate_penalty
+        worst_fitness, index = self.heap[0]
+        if fitness <= worst_fitness or not self.population.replace_at(index, chromosome):
+            return False
+        self.fitness[index] = fitness
+        heapq.heapreplace(self.heap, (fitness, index))
+        self.replacements += 1
+        return True
+
+    def step(self) -> int:
+        """
+        Crosses over two parents chosen by `parent` and offers both offspring to `replace`
+        :return: Number of replaced `Chromosome`s, 0, 1 or 2
+        """
+        first = self.parent()
+        second = self.parent()
+        parents = Population(0, [self.population[first].clone(), self.population[second].clone()])
+        offspring, _, _ = F.cross_over(parents, self.granular)
+        replaced = 0
+        for ch in offspring:
+            if self.education > 0 and ch.distances is not None:
+                LS.educate(ch, self.education)
+            replaced += self.replace(ch)
+        self.steps += 1
+        return replaced
+
+    def evolve(self, steps: int) -> Population:
+        """
+        Runs a number of `step`s, `Population.len() // 2` of them produce as many offspring as one generation of
+        `functional.generate_new_population`
+        :param steps: Number of steps
+        :return: The evolved `Population`, the same instance as `population`
+        """
+        for _ in range(steps):
+            self.step()
+        return self.population